@@ -1,8 +1,52 @@
-from flask import Flask, render_template, request, abort
+import os
+import time
+
+from flask import (Flask, render_template, request, abort, jsonify, url_for,
+                   g)
+from decryptoquote import metrics
 from decryptoquote.decryptoquote import decrypt_quote, decrypt_quote_fully
+from decryptoquote.jobs import JobManager, QueueFullError
 
 app = Flask(__name__)
 
+# seconds from submitting a solve until its best partial solution is
+# returned; keep this below the gunicorn worker timeout
+SOLVE_TIMEOUT = float(os.environ.get('SOLVE_TIMEOUT', 20))
+# number of solves run at once, and maximum number waiting or running
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 16))
+# seconds to keep finished jobs' results
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION', 600))
+# seconds clients are asked to wait when the job queue is full
+RETRY_AFTER = 5
+# form and query values that turn a flag off
+FALSE_STRINGS = ('', '0', 'false', 'off', 'no')
+
+job_manager = JobManager(workers=JOB_WORKERS,
+                         max_queue=JOB_QUEUE_SIZE,
+                         timeout=SOLVE_TIMEOUT,
+                         retention=JOB_RETENTION,
+                         listener=metrics.observe_job)
+metrics.install()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+
+@app.after_request
+def observe_request_time(response):
+    metrics.observe_request(
+        request.endpoint, time.perf_counter() - g.request_start_time)
+    return response
+
+
+@app.route("/metrics", methods=['GET'])
+def get_metrics():
+    body, content_type = metrics.render()
+    return body, 200, {'Content-Type': content_type}
+
 
 @app.route("/", methods=['GET'])
 def get_index():
@@ -15,21 +59,72 @@ def get_index():
 @app.route("/solution", methods=['GET'])
 def get_solution():
     coded_quote = request.args.get('codedQuote')
-    coded_author = request.args.get('codedAuthor')
-    full_solve = request.args.get('fullSolve')
-    show_cypher = request.args.get('showCypher') is not None
     if not coded_quote:
         if coded_quote == "":
             return render_index(form_data_invalid=True), 400
         abort(400)
-    if full_solve:
-        solutions = decrypt_quote_fully(
-            coded_quote, coded_author=coded_author, show_cypher=show_cypher)
-    else:
-        solutions = decrypt_quote(
-            coded_quote, coded_author=coded_author, show_cypher=show_cypher)
-        # TODO template needs loading indicator
-    return render_index(solutions=solutions), 200
+    try:
+        job = submit_job(request.args)
+    except QueueFullError:
+        return render_index(server_busy=True), 429, retry_after()
+    # the job's deadline ends the solve, so this does not wait much longer
+    job.wait(SOLVE_TIMEOUT + 1)
+    if job.solutions is None:
+        abort(500)
+    # TODO template needs loading indicator
+    return render_index(solutions=job.solutions), 200
+
+
+# form or JSON data: same fields as /solution
+@app.route("/jobs", methods=['POST'])
+def post_job():
+    data = request.get_json(silent=True) or request.form
+    if not data.get('codedQuote'):
+        return jsonify(error="codedQuote is required"), 400
+    try:
+        job = submit_job(data)
+    except QueueFullError as error:
+        return jsonify(error=str(error)), 429, retry_after()
+    location = url_for('get_job', job_id=job.id)
+    return jsonify(job.as_dict()), 202, {'Location': location}
+
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify(error="No such job"), 404
+    return jsonify(job.as_dict()), 200
+
+
+@app.route("/jobs/<job_id>", methods=['DELETE'])
+def delete_job(job_id):
+    if job_manager.get(job_id) is None:
+        return jsonify(error="No such job"), 404
+    job_manager.cancel(job_id)
+    return jsonify(job_manager.get(job_id).as_dict()), 202
+
+
+def submit_job(data):
+    solve = decrypt_quote_fully if parse_flag(data.get('fullSolve')) \
+        else decrypt_quote
+    return job_manager.submit(
+        solve,
+        data.get('codedQuote'),
+        coded_author=data.get('codedAuthor'),
+        show_cypher=parse_flag(data.get('showCypher')))
+
+
+def parse_flag(value):
+    # JSON gives booleans; form and query values are strings, such as "on"
+    # from a checkbox
+    if isinstance(value, str):
+        return value.strip().lower() not in FALSE_STRINGS
+    return bool(value)
+
+
+def retry_after():
+    return {'Retry-After': str(RETRY_AFTER)}
 
 
 @app.errorhandler(400)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for :class:`CypherLetterMap` backtracking, showing that undoing a
+word costs the same no matter how many words are already in the mapping.
+
+Usage, with the package installed (e.g. ``pip install -e .``)::
+
+    python benchmarks/bench_cypherlettermap.py [--repeat N]
+"""
+import argparse
+import timeit
+
+from decryptoquote.constants import LETTERS
+from decryptoquote.cypherlettermap import CypherLetterMap
+
+KEY: str = "QWERTYUIOPASDFGHJKLZXCVBNM"
+DEPTHS = (1, 5, 10, 20, 40, 80)
+TOP_WORD_LENGTH: int = 5
+
+
+def encode(decoded_word: str) -> str:
+    return decoded_word.translate(str.maketrans(KEY, LETTERS))
+
+
+def build_map(depth: int) -> CypherLetterMap:
+    """
+    Builds a mapping holding `depth` consistent words of 3 letters each. The
+    words never use the last letters of the key, so that the word added on
+    top always matches new letters.
+    """
+    cypher_letter_map = CypherLetterMap()
+    letter_count = len(KEY) - TOP_WORD_LENGTH
+    for i in range(depth):
+        decoded_word = "".join(
+            KEY[(i + j) % letter_count] for j in range(3))
+        cypher_letter_map.add_word_to_mapping(encode(decoded_word),
+                                              decoded_word)
+    return cypher_letter_map
+
+
+def time_backtrack(depth: int, repeat: int) -> float:
+    """
+    Times adding and then undoing one word on top of `depth` words.
+
+    :return: best mean time per add/undo pair, in seconds
+    """
+    cypher_letter_map = build_map(depth)
+    decoded_word = KEY[-TOP_WORD_LENGTH:]
+    coded_word = encode(decoded_word)
+
+    def backtrack():
+        cypher_letter_map.add_word_to_mapping(coded_word, decoded_word)
+        cypher_letter_map.remove_last_word_from_mapping()
+
+    timer = timeit.Timer(backtrack)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'depth':>6} {'add + undo (us)':>16}")
+    for depth in DEPTHS:
+        print(f"{depth:>6} {time_backtrack(depth, args.repeat) * 1e6:>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
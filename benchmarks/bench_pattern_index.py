@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for pattern lookups through :class:`WordPatterns`, comparing direct
+collection queries with the shared in-memory :class:`PatternIndex`, and
+loading the index from the collection with opening a compiled index file.
+
+The collection is an in-process `mongomock` collection, so the query timings
+do not include any network round trip; lookups against a real MongoDB server
+are slower still.
+
+Usage, with the package installed (e.g. ``pip install -e .``)::
+
+    python benchmarks/bench_pattern_index.py [--repeat N]
+"""
+import argparse
+import os
+import tempfile
+import timeit
+
+import mongomock
+
+from decryptoquote.indexfile import MappedPatternIndex
+from decryptoquote.patternindex import invalidate_shared_index
+from decryptoquote.wordpatterns import WordPatterns
+
+CORPUS_FILE_PATH = os.path.join(
+    os.path.dirname(__file__), os.pardir, 'decryptoquote',
+    'words_alpha_apos.txt')
+INDEX_KEY = ('benchmark', 'pattern_index')
+CODED_QUOTE_WORDS = ["JRR", "FSAAGFFZSR", "HGBHRG", "VGL", "JLM", "CBVGL",
+                     "JQG", "UDI", "MQGJVGQF", "EKGN", "DVJIDLG", "CKJE",
+                     "EKGDQ", "ZSESQG", "ABSRM", "UG", "DMGJR", "DL", "GYGQN",
+                     "QGFHGAE", "EKGL", "CBQW", "MJN", "EBCJQM", "MDFEJLE",
+                     "YDFDBL", "IBJR", "BQ", "HSQHBFG", ",", "."]
+
+
+def time_lookups(word_patterns: WordPatterns, repeat: int) -> float:
+    """
+    Times lookups for every word in the sample quote.
+
+    :return: best mean time per lookup, in seconds
+    """
+    def lookups():
+        for coded_word in CODED_QUOTE_WORDS:
+            word_patterns.code_word_to_match_words(coded_word)
+
+    timer = timeit.Timer(lookups)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / (number * len(CODED_QUOTE_WORDS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    collection = mongomock.MongoClient().db.wordpatterns
+    direct = WordPatterns(collection, True, CORPUS_FILE_PATH)
+    invalidate_shared_index(INDEX_KEY)
+    indexed = WordPatterns(collection, index_key=INDEX_KEY)
+    indexed.pattern_index  # load before timing
+
+    direct_time = time_lookups(direct, args.repeat)
+    indexed_time = time_lookups(indexed, args.repeat)
+    print(f"collection queries: {direct_time * 1e6:10.2f} us/lookup")
+    print(f"pattern index:      {indexed_time * 1e6:10.2f} us/lookup")
+    print(f"speedup:            {direct_time / indexed_time:10.0f}x")
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_file = os.path.join(directory, 'words.idx')
+        WordPatterns.compile_index_file(CORPUS_FILE_PATH, index_file)
+        load_timer = timeit.Timer(lambda: indexed._load_pattern_index(0))
+        open_timer = timeit.Timer(lambda: MappedPatternIndex(index_file))
+        load_time = min(load_timer.repeat(repeat=args.repeat, number=1))
+        open_time = min(open_timer.repeat(repeat=args.repeat, number=1))
+        mapped = WordPatterns(collection, index_key=INDEX_KEY + ('file',),
+                              index_file=index_file)
+        mapped.pattern_index  # open before timing
+        mapped_time = time_lookups(mapped, args.repeat)
+    print(f"load from collection: {load_time * 1e3:8.2f} ms")
+    print(f"open index file:      {open_time * 1e3:8.2f} ms")
+    print(f"index file lookups:   {mapped_time * 1e6:8.2f} us/lookup")
+
+
+if __name__ == '__main__':
+    main()
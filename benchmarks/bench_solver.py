@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark suite for the solver, over the puzzle corpus in `puzzles.jsonl`.
+
+Each puzzle is solved with :func:`decrypt_quote` and
+:func:`decrypt_quote_fully` against a fresh in-process `mongomock`
+database, rebuilt from the corpus file before every run, so runs do not
+depend on a MongoDB server or on each other. The solution cache is not
+used. For each puzzle and function, the suite reports the wall time of
+each run, the search counts from its :class:`SolveReport` (nodes visited,
+backtracks and candidate checks), and the number of backend round trips,
+counting each collection operation as one round trip (a real server may
+need more for large results). The pattern index is loaded before each run
+starts, unless ``--cold`` is given.
+
+The suite also times the search for each puzzle's first solution with
+candidate words in frequency rank order (the order of the corpus file, most
+common first) and in alphabetical order (standing in for an unranked word
+store, which gives words in no useful order), and reports whether each
+first solution is the intended one. These searches use an in-memory
+:class:`PatternIndex`, so their timings only cover the search itself.
+
+Each line of the corpus file is a JSON object with the puzzle's `id`,
+`coded_quote`, optional `coded_author`, `decoded_quote`, `add_words` (words
+not in the bundled corpus file, added when solving), the expected number of
+`solutions`, and its `length` and `ambiguity` classes.
+
+Results are written as JSON, and can be compared with those of an earlier
+run (for example, from another commit) with ``--baseline``.
+
+Usage, with the package installed (e.g. ``pip install -e .``)::
+
+    python benchmarks/bench_solver.py [--repeat N] [--output FILE]
+        [--baseline FILE] [--puzzle ID ...] [--max-nodes N]
+        [--ordering O] [--forward-checking] [--cold]
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+import mongomock
+
+from decryptoquote import database
+from decryptoquote import decryptoquote as main_module
+from decryptoquote.budget import SearchBudget
+from decryptoquote.cypherlettermap import CypherLetterMap
+from decryptoquote.decrypter import Decrypter
+from decryptoquote.decryptoquote import (CORPUS_FILE, PATTERN_INDEX_KEY,
+                                         SolveReport, add_solve_listener,
+                                         decrypt_quote, decrypt_quote_fully,
+                                         prepare_word_patterns,
+                                         remove_solve_listener)
+from decryptoquote.patternindex import (PatternIndex,
+                                        invalidate_shared_index,
+                                        publish_shared_index)
+from decryptoquote.wordpatterns import WordPatterns, read_corpus
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'puzzles.jsonl')
+FUNCTIONS: Dict[str, Callable[..., List[Dict[str, str]]]] = {
+    'decrypt_quote': decrypt_quote,
+    'decrypt_quote_fully': decrypt_quote_fully,
+}
+STAT_NAMES = ('nodes_visited', 'backtracks', 'candidate_checks')
+CORPUS_FILE_PATH = os.path.join(os.path.dirname(main_module.__file__),
+                                CORPUS_FILE)
+FIRST_SOLUTION_KEY = ('benchmark', 'first_solution')
+# candidate word orders compared by the first solution benchmark
+WORD_ORDERS = ('ranked', 'unranked')
+# versions of the indexes published by the first solution benchmark
+_first_solution_versions = itertools.count()
+
+
+class RoundTripCounter:
+    """
+    This class wraps a collection, counting each call to one of its
+    methods as a round trip to the backend.
+
+    :param collection: collection to wrap
+    """
+
+    # attributes that are read without contacting the backend
+    LOCAL_ATTRIBUTES = frozenset(('name', 'full_name', 'database',
+                                  'with_options'))
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.round_trips: int = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute) or name in self.LOCAL_ATTRIBUTES:
+            return attribute
+
+        def counted(*args, **kwargs):
+            self.round_trips += 1
+            return attribute(*args, **kwargs)
+        return counted
+
+
+def read_puzzles(path: str) -> List[Dict[str, Any]]:
+    """
+    Reads the puzzle corpus.
+
+    :param path: path of a JSON lines file of puzzles
+    :return: list of puzzles
+    """
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def run_puzzle(puzzle: Dict[str, Any],
+               function_name: str,
+               settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Solves a puzzle once with a fresh backend.
+
+    :return: measurements of the run
+    """
+    reports: List[SolveReport] = []
+    max_nodes = settings['max_nodes']
+    with mongomock.patch(servers=(database.MONGO_HOST,)):
+        database.close_client()  # make sure the mock client is used
+        invalidate_shared_index(PATTERN_INDEX_KEY)
+        word_patterns = prepare_word_patterns(rebuild_patterns=True)
+        if settings['cold']:
+            invalidate_shared_index(PATTERN_INDEX_KEY)
+        else:
+            word_patterns.pattern_index  # load before timing
+        counter = RoundTripCounter(database.get_collection())
+        add_solve_listener(reports.append)
+        try:
+            with mock.patch.object(main_module, 'get_collection',
+                                   return_value=counter):
+                start = time.perf_counter()
+                solutions = FUNCTIONS[function_name](
+                    puzzle['coded_quote'],
+                    puzzle.get('coded_author'),
+                    add_words=puzzle['add_words'] or None,
+                    ordering=settings['ordering'],
+                    forward_checking=settings['forward_checking'],
+                    budget=SearchBudget(max_nodes=max_nodes)
+                    if max_nodes is not None else None,
+                    use_cache=False)
+                wall_seconds = time.perf_counter() - start
+        finally:
+            remove_solve_listener(reports.append)
+            database.close_client()
+            invalidate_shared_index(PATTERN_INDEX_KEY)
+    report = reports[-1]
+    return {
+        'wall_seconds': wall_seconds,
+        **{name: getattr(report.stats, name) for name in STAT_NAMES},
+        'round_trips': counter.round_trips,
+        'solutions': len(solutions),
+        'status': report.status,
+        'found': any(x['decoded_quote'] == puzzle['decoded_quote']
+                     for x in solutions),
+    }
+
+
+def run_benchmark(puzzles: List[Dict[str, Any]],
+                  settings: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Solves every puzzle with every function, `repeat` times each.
+
+    :return: one result for each puzzle and function
+    """
+    results = []
+    for puzzle in puzzles:
+        for function_name in FUNCTIONS:
+            runs = [run_puzzle(puzzle, function_name, settings)
+                    for _ in range(settings['repeat'])]
+            # the search is deterministic, so only the times vary
+            last_run = runs[-1]
+            wall_times = [run['wall_seconds'] for run in runs]
+            results.append({
+                'puzzle': puzzle['id'],
+                'length': puzzle['length'],
+                'ambiguity': puzzle['ambiguity'],
+                'function': function_name,
+                'wall_seconds': {
+                    'min': min(wall_times),
+                    'median': statistics.median(wall_times),
+                    'runs': wall_times,
+                },
+                **{name: last_run[name] for name in STAT_NAMES},
+                'round_trips': last_run['round_trips'],
+                'solutions': last_run['solutions'],
+                'status': last_run['status'],
+                'found': last_run['found'],
+            })
+            print(format_result(results[-1]), file=sys.stderr)
+    return results
+
+
+def run_first_solution(puzzles: List[Dict[str, Any]],
+                       settings: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Times the search for each puzzle's first solution, `repeat` times each,
+    with candidate words in rank order and in alphabetical order.
+
+    :return: one result for each puzzle
+    """
+    corpus_words = [(word, WordPatterns.word_to_pattern(word))
+                    for word, _ in sorted(read_corpus(CORPUS_FILE_PATH),
+                                          key=itemgetter(1))]
+    base_words = {'ranked': corpus_words, 'unranked': sorted(corpus_words)}
+    collection = mongomock.MongoClient().db.wordpatterns
+    results = []
+    for puzzle in puzzles:
+        result: Dict[str, Any] = {
+            'puzzle': puzzle['id'],
+            'length': puzzle['length'],
+            'ambiguity': puzzle['ambiguity'],
+        }
+        added_words = [(word, WordPatterns.word_to_pattern(word))
+                       for word in map(str.upper, puzzle['add_words'])]
+        for word_order in WORD_ORDERS:
+            index_key = FIRST_SOLUTION_KEY + (word_order,)
+            # each index needs a new version, or searches would reuse the
+            # candidates of the last puzzle's index
+            published = publish_shared_index(
+                index_key,
+                PatternIndex.from_word_patterns(
+                    base_words[word_order] + added_words,
+                    next(_first_solution_versions)))
+            assert published, f"Index for {puzzle['id']} was not published"
+            word_patterns = WordPatterns(collection, index_key=index_key)
+            runs = [time_first_solution(puzzle, word_patterns, settings)
+                    for _ in range(settings['repeat'])]
+            wall_times = [wall_seconds for wall_seconds, _, _ in runs]
+            _, nodes_visited, found = runs[-1]
+            result[word_order] = {
+                'wall_seconds': {
+                    'min': min(wall_times),
+                    'median': statistics.median(wall_times),
+                    'runs': wall_times,
+                },
+                'nodes_visited': nodes_visited,
+                'found': found,
+            }
+            invalidate_shared_index(index_key)
+        results.append(result)
+        print(format_first_solution(result), file=sys.stderr)
+    return results
+
+
+def time_first_solution(puzzle: Dict[str, Any],
+                        word_patterns: WordPatterns,
+                        settings: Dict[str, Any]) -> Tuple[float, int, bool]:
+    """
+    Times one search for a puzzle's first solution.
+
+    :return: wall time in seconds, nodes visited, and whether the first
+      solution is the intended one
+    """
+    max_nodes = settings['max_nodes']
+    start = time.perf_counter()
+    decrypter = Decrypter(
+        puzzle['coded_quote'], CypherLetterMap(), word_patterns,
+        settings['ordering'], settings['forward_checking'],
+        SearchBudget(max_nodes=max_nodes) if max_nodes is not None else None)
+    key = next(decrypter.iter_solutions(1), None)
+    wall_seconds = time.perf_counter() - start
+    found = key is not None and CypherLetterMap.from_key(key).decode(
+        puzzle['coded_quote']) == puzzle['decoded_quote']
+    return wall_seconds, decrypter.stats.nodes_visited, found
+
+
+def git_commit() -> Optional[str]:
+    """
+    Gets the commit of the working tree, if it is a git repository.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_result(result: Dict[str, Any],
+                  baseline: Optional[Dict[str, Any]] = None) -> str:
+    line = (f"{result['puzzle']:<18} {result['function']:<20}"
+            f"{result['wall_seconds']['min'] * 1e3:10.2f}ms"
+            f"{result['nodes_visited']:10d} nodes"
+            f"{result['round_trips']:5d} trips"
+            f"{result['solutions']:6d} sols"
+            f"  {'found' if result['found'] else 'MISSED'}")
+    if baseline is not None:
+        time_ratio = result['wall_seconds']['min'] \
+            / max(baseline['wall_seconds']['min'], 1e-9)
+        node_ratio = result['nodes_visited'] \
+            / max(baseline['nodes_visited'], 1)
+        line += f"  time x{time_ratio:.2f}  nodes x{node_ratio:.2f}"
+    return line
+
+
+def format_first_solution(
+        result: Dict[str, Any],
+        baseline: Optional[Dict[str, Any]] = None) -> str:
+    line = f"{result['puzzle']:<18} {'first solution':<20}"
+    for word_order in WORD_ORDERS:
+        run = result[word_order]
+        line += (f"  {word_order} {run['wall_seconds']['min'] * 1e3:.2f}ms "
+                 f"{'found' if run['found'] else 'MISSED'}")
+        if baseline is not None:
+            time_ratio = run['wall_seconds']['min'] / max(
+                baseline[word_order]['wall_seconds']['min'], 1e-9)
+            line += f" x{time_ratio:.2f}"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="file to write the JSON results "
+                                         "to (default: standard output)")
+    parser.add_argument('--baseline', help="JSON results of an earlier run "
+                                           "to compare with")
+    parser.add_argument('--puzzle', action='append',
+                        help="id of a puzzle to run (default: all)")
+    parser.add_argument('--max-nodes', type=int)
+    parser.add_argument('--ordering', choices=Decrypter.ORDERINGS,
+                        default=Decrypter.TEXT_ORDER)
+    parser.add_argument('--forward-checking', action='store_true')
+    parser.add_argument('--cold', action='store_true',
+                        help="load the pattern index during each run")
+    args = parser.parse_args()
+
+    puzzles = read_puzzles(args.corpus)
+    if args.puzzle:
+        puzzles = [x for x in puzzles if x['id'] in args.puzzle]
+    settings = {
+        'repeat': args.repeat,
+        'max_nodes': args.max_nodes,
+        'ordering': args.ordering,
+        'forward_checking': args.forward_checking,
+        'cold': args.cold,
+    }
+    results = run_benchmark(puzzles, settings)
+    first_solution_results = run_first_solution(puzzles, settings)
+    output = {
+        'metadata': {
+            'commit': git_commit(),
+            'date': datetime.datetime.now(
+                datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': os.path.basename(args.corpus),
+            'settings': settings,
+        },
+        'results': results,
+        'first_solution': first_solution_results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline_output = json.load(file)
+        baseline = {(x['puzzle'], x['function']): x
+                    for x in baseline_output['results']}
+        print("compared with", args.baseline, file=sys.stderr)
+        for result in results:
+            key = (result['puzzle'], result['function'])
+            if key in baseline:
+                print(format_result(result, baseline[key]), file=sys.stderr)
+        first_solution_baseline = {
+            x['puzzle']: x for x in baseline_output.get('first_solution', [])}
+        for result in first_solution_results:
+            if result['puzzle'] in first_solution_baseline:
+                print(format_first_solution(
+                    result, first_solution_baseline[result['puzzle']]),
+                    file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,207 @@
-from .decryptoquote import (
-    decrypt_quote)
-# Replace project_name and needed_imports as appropriate
+# -*- coding: utf-8 -*-
 
+"""
+Command line tool that solves a stream of puzzles.
 
-def main():
-    crypto = input("Enter cryptoquote: ")
-    plaintext = decrypt_quote(crypto)
-    print(plaintext)
+Puzzles are read as JSON lines, from a file or standard input, one JSON
+object per line with the puzzle's coded `quote`, and optionally its coded
+`author`, a list of `hints` (words to add to the dictionary for that puzzle
+only) and an `id`. Results are written as JSON lines, one for each puzzle,
+in the same order, as soon as each puzzle and every puzzle before it are
+solved. Each result has the puzzle's input `line` number, its `id` if
+given, its `solutions` (see :func:`decrypt_quote_fully`), and an `error`,
+which is `null` unless the puzzle could not be read or solved.
+
+Puzzles are read only as fast as they are solved, so memory use does not
+depend on the size of the input (see :func:`iter_decrypt_many`).
+
+Usage::
+
+    decryptoquote [INPUT] [--output FILE] [--workers N] [--mode first|all]
+        [--timeout SECONDS] [--index FILE] [--search dictionary|annealing]
+
+The compiled index file given with `--index` is built from a language
+corpus file (see :meth:`WordPatterns.compile_index_file`) with::
+
+    decryptoquote compile-index CORPUS INDEX
+"""
+import argparse
+import collections
+import json
+import sys
+from typing import (IO, Any, Deque, Dict, Iterable, Iterator, List,
+                    Optional, Tuple)
+
+from decryptoquote.decryptoquote import (DICTIONARY_MODE, MODES,
+                                         iter_decrypt_many)
+from decryptoquote.wordpatterns import WordPatterns
+
+FIRST_SOLUTION: str = 'first'
+ALL_SOLUTIONS: str = 'all'
+COMPILE_INDEX_COMMAND: str = 'compile-index'
+
+# input line number, puzzle id, and the error reading the puzzle
+_PuzzleInfo = Tuple[int, Any, Optional[str]]
+
+
+def solve_stream(input_file: IO[str],
+                 output_file: IO[str],
+                 **options) -> int:
+    """
+    Solves each puzzle read from a JSON lines file, writing each result as
+    soon as it is ready.
+
+    :param input_file: text file to read puzzles from
+    :param output_file: text file to write results to
+    :param options: options for :func:`iter_decrypt_many`
+    :return: number of puzzles read
+    """
+    puzzle_infos: Deque[_PuzzleInfo] = collections.deque()
+    count = 0
+    for result in iter_decrypt_many(
+            _read_puzzles(input_file, puzzle_infos), **options):
+        line_number, puzzle_id, read_error = puzzle_infos.popleft()
+        record: Dict[str, Any] = {'line': line_number}
+        if puzzle_id is not None:
+            record['id'] = puzzle_id
+        record['solutions'] = result['solutions']
+        record['error'] = read_error or result['error']
+        output_file.write(json.dumps(record))
+        output_file.write('\n')
+        output_file.flush()
+        count += 1
+    return count
+
+
+def compile_index(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog=f"decryptoquote {COMPILE_INDEX_COMMAND}",
+        description="Compile a language corpus file into an index file, "
+                    "for --index.")
+    parser.add_argument('corpus', help="language corpus file to read")
+    parser.add_argument('index', help="index file to write")
+    options = parser.parse_args(args)
+    WordPatterns.compile_index_file(options.corpus, options.index)
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    if args is None:
+        args = sys.argv[1:]
+    if args and args[0] == COMPILE_INDEX_COMMAND:
+        compile_index(args[1:])
+        return
+    parser = argparse.ArgumentParser(
+        description="Solve Cryptoquote puzzles read as JSON lines.")
+    parser.add_argument('input', nargs='?', default='-',
+                        help="file to read puzzles from (default: standard "
+                             "input)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="file to write results to (default: standard "
+                             "output)")
+    parser.add_argument('-w', '--workers', type=int,
+                        help="number of worker processes (default: one per "
+                             "CPU)")
+    parser.add_argument('--mode', choices=(FIRST_SOLUTION, ALL_SOLUTIONS),
+                        default=FIRST_SOLUTION,
+                        help="find the first solution of each puzzle, or "
+                             "all of them")
+    parser.add_argument('--timeout', type=float,
+                        help="seconds each puzzle's search may run for")
+    parser.add_argument('--max-nodes', type=int,
+                        help="search nodes each puzzle's search may visit")
+    parser.add_argument('--index',
+                        help="compiled index file to load the dictionary "
+                             "from, instead of the database (see "
+                             f"'decryptoquote {COMPILE_INDEX_COMMAND} "
+                             "--help')")
+    parser.add_argument('--search', choices=MODES, default=DICTIONARY_MODE,
+                        help="search to use")
+    parser.add_argument('--max-unresolved', type=int, default=0,
+                        help="quote words that may be left unresolved")
+    parser.add_argument('--show-cypher', action='store_true',
+                        help="include each solution's coding key")
+    parser.add_argument('--max-pending', type=int,
+                        help="puzzles read ahead of the last result written "
+                             "(default: 4 per worker)")
+    options = parser.parse_args(args)
+    if options.workers is not None and options.workers < 1:
+        parser.error("--workers must be at least 1")
+    input_file = sys.stdin if options.input == '-' \
+        else open(options.input)
+    output_file = sys.stdout if options.output == '-' \
+        else open(options.output, 'w')
+    try:
+        solve_stream(
+            input_file, output_file,
+            mode=options.search,
+            workers=options.workers,
+            max_solutions=1 if options.mode == FIRST_SOLUTION else None,
+            timeout=options.timeout,
+            max_nodes=options.max_nodes,
+            show_cypher=options.show_cypher,
+            max_unresolved=options.max_unresolved,
+            max_pending=options.max_pending,
+            index_file=options.index)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+
+def _read_puzzles(lines: Iterable[str],
+                  puzzle_infos: Deque[_PuzzleInfo]
+                  ) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Reads puzzles from JSON lines, skipping blank lines, and adds each
+    puzzle's information to `puzzle_infos`. A line that is not a puzzle gives
+    a `None` puzzle, with its error in its information.
+
+    :return: iterator of puzzles for :func:`iter_decrypt_many`
+    """
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            puzzle_infos.append(
+                (line_number, None, f"Invalid JSON: {error}"))
+            yield None
+            continue
+        if not isinstance(record, dict):
+            puzzle_infos.append(
+                (line_number, None, "Puzzle must be a JSON object"))
+            yield None
+            continue
+        error = _puzzle_error(record)
+        puzzle_infos.append((line_number, record.get('id'), error))
+        if error is not None:
+            yield None
+            continue
+        yield {'coded_quote': record.get('quote'),
+               'coded_author': record.get('author'),
+               'add_words': record.get('hints')}
+
+
+def _puzzle_error(record: Dict[str, Any]) -> Optional[str]:
+    """
+    Checks the fields of a puzzle read from a JSON line.
+
+    :return: description of what is wrong with the puzzle, or `None` if
+      nothing is
+    """
+    if not isinstance(record.get('quote'), str):
+        return "Puzzle has no quote"
+    author = record.get('author')
+    if author is not None and not isinstance(author, str):
+        return "Puzzle's author must be a string"
+    hints = record.get('hints')
+    if hints is not None and (
+            not isinstance(hints, list)
+            or not all(isinstance(hint, str) for hint in hints)):
+        return "Puzzle's hints must be a list of strings"
+    return None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+"""
+Simulated annealing search for puzzles that dictionary search cannot solve.
+"""
+import math
+import random
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from decryptoquote.budget import SearchBudget
+from decryptoquote.constants import LETTERS
+from decryptoquote.decrypter import SearchStats
+from decryptoquote.ngrams import BOUNDARY, PLACE_VALUES, QuadgramModel, \
+    text_quadgrams
+
+_UNMATCHED: int = ord('_')
+# smallest score change counted as an improvement, so that rounding errors
+# cannot make the climb go round in circles
+_MIN_IMPROVEMENT: float = 1e-6
+
+# swapped coded letters, changed quadgram rows, and their new scores
+_Swap = Tuple[int, int, np.ndarray, np.ndarray]
+
+
+class AnnealingDecrypter:
+    """
+    This class decrypts a Cryptoquote by simulated annealing over full
+    26-letter keys, scoring each key by how English-like the decoded text is
+    according to a :class:`QuadgramModel`. Unlike :class:`Decrypter`, it
+    does not need every word to be in the dictionary, so it can decode
+    quotes with names, slang or typos. Its result is the best key it finds,
+    which is not guaranteed to be correct.
+
+    Each restart starts from a random key, and then tries swapping the
+    decoded letters of two random coded letters, for `iterations` steps. A
+    swap that raises the score is always kept, and one that lowers it is
+    kept with a probability that shrinks as the temperature falls linearly
+    from `temperature` to 0, so that the search can escape local maxima.
+    The restart then climbs to a local maximum, trying every swap until none
+    raises the score. Only the quadgrams containing the two swapped letters
+    are rescored for each swap.
+
+    :param coded_text: the text to decode
+    :param model: quadgram model to score decoded texts with
+    :param restarts: number of times to restart the search from a random key
+    :param iterations: number of random swaps to try on each restart,
+      before climbing
+    :param temperature: starting temperature, in units of the model's log
+      probabilities
+    :param budget: limits on the search (see :class:`SearchBudget`), or
+      `None` to run every restart. Each swap counts as a node.
+    :param seed: seed for the random number generator, or `None` to seed it
+      randomly. Searches with the same seed and parameters give the same
+      result, unless their budget runs out.
+
+    .. attribute:: stats
+        :type: SearchStats
+
+            Counts of the work done by the search. `nodes_visited` counts
+            swaps tried, and `backtracks` counts restarts.
+
+    .. attribute:: budget_exhausted
+        :type: bool
+        :value: False
+
+            Whether the search stopped because its budget ran out.
+    """
+
+    DEFAULT_RESTARTS: int = 20
+
+    def __init__(
+        self,
+        coded_text: str,
+        model: QuadgramModel,
+        restarts: int = DEFAULT_RESTARTS,
+        iterations: int = 2000,
+        temperature: float = 4.0,
+        budget: Optional[SearchBudget] = None,
+        seed: Optional[int] = None,
+    ):
+        self.stats = SearchStats()
+        self.budget_exhausted: bool = False
+        self._table: np.ndarray = model.table
+        self._restarts: int = restarts
+        self._iterations: int = iterations
+        self._temperature: float = temperature
+        self._budget: Optional[SearchBudget] = budget
+        self._random = random.Random(seed)
+        self._quadgrams: np.ndarray = text_quadgrams(coded_text.upper())
+        # coded letters in the text, and the quadgrams each one appears in
+        self._coded_letters: List[int] = sorted(
+            set(self._quadgrams.flat) - {BOUNDARY})
+        self._letter_quadgrams: List[np.ndarray] = [
+            np.flatnonzero((self._quadgrams == letter).any(axis=1))
+            for letter in range(len(LETTERS))]
+        # rows of the quadgrams containing either of each pair of swapped
+        # letters, and those quadgrams
+        self._swap_quadgrams: \
+            Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+        self._best_key: np.ndarray = self._random_key()
+        self._best_score: float = -math.inf
+
+    @property
+    def best_partial_key(self) -> bytes:
+        """
+        The key (see :meth:`CypherLetterMap.key`) of the best scoring
+        decoding found so far.
+        """
+        return self._key_bytes(self._best_key)
+
+    @property
+    def best_score(self) -> float:
+        """
+        The score of the best decoding found so far, or `-inf` if the search
+        has not run yet.
+        """
+        return self._best_score
+
+    def iter_solutions(
+        self,
+        max_solutions: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """
+        Runs the search, and gives the best key found once every restart has
+        finished. If the budget runs out first, nothing is given and
+        :attr:`budget_exhausted` is set; the best key found so far is then
+        available as :attr:`best_partial_key`.
+
+        :param max_solutions: maximum number of solutions to give. Only one
+          solution is ever given.
+        :return: iterator of at most one key
+        """
+        if max_solutions is not None and max_solutions <= 0:
+            return
+        if self.decrypt():
+            yield self.best_partial_key
+
+    def decrypt(self) -> bool:
+        """
+        Runs the search.
+
+        :return: `True` if every restart finished, `False` if the budget ran
+          out first
+        """
+        start_time = time.perf_counter()
+        try:
+            for _ in range(self._restarts):
+                if not self._restart():
+                    self.budget_exhausted = True
+                    return False
+                self.stats.backtracks += 1
+            return True
+        finally:
+            self.stats.elapsed_seconds += time.perf_counter() - start_time
+
+    def _restart(self) -> bool:
+        """
+        Runs one restart: anneals a random key, then climbs to a local
+        maximum, and updates the best key found.
+
+        :return: `False` if the budget ran out
+        """
+        if not self._coded_letters:
+            self._best_score = 0.0
+            return True
+        key = self._random_key()
+        quadgram_scores = self._table[key[self._quadgrams] @ PLACE_VALUES]
+        finished = self._anneal(key, quadgram_scores) \
+            and self._climb(key, quadgram_scores)
+        score = float(quadgram_scores.sum(dtype=np.float64))
+        if score > self._best_score:
+            self._best_score = score
+            self._best_key = key
+        return finished
+
+    def _anneal(self, key: np.ndarray, quadgram_scores: np.ndarray) -> bool:
+        """
+        Tries `iterations` random swaps, cooling as it goes. The key and
+        quadgram scores are updated in place.
+
+        :return: `False` if the budget ran out
+        """
+        uniform = self._random.random
+        choice = self._random.choice
+        randrange = self._random.randrange
+        letter_count = len(LETTERS)
+        for iteration in range(self._iterations):
+            if not self._count_node():
+                return False
+            first = choice(self._coded_letters)
+            second = randrange(letter_count - 1)
+            if second >= first:
+                second += 1
+            temperature = self._temperature * (
+                1 - iteration / self._iterations)
+            change, swap = self._try_swap(key, quadgram_scores, first, second)
+            if change >= 0 or (temperature > 0 and uniform() < math.exp(
+                    change / temperature)):
+                self._make_swap(key, quadgram_scores, swap)
+        return True
+
+    def _climb(self, key: np.ndarray, quadgram_scores: np.ndarray) -> bool:
+        """
+        Tries every swap of a coded letter in the text with another letter,
+        in random order, keeping those that raise the score, until no swap
+        does. The key and quadgram scores are updated in place.
+
+        :return: `False` if the budget ran out
+        """
+        swaps = [(first, second) for first in self._coded_letters
+                 for second in range(len(LETTERS)) if second != first]
+        improved = True
+        while improved:
+            improved = False
+            self._random.shuffle(swaps)
+            for first, second in swaps:
+                if not self._count_node():
+                    return False
+                change, swap = self._try_swap(key, quadgram_scores, first,
+                                              second)
+                if change > _MIN_IMPROVEMENT:
+                    self._make_swap(key, quadgram_scores, swap)
+                    improved = True
+        return True
+
+    def _try_swap(self,
+                  key: np.ndarray,
+                  quadgram_scores: np.ndarray,
+                  first: int,
+                  second: int) -> Tuple[float, _Swap]:
+        """
+        Scores swapping the decoded letters of two coded letters, rescoring
+        only the quadgrams containing them. The key is left unchanged.
+
+        :return: change in score, and the swap to give :meth:`_make_swap` to
+          make it
+        """
+        try:
+            rows, quadgrams = self._swap_quadgrams[(first, second)]
+        except KeyError:
+            rows = np.union1d(self._letter_quadgrams[first],
+                              self._letter_quadgrams[second])
+            quadgrams = self._quadgrams[rows]
+            self._swap_quadgrams[(first, second)] = (rows, quadgrams)
+        key[first], key[second] = key[second], key[first]
+        new_scores = self._table[key[quadgrams] @ PLACE_VALUES]
+        key[first], key[second] = key[second], key[first]
+        change = float(new_scores.sum(dtype=np.float64)
+                       - quadgram_scores[rows].sum(dtype=np.float64))
+        return change, (first, second, rows, new_scores)
+
+    @staticmethod
+    def _make_swap(key: np.ndarray,
+                   quadgram_scores: np.ndarray,
+                   swap: _Swap) -> None:
+        first, second, rows, new_scores = swap
+        key[first], key[second] = key[second], key[first]
+        quadgram_scores[rows] = new_scores
+
+    def _count_node(self) -> bool:
+        """
+        Counts a swap, checking the budget every few swaps.
+
+        :return: `False` if the budget ran out
+        """
+        budget = self._budget
+        if budget is not None \
+                and self.stats.nodes_visited % budget.CHECK_INTERVAL == 0 \
+                and budget.is_exhausted(self.stats.nodes_visited):
+            return False
+        self.stats.nodes_visited += 1
+        return True
+
+    def _random_key(self) -> np.ndarray:
+        """
+        Creates a random key, as an array from each symbol to its decoded
+        symbol. The word boundary always decodes to itself.
+        """
+        letters = list(range(len(LETTERS)))
+        self._random.shuffle(letters)
+        return np.array(letters + [BOUNDARY], dtype=np.intp)
+
+    def _key_bytes(self, key: np.ndarray) -> bytes:
+        """
+        Converts a key array into a :meth:`CypherLetterMap.key`, with only the
+        coded letters in the text decoded.
+        """
+        key_bytes = bytearray([_UNMATCHED]) * len(LETTERS)
+        for letter in self._coded_letters:
+            key_bytes[letter] = ord(LETTERS[key[letter]])
+        return bytes(key_bytes)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+"""
+Batch search, solving many puzzles over a pool of worker processes.
+"""
+import collections
+import concurrent.futures
+import logging
+import os
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from decryptoquote.annealing import AnnealingDecrypter
+from decryptoquote.budget import (BUDGET_EXHAUSTED, SOLVED, UNRESOLVED,
+                                  SearchBudget)
+from decryptoquote.cypherlettermap import CypherLetterMap
+from decryptoquote.decrypter import Decrypter
+from decryptoquote.ngrams import QuadgramModel
+from decryptoquote.patternindex import (LayeredPatternIndex, PatternIndex,
+                                        get_shared_index,
+                                        invalidate_shared_index)
+from decryptoquote.wordpatterns import WordPatterns
+
+_WORKER_INDEX_KEY = ('decryptoquote.batch', 'worker')
+_HINTS_INDEX_KEY = _WORKER_INDEX_KEY + ('hints',)
+
+# (coded quote, words to add to the dictionary for this puzzle only)
+BatchTask = Tuple[str, Tuple[str, ...]]
+# ((key, status) pairs, search stats, error message)
+TaskResult = Tuple[List[Tuple[bytes, str]], Optional[Dict[str, float]],
+                   Optional[str]]
+# ordering, forward checking, max solutions, max unresolved, timeout,
+# max nodes
+_TaskSettings = Tuple[str, bool, Optional[int], int, Optional[float],
+                      Optional[int]]
+
+# set in each worker process by _init_worker
+_worker_pattern_index: Optional[PatternIndex] = None
+_worker_model: Optional[QuadgramModel] = None
+
+
+class BatchSolver:
+    """
+    This class solves a stream of puzzles over a pool of worker processes,
+    giving each puzzle's result in input order.
+
+    The pattern index (or quadgram model) is sent to each worker process
+    once, when the process starts, rather than with every puzzle. Each
+    puzzle gets its own budget, which starts when a worker starts on it, so
+    puzzles that wait in the queue do not lose any time. A puzzle whose
+    search raises an exception gets an error result, and the batch carries
+    on. If a worker process dies, the pool is restarted, and the puzzles
+    that may have been running are tried again one at a time; a puzzle that
+    kills its worker again gets an error result.
+
+    :param pattern_index: pattern index to search with, for dictionary
+      search (see :class:`Decrypter`)
+    :param model: quadgram model to search with, for annealing search (see
+      :class:`AnnealingDecrypter`). If given, the pattern index is not used.
+    :param workers: number of worker processes, or `None` to use one per CPU.
+      With 1 worker, puzzles are solved in this process.
+    :param ordering: word ordering to use (see :class:`Decrypter`)
+    :param forward_checking: whether to use forward checking
+    :param max_solutions: maximum number of solutions to find for each
+      puzzle, or `None` to find all of them
+    :param max_unresolved: maximum number of words that may be left
+      unresolved in each puzzle (see :class:`Decrypter`)
+    :param timeout: seconds each puzzle's search may run for, or `None` for
+      no time limit
+    :param max_nodes: maximum number of nodes each puzzle's search may
+      visit, or `None` for no node limit
+    """
+
+    def __init__(
+        self,
+        pattern_index: Optional[PatternIndex] = None,
+        model: Optional[QuadgramModel] = None,
+        workers: Optional[int] = None,
+        ordering: str = Decrypter.TEXT_ORDER,
+        forward_checking: bool = False,
+        max_solutions: Optional[int] = 1,
+        max_unresolved: int = 0,
+        timeout: Optional[float] = None,
+        max_nodes: Optional[int] = None,
+    ):
+        if pattern_index is None and model is None:
+            raise ValueError("Batch search needs a pattern index or a model")
+        if ordering not in Decrypter.ORDERINGS:
+            raise ValueError(f"Unknown word ordering {ordering}")
+        self._pattern_index: Optional[PatternIndex] = pattern_index
+        self._model: Optional[QuadgramModel] = model
+        self._workers: int = workers or os.cpu_count() or 1
+        self._settings: _TaskSettings = (ordering, forward_checking,
+                                         max_solutions, max_unresolved,
+                                         timeout, max_nodes)
+
+    def solve(self,
+              tasks: Iterable[Optional[BatchTask]],
+              max_pending: Optional[int] = None
+              ) -> Iterator[Optional[TaskResult]]:
+        """
+        Solves each task, reading tasks only as fast as results are taken.
+
+        :param tasks: (coded quote, hint words) tasks. A task may be `None`
+          to keep its place in the results without solving anything.
+        :param max_pending: maximum number of tasks read but not yet given
+          back as results, or `None` for 4 per worker
+        :return: iterator of results, in the same order as the tasks, with
+          `None` for each `None` task
+        """
+        if self._workers == 1:
+            yield from self._solve_in_process(tasks)
+            return
+        max_pending = max(max_pending or 4 * self._workers, 1)
+        # task, its future (None until it is submitted), and whether it was
+        # pending when a worker process died
+        pending: Deque[List] = collections.deque()
+        executor = self._create_executor()
+        try:
+            for task in tasks:
+                entry = [task, None, False]
+                pending.append(entry)
+                # tasks wait while earlier ones are being run one at a time
+                if task is not None and not pending[0][2]:
+                    try:
+                        self._submit(executor, [entry])
+                    except BrokenProcessPool:
+                        pass  # found when waiting for the oldest task
+                while len(pending) >= max_pending:
+                    result, executor = self._next_result(pending, executor)
+                    yield result
+            while pending:
+                result, executor = self._next_result(pending, executor)
+                yield result
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _solve_in_process(
+        self,
+        tasks: Iterable[Optional[BatchTask]]
+    ) -> Iterator[Optional[TaskResult]]:
+        _init_worker(self._pattern_index, self._model)
+        try:
+            for task in tasks:
+                yield _solve_task(task, self._settings) \
+                    if task is not None else None
+        finally:
+            _init_worker(None, None)
+
+    def _create_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._workers,
+            initializer=_init_worker,
+            initargs=(self._pattern_index, self._model))
+
+    def _next_result(
+        self,
+        pending: Deque[List],
+        executor: concurrent.futures.ProcessPoolExecutor
+    ) -> Tuple[Optional[TaskResult],
+               concurrent.futures.ProcessPoolExecutor]:
+        """
+        Waits for the result of the oldest pending task, restarting the pool
+        if a worker process died. The tasks that were pending when it died
+        are then run again one at a time, as each becomes the oldest, so
+        that a task that kills its worker again can be told apart from the
+        others. Once they are done, the later tasks run together again.
+
+        :return: the task's result, and the (possibly new) pool
+        """
+        while True:
+            entry = pending[0]
+            task, future, suspect = entry
+            if task is None:
+                pending.popleft()
+                return None, executor
+            if future is None:
+                try:
+                    self._submit(executor, [entry] if suspect else pending)
+                except BrokenProcessPool:
+                    executor = self._restart(executor, pending)
+                    continue
+            try:
+                result = entry[1].result()
+            except BrokenProcessPool:
+                executor = self._restart(executor, pending)
+                if suspect:
+                    pending.popleft()
+                    return ([], None, "Worker process died"), executor
+            else:
+                pending.popleft()
+                return result, executor
+
+    def _submit(self,
+                executor: concurrent.futures.ProcessPoolExecutor,
+                entries: Iterable[List]) -> None:
+        """
+        Submits the pending tasks that have not been submitted yet.
+        """
+        for entry in entries:
+            if entry[0] is not None and entry[1] is None:
+                entry[1] = executor.submit(_solve_task, entry[0],
+                                           self._settings)
+
+    def _restart(
+        self,
+        executor: concurrent.futures.ProcessPoolExecutor,
+        pending: Deque[List]
+    ) -> concurrent.futures.ProcessPoolExecutor:
+        """
+        Replaces a broken pool, marking every pending task to be run again.
+
+        :return: new pool
+        """
+        executor.shutdown(wait=False, cancel_futures=True)
+        for entry in pending:
+            entry[1] = None
+            entry[2] = True
+        return self._create_executor()
+
+
+def _init_worker(pattern_index: Optional[PatternIndex],
+                 model: Optional[QuadgramModel]) -> None:
+    global _worker_pattern_index, _worker_model
+    _worker_pattern_index = pattern_index
+    _worker_model = model
+    invalidate_shared_index(_WORKER_INDEX_KEY)
+    if pattern_index is not None:
+        get_shared_index(_WORKER_INDEX_KEY, lambda version: pattern_index)
+
+
+def _solve_task(task: BatchTask, settings: _TaskSettings) -> TaskResult:
+    coded_quote, hint_words = task
+    (ordering, forward_checking, max_solutions, max_unresolved, timeout,
+     max_nodes) = settings
+    try:
+        budget = SearchBudget.from_timeout(timeout, max_nodes) \
+            if timeout is not None or max_nodes is not None else None
+        if _worker_model is not None:
+            decrypter = AnnealingDecrypter(coded_quote, _worker_model,
+                                           budget=budget)
+        else:
+            decrypter = Decrypter(
+                coded_quote, CypherLetterMap(), _word_patterns(hint_words),
+                ordering, forward_checking, budget,
+                max_unresolved=max_unresolved)
+        solutions: List[Tuple[bytes, str]] = []
+        for key in decrypter.iter_solutions(max_solutions):
+            status = UNRESOLVED if _worker_model is None \
+                and decrypter.unresolved_words else SOLVED
+            solutions.append((key, status))
+        if decrypter.budget_exhausted:
+            solutions.append((decrypter.best_partial_key, BUDGET_EXHAUSTED))
+        return solutions, decrypter.stats.as_dict(), None
+    except Exception as error:
+        logging.exception("Batch puzzle failed")
+        return [], None, f"{type(error).__name__}: {error}"
+    finally:
+        if hint_words:
+            invalidate_shared_index(_HINTS_INDEX_KEY)
+
+
+def _word_patterns(hint_words: Tuple[str, ...]) -> WordPatterns:
+    """
+    Gets word patterns using the worker's pattern index, with the hint words
+    added for this task only.
+    """
+    if not hint_words:
+        return WordPatterns(None, index_key=_WORKER_INDEX_KEY)
+    hint_patterns: Dict[str, List[str]] = {}
+    for word in hint_words:
+        hint_patterns.setdefault(WordPatterns.word_to_pattern(word),
+                                 []).append(word)
+    # the hint words go in a small index on top of the worker's index,
+    # which is shared rather than copied
+    invalidate_shared_index(_HINTS_INDEX_KEY)
+    get_shared_index(_HINTS_INDEX_KEY, lambda version: LayeredPatternIndex(
+        _worker_pattern_index, hint_patterns, version))
+    return WordPatterns(None, index_key=_HINTS_INDEX_KEY)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Limits on how much work a single solve may do.
+"""
+import threading
+import time
+from typing import Optional
+
+SOLVED: str = 'solved'
+BUDGET_EXHAUSTED: str = 'budget_exhausted'
+UNRESOLVED: str = 'unresolved'
+
+
+class CancellationToken:
+    """
+    This class lets one thread (or process) ask a running search to stop.
+    The search checks the token every few steps, and stops with its best
+    partial result once the token is cancelled.
+
+    :param event: event object to use for the cancelled flag, such as a
+      :class:`multiprocessing.Event` when the search runs in another process.
+      A new :class:`threading.Event` is used by default.
+    """
+
+    __slots__ = ('_event',)
+
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'cancelled={self.cancelled})')
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """
+        Asks any search using this token to stop.
+        """
+        self._event.set()
+
+
+class SearchBudget:
+    """
+    This class limits how long a search may run. A search stops with its best
+    partial result once any of the limits is reached:
+
+    * the wall-clock `deadline` (a :func:`time.time` value) has passed,
+    * `max_nodes` match words have been added to the cypher-letter map, or
+    * the `cancel_token` has been cancelled.
+
+    The limits are checked every :attr:`CHECK_INTERVAL` search steps, so a
+    search may run slightly past them.
+
+    :param deadline: time after which the search should stop, or `None` for
+      no time limit
+    :param max_nodes: maximum number of nodes the search may visit, or `None`
+      for no node limit
+    :param cancel_token: token used to cancel the search, or `None`
+    """
+
+    CHECK_INTERVAL: int = 64
+
+    __slots__ = ('deadline', 'max_nodes', 'cancel_token')
+
+    def __init__(self,
+                 deadline: Optional[float] = None,
+                 max_nodes: Optional[int] = None,
+                 cancel_token: Optional[CancellationToken] = None):
+        self.deadline: Optional[float] = deadline
+        self.max_nodes: Optional[int] = max_nodes
+        self.cancel_token: Optional[CancellationToken] = cancel_token
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'deadline={self.deadline!r}, '
+                f'max_nodes={self.max_nodes!r}, '
+                f'cancel_token={self.cancel_token!r})')
+
+    @classmethod
+    def from_timeout(cls,
+                     timeout: Optional[float],
+                     max_nodes: Optional[int] = None,
+                     cancel_token: Optional[CancellationToken] = None
+                     ) -> 'SearchBudget':
+        """
+        Creates a budget with a deadline the given number of seconds from now.
+
+        :param timeout: seconds the search may run for, or `None` for no time
+          limit
+        :param max_nodes: maximum number of nodes the search may visit
+        :param cancel_token: token used to cancel the search
+        :return: new budget
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        return cls(deadline, max_nodes, cancel_token)
+
+    def is_exhausted(self, nodes_visited: int) -> bool:
+        """
+        Checks whether any of the budget's limits has been reached.
+
+        :param nodes_visited: number of nodes the search has visited so far
+        :return: `True` if the search should stop
+        """
+        if self.max_nodes is not None and nodes_visited >= self.max_nodes:
+            return True
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            return True
+        return self.deadline is not None and time.time() >= self.deadline
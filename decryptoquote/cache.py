@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+Caching of puzzle solutions.
+
+Two coded quotes with the same decoded quote but different cyphers are the
+same puzzle once their coded letters are relabelled in order of first
+appearance (see :func:`canonicalize`), so solutions are cached for this
+canonical form, and mapped back to each puzzle's own coded letters.
+"""
+import collections
+import threading
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+from decryptoquote.constants import LETTERS
+
+_FIRST_LETTER: int = ord(LETTERS[0])
+_UNMATCHED: int = ord('_')
+
+
+def canonicalize(coded_text: str) -> Tuple[str, str]:
+    """
+    Relabels the letters of the coded text in order of first appearance:
+    the first distinct letter becomes "A", the second "B", and so on. Other
+    characters are kept as they are. For example, "Xyx zy!" becomes
+    "ABA CB!".
+
+    :param coded_text: coded text to relabel
+    :return: relabelled (uppercase) text, and the original coded letters in
+      order of first appearance, so that canonical letter `LETTERS[i]` stands
+      for original letter `letters[i]`
+    """
+    coded_text = coded_text.upper()
+    letters: Dict[str, str] = {}  # original letter: canonical letter
+    for character in coded_text:
+        if character in LETTERS and character not in letters:
+            letters[character] = LETTERS[len(letters)]
+    original_letters = "".join(letters)
+    canonical_text = coded_text.translate(
+        str.maketrans(original_letters, "".join(letters.values())))
+    return canonical_text, original_letters
+
+
+def key_to_canonical(key: bytes, letters: str) -> bytes:
+    """
+    Converts a key (see :meth:`CypherLetterMap.key`) for a coded text into
+    the matching key for its canonical form.
+
+    :param key: key for the coded text
+    :param letters: original coded letters, from :func:`canonicalize`
+    :return: key for the canonical text
+    """
+    canonical_key = bytearray([_UNMATCHED]) * len(LETTERS)
+    for canonical_index, letter in enumerate(letters):
+        canonical_key[canonical_index] = key[ord(letter) - _FIRST_LETTER]
+    return bytes(canonical_key)
+
+
+def key_from_canonical(canonical_key: bytes, letters: str) -> bytes:
+    """
+    Converts a key for a canonical text back into the matching key for the
+    coded text. This reverses :func:`key_to_canonical`.
+
+    :param canonical_key: key for the canonical text
+    :param letters: original coded letters, from :func:`canonicalize`
+    :return: key for the coded text
+    """
+    key = bytearray([_UNMATCHED]) * len(LETTERS)
+    for canonical_index, letter in enumerate(letters):
+        key[ord(letter) - _FIRST_LETTER] = canonical_key[canonical_index]
+    return bytes(key)
+
+
+class SolutionCache:
+    """
+    This class is a bounded, thread-safe cache with least-recently-used
+    eviction and a time to live for each entry.
+
+    :param max_size: maximum number of entries
+    :param ttl: seconds an entry stays valid after being stored, or `None`
+      for no limit
+
+    .. attribute:: hits
+
+        Number of lookups that found a valid entry.
+
+    .. attribute:: misses
+
+        Number of lookups that found no valid entry.
+
+    .. attribute:: evictions
+
+        Number of entries removed to make room for new ones, or because they
+        expired.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 3600):
+        self.max_size: int = max_size
+        self.ttl: Optional[float] = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        # key: (expiry time, value), least recently used first
+        self._entries: \
+            'collections.OrderedDict[Hashable, Tuple[float, object]]' = \
+            collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'size={len(self)}, '
+                f'max_size={self.max_size}, '
+                f'ttl={self.ttl})')
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[object]:
+        """
+        Gets the value stored for the key, if it has not expired.
+
+        :param key: cache key
+        :return: stored value, or `None` if there is none
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: object) -> None:
+        """
+        Stores a value for the key, evicting the least recently used entry if
+        the cache is full.
+
+        :param key: cache key
+        :param value: value to store (not `None`)
+        """
+        if self.max_size <= 0:
+            return
+        expiry = time.monotonic() + self.ttl \
+            if self.ttl is not None else float('inf')
+        with self._lock:
+            self._entries[key] = (expiry, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Removes all entries. The counters are not reset.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Gets the cache's counters and current size.
+
+        :return: dictionary of hits, misses, evictions and size
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self),
+        }
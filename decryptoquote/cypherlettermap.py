@@ -1,23 +1,34 @@
-from typing import Dict, Optional, List, Tuple
+from typing import Dict, Optional, List
 
-from decryptoquote.constants import LETTERS, PUNCTUATION
+from decryptoquote.constants import LETTERS
+
+_FIRST_LETTER: int = ord(LETTERS[0])
+_UNMATCHED: int = ord('_')
 
 
 class CypherLetterMap:
     """
     This class maps coded letters to matching decoded letters, or to `None` if
     no matching value has been determined.
+
+    The mapping is stored as two fixed 26-slot arrays, one from coded letters
+    to decoded letters and one in reverse, so that lookups in both directions
+    take constant time. Unmatched slots hold the underscore ("_").
     """
 
+    __slots__ = ('_forward', '_reverse', '_trail')
+
     def __init__(self):
-        self._clmap: Dict[str, Optional[str]] = {}
-        self._past_coded_words: List[Tuple[str, str]] = []  # coded, decoded
-        for letter in LETTERS:
-            self._clmap[letter] = None
+        self._forward: bytearray = bytearray([_UNMATCHED]) * len(LETTERS)
+        self._reverse: bytearray = bytearray([_UNMATCHED]) * len(LETTERS)
+        # coded letters newly bound by each added word, for undoing additions
+        self._trail: List[List[int]] = []
 
     def __repr__(self):
+        clmap: Dict[str, Optional[str]] = {
+            letter: self.get_letter_for_cypher(letter) for letter in LETTERS}
         return (f'{self.__class__.__name__}('
-                f'{self._clmap!r})')
+                f'{clmap!r})')
 
     def __str__(self):
         keystring: str = self.keystring()
@@ -28,17 +39,60 @@ class CypherLetterMap:
             if self is other:
                 return True
             else:
-                for key in self._clmap.keys():
-                    if self.get_letter_for_cypher(key) \
-                        != other.get_letter_for_cypher(key):
-                        return False
-                return True
+                return self._forward == other._forward
         except AttributeError:
             return False
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    @classmethod
+    def from_key(cls, key: bytes) -> 'CypherLetterMap':
+        """
+        Creates a cypher letter map from a key, as returned by :meth:`key`.
+        The new map has no word additions to undo.
+
+        :param key: 26-byte key
+        :return: new cypher letter map
+        :raises ValueError: if the key is not a valid key
+        """
+        if len(key) != len(LETTERS):
+            raise ValueError(f"Key must have {len(LETTERS)} letters")
+        cypher_letter_map = cls()
+        forward = cypher_letter_map._forward
+        reverse = cypher_letter_map._reverse
+        for coded_index, decoded in enumerate(key):
+            if decoded == _UNMATCHED:
+                continue
+            decoded_index = decoded - _FIRST_LETTER
+            if not 0 <= decoded_index < len(LETTERS):
+                raise ValueError(f"Key has a non-letter {chr(decoded)!r}")
+            if reverse[decoded_index] != _UNMATCHED:
+                raise ValueError(
+                    f"Decoded letter {chr(decoded)} is already mapped to "
+                    f"another coded letter")
+            forward[coded_index] = decoded
+            reverse[decoded_index] = coded_index + _FIRST_LETTER
+        return cypher_letter_map
+
+    @property
+    def coded_to_decoded(self) -> memoryview:
+        """
+        Read-only view of the coded-to-decoded array. Slot `i` holds the
+        ASCII code of the decoded letter matching `LETTERS[i]`, or of the
+        underscore ("_") if there is no match. The view follows later changes
+        to the mapping.
+        """
+        return memoryview(self._forward).toreadonly()
+
+    @property
+    def decoded_to_coded(self) -> memoryview:
+        """
+        Read-only view of the decoded-to-coded array, laid out like
+        :attr:`coded_to_decoded`.
+        """
+        return memoryview(self._reverse).toreadonly()
+
     def get_letter_for_cypher(self, coded_letter: str) -> Optional[str]:
         """
         Get the matching decoded letter for the given coded letter
@@ -46,7 +100,11 @@ class CypherLetterMap:
         :param coded_letter: given coded letter
         :return: matching decoded letter, or `None` if no match
         """
-        return self._clmap[coded_letter.upper()]
+        coded_index = ord(coded_letter.upper()) - _FIRST_LETTER
+        if not 0 <= coded_index < 26:
+            raise KeyError(coded_letter)
+        decoded = self._forward[coded_index]
+        return None if decoded == _UNMATCHED else chr(decoded)
 
     def decode(self, coded_text: str) -> str:
         """
@@ -58,16 +116,8 @@ class CypherLetterMap:
         :return: decrypted version of coded text, which may have underscores if
           letters are not decoded
         """
-        decoded_text = []
-        for letter in coded_text.upper():
-            if letter in self._clmap.keys():
-                if self._clmap[letter] is None:
-                    decoded_text.append('_')
-                else:
-                    decoded_text.append(self._clmap[letter])
-            else:
-                decoded_text.append(letter)
-        return "".join(decoded_text)
+        return coded_text.upper().translate(
+            str.maketrans(LETTERS, self.keystring()))
 
     def add_word_to_mapping(self,
                             coded_word: str,
@@ -81,25 +131,59 @@ class CypherLetterMap:
         """
         coded_word, decoded_word = self._validate_words(coded_word,
                                                         decoded_word)
-        self._past_coded_words.append((coded_word, decoded_word))
-        self._add_word_to_mapping_no_save(coded_word, decoded_word)
+        self.add_prepared_word_to_mapping(coded_word, decoded_word)
+
+    def add_prepared_word_to_mapping(self,
+                                     coded_word: str,
+                                     decoded_word: str):
+        """
+        Same as :meth:`add_word_to_mapping`, but for words that are already
+        known to be uppercase and of equal length, such as a coded word and
+        one of its pattern matches. Word validation is skipped.
+
+        :param coded_word: uppercase word from coded puzzle to add
+        :param decoded_word: matching uppercase decoded word
+        """
+        forward = self._forward
+        reverse = self._reverse
+        new_letters: List[int] = []
+        for coded_letter, decoded_letter in zip(coded_word, decoded_word):
+            coded_index = ord(coded_letter) - _FIRST_LETTER
+            decoded_index = ord(decoded_letter) - _FIRST_LETTER
+            if 0 <= coded_index < 26 and 0 <= decoded_index < 26:
+                decoded = forward[coded_index]
+                # pair exists in map: no action
+                if decoded == decoded_index + _FIRST_LETTER:
+                    continue
+                # old key, new value
+                if decoded != _UNMATCHED:
+                    self._unbind_letters(new_letters)
+                    raise ValueError(
+                        f"Coded letter {coded_letter} already has a match")
+                # same value for 2 keys
+                if reverse[decoded_index] != _UNMATCHED:
+                    self._unbind_letters(new_letters)
+                    raise ValueError(
+                        f"Decoded letter {decoded_letter} is already mapped to "
+                        f"another coded letter")
+                forward[coded_index] = decoded_index + _FIRST_LETTER
+                reverse[decoded_index] = coded_index + _FIRST_LETTER
+                new_letters.append(coded_index)
+            elif coded_letter != decoded_letter:
+                self._unbind_letters(new_letters)
+                raise ValueError(
+                    f"Coded word {coded_word} and decoded word {decoded_word} "
+                    f"have different punctuation locations")
+        self._trail.append(new_letters)
 
     def remove_last_word_from_mapping(self):
         """
         Updates the cypher letter dictionary by undoing the last word addition.
+        Only the coded letters that the last word newly matched are cleared,
+        so this takes time proportional to the length of that word.
         """
-        # current strategy: remove last word, clear map, rebuild
-        # could be costly?
-        # possible improvement: also store number of "codings"
-        #   ie. number of times we see that coded/decoded letter pair
-        # reduce that number each time we remove
-        # only remove letter when codings count <= 0
-        self._past_coded_words = self._past_coded_words[:-1]  # remove last
-        for letter in self._clmap.keys():
-            self._clmap[letter] = None  # clear cl_map
-        for word_pair in self._past_coded_words:
-            coded_word, decoded_word = word_pair
-            self._add_word_to_mapping_no_save(coded_word, decoded_word)
+        if self._trail:
+            self._unbind_letters(self._trail.pop())
 
     def does_word_coding_work(
         self,
@@ -125,66 +209,80 @@ class CypherLetterMap:
         except ValueError:
             return False
         coded_word, possible_decoded_word = word_pair
-        for letter_pair in zip(coded_word, possible_decoded_word):
-            coded_letter, decoded_letter = letter_pair
-            if coded_letter in PUNCTUATION or coded_letter == "'":
-                if decoded_letter == coded_letter:
-                    continue
-                else:
-                    return False
-            if self._clmap[coded_letter] is None:
-                if decoded_letter in self._clmap.values():
-                    return False
-                if decoded_letter in PUNCTUATION:
-                    return False
-            else:
-                if self._clmap[coded_letter] != decoded_letter:
+        return self.does_prepared_coding_work(coded_word,
+                                              possible_decoded_word)
+
+    def does_prepared_coding_work(
+        self,
+        coded_word: str,
+        possible_decoded_word: str
+    ) -> bool:
+        """
+        Same as :meth:`does_word_coding_work`, but for words that are already
+        known to be uppercase and of equal length, such as a coded word and
+        one of its pattern matches. Word validation is skipped.
+
+        :param coded_word: uppercase coded word to check
+        :param possible_decoded_word: uppercase possible decoded word to check
+        :return: True if coded word and possible decoded word could be safely
+          added to the mapping
+        """
+        forward = self._forward
+        reverse = self._reverse
+        for coded_letter, decoded_letter in zip(coded_word,
+                                                possible_decoded_word):
+            coded_index = ord(coded_letter) - _FIRST_LETTER
+            if 0 <= coded_index < 26:
+                decoded = forward[coded_index]
+                if decoded == _UNMATCHED:
+                    decoded_index = ord(decoded_letter) - _FIRST_LETTER
+                    if not 0 <= decoded_index < 26:
+                        return False
+                    if reverse[decoded_index] != _UNMATCHED:
+                        return False
+                elif decoded != ord(decoded_letter):
                     return False
+            elif coded_letter != decoded_letter:
+                return False
         return True
 
+    def count_matched_letters(self, coded_letters: str) -> int:
+        """
+        Counts how many of the given uppercase coded letters already have
+        matching decoded letters.
+
+        :param coded_letters: uppercase coded letters to check
+        :return: number of letters with matches
+        """
+        forward = self._forward
+        return sum(1 for coded_letter in coded_letters
+                   if forward[ord(coded_letter) - _FIRST_LETTER]
+                   != _UNMATCHED)
+
     def clear(self):
-        self._past_coded_words: List[Tuple[str, str]] = []  # coded, decoded
-        for letter in LETTERS:
-            self._clmap[letter] = None
-
-    def keystring(self):
-        key: List[str] = []
-        for letter in LETTERS:
-            letter_for_key = self._clmap[letter]
-            if letter_for_key is None:
-                key.append("_")
-            else:
-                key.append(letter_for_key)
-        return ''.join(key)
+        self._forward[:] = bytearray([_UNMATCHED]) * len(LETTERS)
+        self._reverse[:] = bytearray([_UNMATCHED]) * len(LETTERS)
+        self._trail = []
 
-    def _add_word_to_mapping_no_save(self,
-                                     coded_word: str,
-                                     decoded_word: str):
-        coded_word, decoded_word = self._validate_words(coded_word,
-                                                        decoded_word)
-        word_matches = zip(coded_word, decoded_word)
-        for letter_match in word_matches:
-            coded_letter, decoded_letter = letter_match
-            if coded_letter not in PUNCTUATION \
-                and decoded_letter not in PUNCTUATION:
-                # pair exists in map: no action
-                if self._clmap[coded_letter] == decoded_letter:
-                    continue
-                # old key, new value
-                if self._clmap[coded_letter] is not None:
-                    raise ValueError(
-                        f"Coded letter {coded_letter} already has a match")
-                # same value for 2 keys
-                if decoded_letter in self._clmap.values():
-                    raise ValueError(
-                        f"Decoded letter {decoded_letter} is already mapped to "
-                        f"another coded letter")
-                self._clmap[coded_letter] = decoded_letter
-            else:
-                if coded_letter != decoded_letter:
-                    raise ValueError(
-                        f"Coded word {coded_word} and decoded word {decoded_word} "
-                        f"have different punctuation locations")
+    def keystring(self) -> str:
+        return self._forward.decode('ascii')
+
+    def key(self) -> bytes:
+        """
+        Gets an immutable snapshot of the current mapping: 26 bytes, holding
+        the decoded letter (or underscore) for each coded letter in order.
+        Unlike a copy of the map, it does not include the word history.
+
+        :return: current key
+        """
+        return bytes(self._forward)
+
+    def _unbind_letters(self, coded_indices: List[int]):
+        forward = self._forward
+        reverse = self._reverse
+        for coded_index in coded_indices:
+            reverse[forward[coded_index] - _FIRST_LETTER] = _UNMATCHED
+            forward[coded_index] = _UNMATCHED
 
     def _validate_words(self,
                         coded_word: str,
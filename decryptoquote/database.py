@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+Process-wide MongoDB client for the word patterns database.
+
+A single client (and its connection pool) is created lazily in each process
+and reused for every solve. Clients are not shared across `fork()`: a forked
+child (such as a gunicorn worker) creates its own client the first time it
+needs one.
+"""
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+
+import pymongo
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+
+MONGO_HOST = os.environ.get('MONGODB_URI', 'localhost')
+DB_NAME = os.environ.get('MONGODB_NAME', 'decryptoquote')
+COLLECTION_NAME: str = 'wordpatterns'
+MAX_POOL_SIZE: int = int(os.environ.get('MONGODB_MAX_POOL_SIZE', 10))
+MIN_POOL_SIZE: int = int(os.environ.get('MONGODB_MIN_POOL_SIZE', 0))
+
+_client: Optional[pymongo.MongoClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> pymongo.MongoClient:
+    """
+    Gets this process's MongoDB client, creating it if needed.
+
+    :return: MongoDB client connected to :data:`MONGO_HOST`
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = pymongo.MongoClient(
+                    MONGO_HOST,
+                    maxPoolSize=MAX_POOL_SIZE,
+                    minPoolSize=MIN_POOL_SIZE)
+                _client_pid = pid
+    return _client
+
+
+def get_collection() -> 'Collection':
+    """
+    Gets the word patterns collection, using this process's MongoDB client.
+
+    :return: word patterns collection
+    """
+    return get_client()[DB_NAME][COLLECTION_NAME]
+
+
+def close_client() -> None:
+    """
+    Closes this process's MongoDB client, if one has been created. A new
+    client will be created the next time one is needed.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def _forget_client_after_fork() -> None:
+    # the parent's client (and its sockets) must not be used by the child
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_client_after_fork)
@@ -1,11 +1,69 @@
-import copy
-import logging
-from typing import List
+import time
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple, Union
 
+import numpy as np
+
+from decryptoquote.budget import SearchBudget
+from decryptoquote.constants import LETTERS
 from decryptoquote.cypherlettermap import CypherLetterMap
 from decryptoquote.helpers import string_to_caps_words
+from decryptoquote.patternindex import words_to_match_array
+from decryptoquote.tracing import SearchTracer
 from decryptoquote.wordpatterns import WordPatterns
 
+_FIRST_LETTER: int = ord(LETTERS[0])
+_UNMATCHED: int = ord('_')
+_LETTER_SET = frozenset(LETTERS)
+
+
+class SearchStats:
+    """
+    This class counts the work done by a :class:`Decrypter` search.
+
+    .. attribute:: nodes_visited
+
+        Number of match words added to the cypher-letter map.
+
+    .. attribute:: backtracks
+
+        Number of times the search ran out of match words for a word and
+        had to backtrack.
+
+    .. attribute:: candidate_checks
+
+        Number of match words checked against the cypher-letter map.
+
+    .. attribute:: elapsed_seconds
+
+        Total time spent searching.
+
+    .. attribute:: fetch_seconds
+
+        Time spent fetching match words from the word patterns, before
+        searching.
+    """
+
+    __slots__ = ('nodes_visited', 'backtracks', 'candidate_checks',
+                 'elapsed_seconds', 'fetch_seconds')
+
+    def __init__(self):
+        self.nodes_visited: int = 0
+        self.backtracks: int = 0
+        self.candidate_checks: int = 0
+        self.elapsed_seconds: float = 0.0
+        self.fetch_seconds: float = 0.0
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'nodes_visited={self.nodes_visited}, '
+                f'backtracks={self.backtracks}, '
+                f'candidate_checks={self.candidate_checks}, '
+                f'elapsed_seconds={self.elapsed_seconds:.6f}, '
+                f'fetch_seconds={self.fetch_seconds:.6f})')
+
+    def as_dict(self) -> Dict[str, Union[int, float]]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
 
 class Decrypter:
     """
@@ -14,11 +72,14 @@ class Decrypter:
 
     This version of backtracking search uses word pattern matches, as described
     in :class:`WordPatterns`. Decrypter determines all matches for each word in
-    the coded text. It also maintains a master index value :math:`i` and an
-    index value for each word :math:`j_x`. The algorithm works as follows:
+    the coded text. It also maintains a master index value :math:`i` (the
+    search depth) and an index value for each depth :math:`j_i`. The word
+    decoded at each depth is chosen by the word ordering (see below). The
+    algorithm works as follows:
 
-    1. Initially, set :math:`i` and all :math:`j_x` to 0
-    2. Select the "match word" :math:`j_i` for word :math:`i`
+    1. Initially, set :math:`i` and all :math:`j_x` to 0, and choose the word
+       for depth 0
+    2. Select the "match word" :math:`j_i` for the word at depth :math:`i`
     3. Check that this match word is consistent with the current cypher-letter
       map (i.e. any coded letters, if decoded in the map, should decode to the
       same letter in the match word). If it is consistent, complete the "good
@@ -29,13 +90,14 @@ class Decrypter:
         b. Increment :math:`i`
         c. If :math:`i` >= number of words in the coded text, decrypting was
            successful; return `True`.
-        d. Otherwise, return to step 2 and repeat.
+        d. Otherwise, choose the word for depth :math:`i`, return to step 2
+           and repeat.
 
     5. "Bad match" steps
 
         a. Increment :math:`j_i`
-        b. If :math:`j_i` >= number of matches for word :math:`i`, follow the
-          "backtrack" steps.
+        b. If :math:`j_i` >= number of matches for the word at depth :math:`i`,
+          follow the "backtrack" steps.
         c. Otherwise, return to step 2 and repeat.
 
     6. "Backtrack" steps
@@ -47,35 +109,213 @@ class Decrypter:
         e. If :math:`i` < 0, no decoded text can be found; return `False`.
         f. Otherwise, return to step 2 and repeat.
 
+    Only the distinct words in the coded text that contain letters are
+    searched for, so the search depth equals the number of distinct words.
+    Repeated words are decoded once, and punctuation is left out of the
+    search entirely; both are filled in when the cypher-letter map is used to
+    decode the full text.
+
+    Words can be ordered in two ways:
+
+    * :attr:`TEXT_ORDER` decodes words in the order they appear in the text.
+    * :attr:`CONSTRAINED_ORDER` chooses, at each depth, the word with the
+      fewest match words that are consistent with the current cypher-letter
+      map. Ties go to the word with the most already decoded coded letters.
+      Only the consistent match words are tried at that depth.
+
+    With forward checking, the search also keeps a list of consistent match
+    words for every word that has not been decoded yet. Each "good match"
+    removes the match words that are no longer consistent from these lists,
+    and if any list becomes empty, the match is treated as a "bad match"
+    straight away instead of when the search reaches that word. Removed match
+    words are restored when the search backtracks. This finds the same
+    solutions with fewer nodes visited.
+
+    With `max_unresolved` above 0, up to that many coded words may be left
+    unresolved, such as names that are not in the dictionary. Once every
+    match word for a word has been tried, the search may leave the word
+    unresolved instead of backtracking: the word adds nothing to the
+    cypher-letter map, so its letters are only decoded where other words
+    decode them. Words with no match words at all must be left unresolved,
+    and are scheduled after every other word. Solutions are found in passes
+    with 0, 1, 2, ... unresolved words, so that solutions with fewer
+    unresolved words come first, and a solution is only given if none of its
+    unresolved words could have been resolved. Each extra allowed word adds
+    at most one pass, and one extra branch at each depth of that pass.
+
+    Words with at least :attr:`VECTORIZE_MIN_MATCHES` match words have their
+    match words stored as a 2-D array (see
+    :func:`~decryptoquote.patternindex.words_to_match_array`). Whenever the
+    search needs the consistent match words for such a word, and there are
+    still at least that many to check, it checks all of them against the
+    cypher-letter map at once with NumPy, rather than one at a time.
+
     :param coded_text: the text to decode
     :param cypher_letter_map: CypherLetterMap to use. This map will be cleared
       before use.
     :param word_patterns: WordPatterns to use.
+    :param ordering: word ordering to use, either :attr:`TEXT_ORDER` or
+      :attr:`CONSTRAINED_ORDER`
+    :param forward_checking: whether to use forward checking
+    :param budget: limits on the search (see :class:`SearchBudget`), or
+      `None` for an unlimited search
+    :param fixed_matches: match words to use for some of the coded words,
+      such as a branch from :meth:`iter_branches`. Only solutions that decode
+      these coded words to these match words are found.
+    :param max_unresolved: maximum number of coded words that may be left
+      unresolved
+    :param tracer: tracer to record the search tree with (see
+      :class:`SearchTracer`), or `None` to not trace the search
 
     .. attribute:: cypher_letter_map
         :type: CypherLetterMap
         :value: blank CypherLetterMap
 
             The mapping from coded cypher letters to decoded letters.
+
+    .. attribute:: stats
+        :type: SearchStats
+
+            Counts of the work done by the search so far.
+
+    .. attribute:: budget_exhausted
+        :type: bool
+        :value: False
+
+            Whether the search stopped because its budget ran out. The search
+            cannot be continued after that, but :attr:`best_partial_key`
+            holds the best partial solution found.
     """
 
+    TEXT_ORDER: str = 'text'
+    CONSTRAINED_ORDER: str = 'constrained'
+    ORDERINGS: Tuple[str, ...] = (TEXT_ORDER, CONSTRAINED_ORDER)
+    VECTORIZE_MIN_MATCHES: int = 32
+
     def __init__(
         self,
         coded_text: str,
         cypher_letter_map: CypherLetterMap,
         word_patterns: WordPatterns,
+        ordering: str = TEXT_ORDER,
+        forward_checking: bool = False,
+        budget: Optional[SearchBudget] = None,
+        fixed_matches: Optional[Mapping[str, str]] = None,
+        max_unresolved: int = 0,
+        tracer: Optional[SearchTracer] = None,
     ):
+        if ordering not in self.ORDERINGS:
+            raise ValueError(f"Unknown word ordering {ordering}")
+        if max_unresolved < 0:
+            raise ValueError("max_unresolved cannot be negative")
         self.cypher_letter_map = cypher_letter_map
         self.cypher_letter_map.clear()
-        self._coded_words: List[str] = string_to_caps_words(coded_text)
+        self.stats = SearchStats()
+        self.budget_exhausted: bool = False
+        self._budget = budget
+        self._tracer: Optional[SearchTracer] = tracer
+        # deepest search depth reached so far, and the map's key there
+        self._best_depth: int = 0
+        self._best_key: bytes = self.cypher_letter_map.key()
+        self._ordering = ordering
+        self._forward_checking = forward_checking
+        self._coded_words: List[str] = []  # distinct words, text order
+        self._word_counts: List[int] = []  # occurrences of each word
+        word_indices: Dict[str, int] = {}
+        for coded_word in string_to_caps_words(coded_text):
+            if coded_word in word_indices:
+                self._word_counts[word_indices[coded_word]] += 1
+            elif not _LETTER_SET.isdisjoint(coded_word):
+                word_indices[coded_word] = len(self._coded_words)
+                self._coded_words.append(coded_word)
+                self._word_counts.append(1)
+        self._coded_letters: List[str] = [
+            "".join(_LETTER_SET.intersection(coded_word))
+            for coded_word in self._coded_words]
 
-        self._pattern_matches: List[List[str]] = []
-        for coded_word in self._coded_words:
-            matches = word_patterns.code_word_to_match_words(coded_word)
-            self._pattern_matches.append(matches)
+        fetch_start_time = time.perf_counter()
+        word_matches: Dict[str, List[str]] = \
+            word_patterns.code_words_to_match_words(self._coded_words)
+        self.stats.fetch_seconds = time.perf_counter() - fetch_start_time
+        for coded_word, match_word in (fixed_matches or {}).items():
+            coded_word, match_word = coded_word.upper(), match_word.upper()
+            if coded_word in word_matches:
+                word_matches[coded_word] = [
+                    word for word in word_matches[coded_word]
+                    if word == match_word]
+        self._pattern_matches: List[List[str]] = [
+            word_matches[coded_word] for coded_word in self._coded_words]
+        self._search_depth: int = len(self._coded_words)
+        self._setup_match_arrays(word_patterns)
+        self._max_unresolved: int = max_unresolved
+        # words with no match words, which can only be left unresolved
+        self._unmatched_words: List[int] = [
+            word_index for word_index, match_words
+            in enumerate(self._pattern_matches) if not match_words]
+        # word indices in text order, with unmatched words last
+        self._text_order: List[int] = [
+            word_index for word_index in range(len(self._coded_words))
+            if self._pattern_matches[word_index]] + self._unmatched_words
+        self._start_pass(len(self._unmatched_words))
+        if tracer is not None:
+            tracer.start(self._coded_words, ordering, forward_checking,
+                         max_unresolved)
+
+    def _start_pass(self, target_unresolved: int):
+        """
+        Resets the search, to find solutions with the given number of
+        unresolved words.
+        """
+        self.cypher_letter_map.clear()
+        self._target_unresolved: int = target_unresolved
+        # match words still consistent with the map, for forward checking
+        self._domains: List[List[str]] = list(self._pattern_matches)
+        # (word index, match words before pruning) for each match added
+        self._domain_trail: List[List[Tuple[int, List[str]]]] = []
 
-        self._word_index = 0
+        self._word_index = 0  # search depth
         self._match_indices = [0 for _ in self._coded_words]
+        self._word_order: List[int] = []  # word index at each depth
+        self._depth_matches: List[List[str]] = []  # match words at each depth
+        self._skipped: List[bool] = []  # whether each depth is unresolved
+        self._unresolved: int = 0  # unresolved words above current depth
+        if self._coded_words:
+            self._choose_next_word()
+
+    @property
+    def word_counts(self) -> Dict[str, int]:
+        """
+        The distinct coded words searched for, in the order they first appear
+        in the coded text, with the number of times each one appears.
+        """
+        return dict(zip(self._coded_words, self._word_counts))
+
+    @property
+    def best_partial_key(self) -> bytes:
+        """
+        The key (see :meth:`CypherLetterMap.key`) of the cypher-letter map at
+        the deepest point the search has reached so far. Letters that were not
+        decoded there are left as underscores.
+        """
+        return self._best_key
+
+    @property
+    def unresolved_words(self) -> List[str]:
+        """
+        The coded words left unresolved, up to the current search depth. After
+        a solution is found, these are the solution's unresolved words.
+        """
+        return [self._coded_words[self._word_order[depth]]
+                for depth, skipped in enumerate(self._skipped) if skipped]
+
+    @property
+    def word_order(self) -> List[str]:
+        """
+        The coded words in the order the search decoded them, up to the
+        current search depth.
+        """
+        return [self._coded_words[word_index]
+                for word_index in self._word_order[:self._word_index]]
 
     def decrypt(self, continue_decrypting: bool = False) -> bool:
         """
@@ -83,62 +323,161 @@ class Decrypter:
 
         The cypher-letter map can now be used to decode the Cryptoquote text.
 
-        :return: `True` if decoding was successful
+        :return: `True` if decoding was successful, or `False` if there is no
+          solution or the search's budget ran out (see
+          :attr:`budget_exhausted`)
         """
-        logging.debug("Starting new decryption...")
-        word_count: int = len(self._coded_words)
-        logging.debug(word_count)
+        start_time = time.perf_counter()
+        try:
+            return self._decrypt(continue_decrypting)
+        finally:
+            self.stats.elapsed_seconds += time.perf_counter() - start_time
+
+    def _decrypt(self, continue_decrypting: bool) -> bool:
+        if len(self._unmatched_words) > self._max_unresolved:
+            return False
+        while not self._decrypt_pass(continue_decrypting):
+            if self.budget_exhausted \
+                    or self._target_unresolved >= self._max_unresolved:
+                return False
+            self._start_pass(self._target_unresolved + 1)
+            if self._tracer is not None:
+                self._tracer.new_pass(self._target_unresolved)
+            continue_decrypting = False
+        return True
+
+    def _decrypt_pass(self, continue_decrypting: bool) -> bool:
+        word_count: int = self._search_depth
+        budget = self._budget
+        tracer = self._tracer
+        budget_check_steps: int = 0  # steps left until the budget is checked
         backtracking: bool = False
         if continue_decrypting:
-            logging.debug("Continuing after last solve")
             backtracking = self._bad_match_logic()
         while 0 <= self._word_index < word_count:
+            if budget is not None:
+                if budget_check_steps == 0:
+                    if budget.is_exhausted(self.stats.nodes_visited):
+                        self.budget_exhausted = True
+                        return False
+                    budget_check_steps = budget.CHECK_INTERVAL
+                budget_check_steps -= 1
             if backtracking:
                 backtracking = self._bad_match_logic()
             else:
-                current_match_words: List[str] = self._pattern_matches[
+                current_match_words: List[str] = self._depth_matches[
                     self._word_index]
-                if len(current_match_words) == 0:
-                    return False
-                current_match_word: str = current_match_words[
-                    self._match_indices[self._word_index]]
-
-                current_coded_word: str = self._coded_words[self._word_index]
-                if self.cypher_letter_map.does_word_coding_work(
-                    current_coded_word, current_match_word):
-                    logging.debug(
-                        f"Testing word {self._word_index} == "
-                        f"{current_match_word}, works")
-                    self._good_match_logic(current_coded_word,
-                                           current_match_word)
+                match_index: int = self._match_indices[self._word_index]
+                current_coded_word: str = self._coded_words[
+                    self._word_order[self._word_index]]
+                if match_index == len(current_match_words):
+                    # every match word was tried: leave the word unresolved
+                    if self._unresolved < self._target_unresolved:
+                        if tracer is not None:
+                            tracer.skip(self._word_index, current_coded_word)
+                        if self._good_match_logic(current_coded_word, None):
+                            continue
+                    backtracking = self._bad_match_logic()
+                    continue
+                current_match_word: str = current_match_words[match_index]
+                self.stats.candidate_checks += 1
+                works: bool = self.cypher_letter_map.does_prepared_coding_work(
+                    current_coded_word, current_match_word)
+                if tracer is not None:
+                    tracer.candidate(self._word_index, current_coded_word,
+                                     current_match_word, works)
+                if works:
+                    if not self._good_match_logic(current_coded_word,
+                                                  current_match_word):
+                        backtracking = self._bad_match_logic()
                 else:
-                    logging.debug(
-                        f"Testing word {self._word_index} == "
-                        f"{current_match_word}, doesn't work")
                     backtracking = self._bad_match_logic()
 
-        if self._word_index < 0:
-            logging.debug("decrypt failed")
-            return False
-        logging.debug("decrypt succeeded")
-        return True
+        return self._word_index >= 0
+
+    def iter_solutions(
+        self,
+        max_solutions: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """
+        Finds valid solutions for the cypher one at a time, as they are found.
+        Each solution is given as a key (see :meth:`CypherLetterMap.key`),
+        which can be turned back into a map with
+        :meth:`CypherLetterMap.from_key`.
+
+        The search only continues when the next solution is requested, so
+        stopping iteration early stops the search. If the search's budget runs
+        out, iteration stops and :attr:`budget_exhausted` is set.
+
+        :param max_solutions: maximum number of solutions to find, or `None`
+          to find all of them
+        :return: iterator of keys for valid solutions
+        """
+        for _ in self._search(max_solutions):
+            yield self.cypher_letter_map.key()
+
+    def iter_branches(self, depth: int = 1) -> Iterator[Dict[str, str]]:
+        """
+        Splits the search into independent branches, by finding every
+        consistent way to decode the first `depth` words in the word ordering.
+        Each branch can then be searched by its own decrypter, given the
+        branch as its `fixed_matches`. Every solution belongs to exactly one
+        branch.
+
+        This uses up the decrypter: it cannot be used to decrypt afterwards.
+
+        :param depth: number of words to decode in each branch
+        :return: iterator of branches, each a dictionary from coded words to
+          their match words
+        """
+        self._search_depth = min(depth, len(self._coded_words))
+        for _ in self._search(None):
+            yield {self._coded_words[self._word_order[word_depth]]:
+                   self._depth_matches[word_depth][
+                       self._match_indices[word_depth]]
+                   for word_depth in range(self._search_depth)}
+
+    def _search(self, max_solutions: Optional[int]) -> Iterator[None]:
+        """
+        Runs the search to :attr:`_search_depth`, stopping at each solution
+        until the next one is requested.
+
+        :param max_solutions: maximum number of solutions to find, or `None`
+          to find all of them
+        """
+        tracer = self._tracer
+        solution_count: int = 0
+        keep_going = max_solutions is None or max_solutions > 0
+        try:
+            if keep_going:
+                keep_going = self.decrypt()
+            while keep_going:
+                if tracer is not None:
+                    tracer.solution(self.cypher_letter_map.key(),
+                                    self.unresolved_words)
+                yield
+                solution_count += 1
+                if max_solutions is not None \
+                        and solution_count >= max_solutions:
+                    return
+                if self._search_depth == 0:
+                    return  # nothing to decode, so only one solution
+                self._remove_last_match()
+                self._word_index -= 1
+                keep_going = self.decrypt(continue_decrypting=True)
+        finally:
+            if tracer is not None:
+                tracer.end(self.stats.as_dict(), self.budget_exhausted)
 
     def decrypt_all(self) -> List[CypherLetterMap]:
         """
-        Finds all valid solutions for the cypher.
+        Finds all valid solutions for the cypher. See :meth:`iter_solutions`
+        to find solutions without keeping them all in memory.
 
         :return: list of cypher-letter maps for all valid solutions.
         """
-        logging.debug("Starting new full decryption...")
-        solutions: List[CypherLetterMap] = []
-        keep_going = self.decrypt()
-        while keep_going:
-            solution_map = copy.deepcopy(self.cypher_letter_map)
-            solutions.append(solution_map)
-            self.cypher_letter_map.remove_last_word_from_mapping()
-            self._word_index -= 1
-            keep_going = self.decrypt(continue_decrypting=True)
-        return solutions
+        return [CypherLetterMap.from_key(key)
+                for key in self.iter_solutions()]
 
     def _is_match_good(
         self,
@@ -158,20 +497,224 @@ class Decrypter:
     def _good_match_logic(
         self,
         current_coded_word: str,
-        current_match_word: str
-    ):
-        self.cypher_letter_map.add_word_to_mapping(current_coded_word,
-                                                   current_match_word)
+        current_match_word: Optional[str]
+    ) -> bool:
+        """
+        Adds a match word for the word at the current depth, or leaves the
+        word unresolved if the match word is `None`, and moves down a depth.
+
+        :return: `False` if the match was undone again, because forward
+          checking found a dead end or it completed an unwanted solution
+        """
+        self.stats.nodes_visited += 1
+        self._domain_trail.append([])
+        if current_match_word is None:
+            self._skipped.append(True)
+            self._unresolved += 1
+        else:
+            self.cypher_letter_map.add_prepared_word_to_mapping(
+                current_coded_word, current_match_word)
+            self._skipped.append(False)
+            if self._forward_checking and not self._prune_domains():
+                self._remove_last_match()
+                return False
         self._word_index += 1
+        if self._word_index == self._search_depth \
+                and not self._is_wanted_solution():
+            self._word_index -= 1
+            self._remove_last_match()
+            return False
+        if self._word_index > self._best_depth:
+            self._best_depth = self._word_index
+            self._best_key = self.cypher_letter_map.key()
+        if self._word_index < self._search_depth:
+            self._choose_next_word()
+        return True
 
     def _bad_match_logic(
         self
     ) -> bool:
         self._match_indices[self._word_index] += 1
-        match_count: int = len(self._pattern_matches[self._word_index])
-        if self._match_indices[self._word_index] >= match_count:
-            self.cypher_letter_map.remove_last_word_from_mapping()
-            self._match_indices[self._word_index] = 0
-            self._word_index -= 1
-            return True
+        match_index: int = self._match_indices[self._word_index]
+        match_count: int = len(self._depth_matches[self._word_index])
+        # one past the last match word means leaving the word unresolved
+        if match_index > match_count or (
+                match_index == match_count
+                and self._unresolved >= self._target_unresolved):
+            return self._backtrack()
         return False
+
+    def _is_wanted_solution(self) -> bool:
+        """
+        Checks that a solution has exactly the number of unresolved words
+        wanted in this pass, and that none of them could have been resolved
+        (in which case the solution is found in an earlier pass).
+        """
+        if self._unresolved != self._target_unresolved:
+            return False
+        for depth, skipped in enumerate(self._skipped):
+            if skipped:
+                word_index = self._word_order[depth]
+                if self._consistent_matches(
+                        word_index, self._pattern_matches[word_index]):
+                    return False
+        return True
+
+    def _backtrack(self) -> bool:
+        self.stats.backtracks += 1
+        if self._tracer is not None:
+            self._tracer.backtrack(self._word_index)
+        self._remove_last_match()
+        self._match_indices[self._word_index] = 0
+        self._word_order.pop()
+        self._depth_matches.pop()
+        self._word_index -= 1
+        return True
+
+    def _remove_last_match(self):
+        if not self._skipped:
+            return
+        if self._skipped.pop():
+            self._unresolved -= 1
+        else:
+            self.cypher_letter_map.remove_last_word_from_mapping()
+        for word_index, match_words in reversed(self._domain_trail.pop()):
+            self._domains[word_index] = match_words
+
+    def _setup_match_arrays(self, word_patterns: WordPatterns):
+        self._coded_to_decoded: np.ndarray = np.frombuffer(
+            self.cypher_letter_map.coded_to_decoded, dtype=np.uint8)
+        self._decoded_to_coded: np.ndarray = np.frombuffer(
+            self.cypher_letter_map.decoded_to_coded, dtype=np.uint8)
+        # match words (letter columns only) and coded letter indices
+        self._match_arrays: List[Optional[np.ndarray]] = []
+        self._coded_indices: List[Optional[np.ndarray]] = []
+        pattern_index = word_patterns.pattern_index
+        for coded_word, match_words in zip(self._coded_words,
+                                           self._pattern_matches):
+            match_array = None
+            coded_indices = None
+            if len(match_words) >= self.VECTORIZE_MIN_MATCHES:
+                letter_columns = [column
+                                  for column, letter in enumerate(coded_word)
+                                  if letter in _LETTER_SET]
+                if pattern_index is not None:
+                    match_array = pattern_index.match_array(
+                        word_patterns.word_to_pattern(coded_word))
+                else:
+                    match_array = words_to_match_array(match_words)
+                if match_array is not None:
+                    match_array = match_array[:, letter_columns]
+                    if _all_letters(match_array):
+                        coded_indices = np.array(
+                            [ord(coded_word[column]) - _FIRST_LETTER
+                             for column in letter_columns], dtype=np.intp)
+                    else:
+                        match_array = None
+            self._match_arrays.append(match_array)
+            self._coded_indices.append(coded_indices)
+
+    def _consistent_matches(
+        self,
+        word_index: int,
+        match_words: List[str]
+    ) -> List[str]:
+        """
+        Finds the given word's match words that are consistent with the
+        current cypher-letter map.
+
+        :param word_index: index of the coded word
+        :param match_words: match words to check, in pattern match order. All
+          of the word's consistent match words must be included.
+        :return: consistent match words
+        """
+        match_array = self._match_arrays[word_index]
+        if match_array is None \
+                or len(match_words) < self.VECTORIZE_MIN_MATCHES:
+            self.stats.candidate_checks += len(match_words)
+            coded_word = self._coded_words[word_index]
+            does_coding_work = self.cypher_letter_map.does_prepared_coding_work
+            return [match_word for match_word in match_words
+                    if does_coding_work(coded_word, match_word)]
+        self.stats.candidate_checks += len(match_array)
+        decoded = self._coded_to_decoded[self._coded_indices[word_index]]
+        matched = decoded != _UNMATCHED
+        # matched letters must agree, unmatched ones must not be in use yet
+        unused = self._decoded_to_coded[match_array - _FIRST_LETTER] \
+            == _UNMATCHED
+        consistent = np.where(matched, match_array == decoded, unused)
+        pattern_matches = self._pattern_matches[word_index]
+        return [pattern_matches[row] for row
+                in np.flatnonzero(consistent.all(axis=1)).tolist()]
+
+    def _prune_domains(self) -> bool:
+        """
+        Removes match words that are no longer consistent with the map from
+        the lists of words that have not been decoded yet.
+
+        :return: `False` if more words have no consistent match words left
+          than may still be left unresolved
+        """
+        chosen_words = set(self._word_order[:self._word_index + 1])
+        pruned = self._domain_trail[-1]
+        unresolved = self._unresolved
+        for word_index in range(len(self._coded_words)):
+            if word_index in chosen_words:
+                continue
+            match_words = self._domains[word_index]
+            consistent_words = self._consistent_matches(word_index,
+                                                        match_words)
+            if len(consistent_words) < len(match_words):
+                pruned.append((word_index, match_words))
+                self._domains[word_index] = consistent_words
+            if not consistent_words:
+                unresolved += 1
+                if unresolved > self._target_unresolved:
+                    return False
+        return True
+
+    def _choose_next_word(self):
+        if self._ordering == self.CONSTRAINED_ORDER:
+            word_index, match_words = self._most_constrained_word()
+        else:
+            word_index = self._text_order[self._word_index]
+            match_words = self._domains[word_index]
+            if not self._forward_checking \
+                    and self._match_arrays[word_index] is not None:
+                match_words = self._consistent_matches(word_index,
+                                                       match_words)
+        self._word_order.append(word_index)
+        self._depth_matches.append(match_words)
+
+    def _most_constrained_word(self) -> Tuple[int, List[str]]:
+        cypher_letter_map = self.cypher_letter_map
+        chosen_words = set(self._word_order)
+        unmatched_words = [word_index for word_index in self._unmatched_words
+                           if word_index not in chosen_words]
+        if len(unmatched_words) == len(self._coded_words) - len(chosen_words):
+            return unmatched_words[0], []  # only unmatched words are left
+        chosen_words.update(unmatched_words)
+        best_key = None
+        best_word = None
+        for word_index in range(len(self._coded_words)):
+            if word_index in chosen_words:
+                continue
+            if self._forward_checking:
+                match_words = self._domains[word_index]  # already consistent
+            else:
+                match_words = self._consistent_matches(
+                    word_index, self._pattern_matches[word_index])
+            key = (len(match_words),
+                   -cypher_letter_map.count_matched_letters(
+                       self._coded_letters[word_index]))
+            if best_key is None or key < best_key:
+                best_key = key
+                best_word = (word_index, match_words)
+                if not match_words:
+                    break  # dead end, no need to look further
+        return best_word
+
+
+def _all_letters(match_array: np.ndarray) -> bool:
+    return bool(((match_array >= _FIRST_LETTER)
+                 & (match_array < _FIRST_LETTER + len(LETTERS))).all())
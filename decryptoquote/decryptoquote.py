@@ -3,26 +3,145 @@
 """
 Main module.
 """
+import collections
 import os
 import logging
-from typing import List, Dict, Optional
-import pymongo
+import threading
+from typing import (Any, Callable, Deque, Dict, Iterable, Iterator, List,
+                    Mapping, Optional, Tuple, Union)
 
+from decryptoquote.annealing import AnnealingDecrypter
+from decryptoquote.batch import BatchSolver, BatchTask, TaskResult
+from decryptoquote.budget import SOLVED, BUDGET_EXHAUSTED, UNRESOLVED, \
+    SearchBudget
+from decryptoquote.cache import (SolutionCache, canonicalize,
+                                 key_from_canonical, key_to_canonical)
 from decryptoquote.cypherlettermap import CypherLetterMap
-from decryptoquote.decrypter import Decrypter
+from decryptoquote.database import (MONGO_HOST, DB_NAME, COLLECTION_NAME,
+                                    get_collection)
+from decryptoquote.decrypter import Decrypter, SearchStats
 from decryptoquote.helpers import string_to_caps_words
+from decryptoquote.ngrams import QuadgramModel
+from decryptoquote.parallel import ParallelDecrypter
+from decryptoquote.patternindex import PatternIndex
+from decryptoquote.tracing import SearchTracer
 from decryptoquote.wordpatterns import WordPatterns
 
-MONGO_HOST = os.environ.get('MONGODB_URI', 'localhost')
-DB_NAME = os.environ.get('MONGODB_NAME', 'decryptoquote')
-COLLECTION_NAME: str = 'wordpatterns'
 CORPUS_FILE: str = "words_alpha_apos.txt"
+# compiled index file to load word patterns from, instead of the database
+# (see `WordPatterns.compile_index_file`)
+INDEX_FILE: Optional[str] = os.environ.get('DECRYPTOQUOTE_INDEX_FILE')
+PATTERN_INDEX_KEY = (MONGO_HOST, DB_NAME, COLLECTION_NAME, INDEX_FILE)
+# saved quadgram model for annealing mode (see `QuadgramModel.save`); built
+# from the corpus file if not given
+QUADGRAM_FILE: Optional[str] = os.environ.get('DECRYPTOQUOTE_QUADGRAM_FILE')
+# directory to write a trace of each single-process dictionary search to,
+# and the fraction of search node events to record (see `SearchTracer`);
+# searches are not traced if no directory is given
+TRACE_DIR: Optional[str] = os.environ.get('DECRYPTOQUOTE_TRACE_DIR')
+TRACE_SAMPLE_RATE: float = float(
+    os.environ.get('DECRYPTOQUOTE_TRACE_SAMPLE_RATE', 1.0))
 
-logging.basicConfig(
-    filename='decryptoquote.log',
-    filemode='w',
-    format='%(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG)
+# search for solutions with every word in the dictionary (see `Decrypter`)
+DICTIONARY_MODE: str = 'dictionary'
+# search for the most English-like decoding (see `AnnealingDecrypter`)
+ANNEALING_MODE: str = 'annealing'
+MODES: Tuple[str, ...] = (DICTIONARY_MODE, ANNEALING_MODE)
+
+# solutions of recent puzzles, by canonical coded quote (see `canonicalize`)
+solution_cache = SolutionCache(
+    max_size=int(os.environ.get('SOLUTION_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('SOLUTION_CACHE_TTL', 3600)))
+
+_word_patterns_prepared: bool = False
+_word_patterns_lock = threading.Lock()
+_quadgram_model: Optional[QuadgramModel] = None
+_quadgram_model_lock = threading.Lock()
+_solve_listeners: List[Callable[['SolveReport'], None]] = []
+
+# a puzzle for `decrypt_many`: a coded quote, or a dictionary with a
+# `coded_quote`, and optionally a `coded_author` and `add_words`
+Puzzle = Union[str, Mapping[str, Any]]
+# (coded quote, coded author, words to add)
+_ParsedPuzzle = Tuple[str, Optional[str], Tuple[str, ...]]
+
+
+class SolveReport:
+    """
+    This class describes one finished call to a decrypting function, for
+    solve listeners (see :func:`add_solve_listener`).
+
+    .. attribute:: mode
+        :type: str
+
+            The search used, `DICTIONARY_MODE` or `ANNEALING_MODE`.
+
+    .. attribute:: status
+        :type: Optional[str]
+
+            The status of the last solution given, or `None` if no solution
+            was given.
+
+    .. attribute:: solution_count
+        :type: int
+
+            Number of solutions given, including any partial solution.
+
+    .. attribute:: stats
+        :type: Optional[SearchStats]
+
+            Counts of the work done by the search, or `None` if the solutions
+            came from the solution cache.
+
+    .. attribute:: cached
+        :type: bool
+
+            Whether the solutions came from the solution cache.
+    """
+
+    __slots__ = ('mode', 'status', 'solution_count', 'stats', 'cached')
+
+    def __init__(self,
+                 mode: str,
+                 status: Optional[str],
+                 solution_count: int,
+                 stats: Optional[SearchStats],
+                 cached: bool):
+        self.mode: str = mode
+        self.status: Optional[str] = status
+        self.solution_count: int = solution_count
+        self.stats: Optional[SearchStats] = stats
+        self.cached: bool = cached
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'mode={self.mode!r}, '
+                f'status={self.status!r}, '
+                f'solution_count={self.solution_count}, '
+                f'stats={self.stats!r}, '
+                f'cached={self.cached})')
+
+
+def add_solve_listener(listener: Callable[[SolveReport], None]) -> None:
+    """
+    Adds a function to call with a :class:`SolveReport` after each call to
+    a decrypting function finishes, or stops early. Listeners run in the
+    thread that called the decrypting function, and any exception they
+    raise is logged and ignored.
+
+    :param listener: function to call
+    """
+    _solve_listeners.append(listener)
+
+
+def remove_solve_listener(listener: Callable[[SolveReport], None]) -> None:
+    """
+    Removes a function added with :func:`add_solve_listener`.
+
+    :param listener: function to remove
+    :raises ValueError: if the function was not added
+    """
+    _solve_listeners.remove(listener)
 
 
 def decrypt_quote_fully(
@@ -31,6 +150,16 @@ def decrypt_quote_fully(
     add_words: Optional[List[str]] = None,
     show_cypher: bool = False,
     rebuild_patterns: bool = False,
+    ordering: str = Decrypter.TEXT_ORDER,
+    forward_checking: bool = False,
+    max_solutions: Optional[int] = None,
+    budget: Optional[SearchBudget] = None,
+    workers: int = 1,
+    use_cache: bool = True,
+    mode: str = DICTIONARY_MODE,
+    max_unresolved: int = 0,
+    seed: Optional[int] = None,
+    restarts: int = AnnealingDecrypter.DEFAULT_RESTARTS,
 ) -> List[Dict[str, str]]:
     """
     Decrypts the Cryptoquote puzzle, finding all valid solutions.
@@ -44,33 +173,97 @@ def decrypt_quote_fully(
       decoded puzzle text.
     :param rebuild_patterns: Whether to rebuild the saved word patterns file
       from the text corpus file
+    :param ordering: The order in which words are decoded: either
+      `Decrypter.TEXT_ORDER` or `Decrypter.CONSTRAINED_ORDER` (see
+      :class:`Decrypter`)
+    :param forward_checking: Whether the search should use forward checking
+      (see :class:`Decrypter`)
+    :param max_solutions: The maximum number of solutions to find, or `None`
+      to find all of them
+    :param budget: Limits on the search (see :class:`SearchBudget`), or
+      `None` for an unlimited search
+    :param workers: The number of processes to search with. If more than 1,
+      the search is split between worker processes (see
+      :class:`ParallelDecrypter`)
+    :param use_cache: Whether to use (and store) cached solutions for
+      puzzles that are the same up to relabelling of the coded letters, and
+      were solved with the same search settings (see
+      :data:`solution_cache`). Annealing mode only uses the cache when a
+      `seed` is given, for the same coded letters.
+    :param mode: The search to use: `DICTIONARY_MODE` to find solutions
+      where every word is in the dictionary, or `ANNEALING_MODE` to find the
+      single most English-like decoding, even if some words are not in the
+      dictionary (see :class:`AnnealingDecrypter`). Annealing mode ignores
+      `add_words`, `rebuild_patterns`, `ordering`, `forward_checking`,
+      `workers` and `max_unresolved`, and dictionary mode ignores `seed`
+      and `restarts`.
+    :param max_unresolved: The maximum number of quote words that may be
+      left unresolved in dictionary mode, such as names that are not in the
+      dictionary (see :class:`Decrypter`). Solutions with fewer unresolved
+      words are found first. Cannot be used with more than 1 worker.
+    :param seed: The seed for annealing mode's random number generator, or
+      `None` to seed it randomly. Annealing searches with the same seed and
+      settings give the same solution, unless their budget runs out.
+    :param restarts: The number of times annealing mode restarts its search
+      from a random key (see :class:`AnnealingDecrypter`)
     :return: list of all valid puzzle solutions,
       or an empty list if no solution is found.
+      If the budget runs out, the solutions found so far are followed by the
+      best partial solution, with its status set to `'budget_exhausted'` and
+      its coding key always included. Solutions with unresolved words have
+      their status set to `'unresolved'` and their coding key always
+      included.
       Solutions use the following schema:
 
       {
         decoded_quote: [decoded quote],
         decoded_author: [decoded author, or None if no coded author given],
-        coding_key: [solution's coding key]
+        coding_key: [solution's coding key],
+        status: ['solved', 'unresolved', or 'budget_exhausted' for a
+                 partial solution]
       }
     """
-    decrypter = _setup_decryption(add_words, coded_quote, rebuild_patterns)
-    solution_maps = decrypter.decrypt_all()
-    solutions = []
-    for s_map in solution_maps:
-        decoded_quote = s_map.decode(coded_quote)
-        logging.debug(f"{decoded_quote=}")
-        decoded_author = s_map.decode(coded_author) \
-            if coded_author is not None \
-            else ""
-        keystring = s_map.keystring() if show_cypher else None
-        solution = {
-            'decoded_quote': decoded_quote,
-            'decoded_author': decoded_author,
-            'coding_key': keystring
-        }
-        solutions.append(solution)
-    return solutions
+    return list(decrypt_quote_iter(
+        coded_quote, coded_author, add_words, show_cypher, rebuild_patterns,
+        ordering, forward_checking, max_solutions, budget, workers,
+        use_cache, mode, max_unresolved, seed, restarts))
+
+
+def decrypt_quote_iter(
+    coded_quote: str,
+    coded_author: Optional[str] = None,
+    add_words: Optional[List[str]] = None,
+    show_cypher: bool = False,
+    rebuild_patterns: bool = False,
+    ordering: str = Decrypter.TEXT_ORDER,
+    forward_checking: bool = False,
+    max_solutions: Optional[int] = None,
+    budget: Optional[SearchBudget] = None,
+    workers: int = 1,
+    use_cache: bool = True,
+    mode: str = DICTIONARY_MODE,
+    max_unresolved: int = 0,
+    seed: Optional[int] = None,
+    restarts: int = AnnealingDecrypter.DEFAULT_RESTARTS,
+) -> Iterator[Dict[str, str]]:
+    """
+    Decrypts the Cryptoquote puzzle, giving each valid solution as soon as it
+    is found. The search only continues when the next solution is requested,
+    so solutions are never all held in memory, and stopping iteration early
+    stops the search.
+
+    The parameters and solution schema are the same as for
+    :func:`decrypt_quote_fully`. If the budget runs out, the last solution
+    given is the best partial solution.
+
+    :return: iterator of valid puzzle solutions
+    """
+    for key, status in _solve_keys(
+            coded_quote, add_words, rebuild_patterns, ordering,
+            forward_checking, max_solutions, budget, workers, use_cache,
+            mode, max_unresolved, seed, restarts):
+        yield _key_to_solution(key, coded_quote, coded_author, "",
+                               show_cypher or status != SOLVED, status)
 
 
 def decrypt_quote(
@@ -79,6 +272,15 @@ def decrypt_quote(
     add_words: Optional[List[str]] = None,
     show_cypher: bool = False,
     rebuild_patterns: bool = False,
+    ordering: str = Decrypter.TEXT_ORDER,
+    forward_checking: bool = False,
+    budget: Optional[SearchBudget] = None,
+    workers: int = 1,
+    use_cache: bool = True,
+    mode: str = DICTIONARY_MODE,
+    max_unresolved: int = 0,
+    seed: Optional[int] = None,
+    restarts: int = AnnealingDecrypter.DEFAULT_RESTARTS,
 ) -> List[Dict[str, str]]:
     """
     Decrypts the Cryptoquote puzzle, stopping at the first valid solution.
@@ -92,55 +294,517 @@ def decrypt_quote(
       decoded puzzle text.
     :param rebuild_patterns: Whether to rebuild the saved word patterns file
       from the text corpus file
+    :param ordering: The order in which words are decoded: either
+      `Decrypter.TEXT_ORDER` or `Decrypter.CONSTRAINED_ORDER` (see
+      :class:`Decrypter`)
+    :param forward_checking: Whether the search should use forward checking
+      (see :class:`Decrypter`)
+    :param budget: Limits on the search (see :class:`SearchBudget`), or
+      `None` for an unlimited search
+    :param workers: The number of processes to search with. If more than 1,
+      the search is split between worker processes (see
+      :class:`ParallelDecrypter`)
+    :param use_cache: Whether to use (and store) cached solutions for
+      puzzles that are the same up to relabelling of the coded letters (see
+      :data:`solution_cache`)
+    :param mode: The search to use, either `DICTIONARY_MODE` or
+      `ANNEALING_MODE` (see :func:`decrypt_quote_fully`)
+    :param max_unresolved: The maximum number of quote words that may be
+      left unresolved in dictionary mode (see :func:`decrypt_quote_fully`)
+    :param seed: The seed for annealing mode (see
+      :func:`decrypt_quote_fully`)
+    :param restarts: The number of restarts for annealing mode (see
+      :func:`decrypt_quote_fully`)
     :return: single element list containing the first valid solution,
       or an empty list if no solution is found.
+      If the budget runs out first, the list instead contains the best
+      partial solution, with its status set to `'budget_exhausted'` and its
+      coding key always included. If the solution has unresolved words, its
+      status is set to `'unresolved'` and its coding key always included.
       Solutions use the following schema:
 
       {
         decoded_quote: [decoded quote],
         decoded_author: [decoded author, or None if no coded author given],
-        coding_key: [solution's coding key]
+        coding_key: [solution's coding key],
+        status: ['solved', 'unresolved', or 'budget_exhausted' for a
+                 partial solution]
       }
     """
-    decrypter = _setup_decryption(add_words, coded_quote, rebuild_patterns)
-    success = decrypter.decrypt()
-    logging.debug(f"{success=}")
-    cypher_letter_map = decrypter.cypher_letter_map
-    cl_map_string = cypher_letter_map.keystring() if show_cypher else None
-    if success:
-        decoded_quote = cypher_letter_map.decode(coded_quote)
-        logging.debug(f"{decoded_quote=}")
-        decoded_author = cypher_letter_map.decode(coded_author) \
-            if coded_author is not None \
-            else None
-        solution = {
-            'decoded_quote': decoded_quote,
-            'decoded_author': decoded_author,
-            'coding_key': cl_map_string
-        }
-        return [solution]
-    else:
-        return []
+    return [_key_to_solution(key, coded_quote, coded_author, None,
+                             show_cypher or status != SOLVED, status)
+            for key, status in _solve_keys(
+                coded_quote, add_words, rebuild_patterns, ordering,
+                forward_checking, 1, budget, workers, use_cache, mode,
+                max_unresolved, seed, restarts)]
+
+
+def decrypt_many(
+    puzzles: Iterable[Puzzle],
+    mode: str = DICTIONARY_MODE,
+    workers: Optional[int] = None,
+    max_solutions: Optional[int] = 1,
+    timeout: Optional[float] = None,
+    max_nodes: Optional[int] = None,
+    show_cypher: bool = False,
+    ordering: str = Decrypter.TEXT_ORDER,
+    forward_checking: bool = False,
+    max_unresolved: int = 0,
+    index_file: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Decrypts a batch of Cryptoquote puzzles over a pool of worker processes,
+    sharing the setup between them.
+
+    The dictionary is loaded once, and each worker process is sent only the
+    words matching the patterns of the batch's coded words (or the quadgram
+    model, in annealing mode), once, when it starts. Puzzles that are the
+    same up to relabelling of the coded letters, with the same `add_words`,
+    are only solved once. Each puzzle gets its own budget, starting when a
+    worker starts on it, and a puzzle that fails or runs out of budget does
+    not affect the others (see :class:`BatchSolver`).
+
+    Unlike :func:`decrypt_quote`, a puzzle's `add_words` are only used for
+    that puzzle, and are not saved to the database. The solution cache is not
+    used.
+
+    :param puzzles: The puzzles: each one either a coded quote, or a
+      dictionary with a `coded_quote`, and optionally a `coded_author` and a
+      list of `add_words`
+    :param mode: The search to use, either `DICTIONARY_MODE` or
+      `ANNEALING_MODE` (see :func:`decrypt_quote_fully`)
+    :param workers: The number of processes to search with, or `None` to use
+      one per CPU. With 1, puzzles are solved in this process.
+    :param max_solutions: The maximum number of solutions to find for each
+      puzzle, or `None` to find all of them
+    :param timeout: The number of seconds each puzzle's search may run for,
+      or `None` for no time limit
+    :param max_nodes: The maximum number of nodes each puzzle's search may
+      visit, or `None` for no node limit
+    :param show_cypher: Whether the puzzle cypher should be added to the
+      decoded puzzle text.
+    :param ordering: The order in which words are decoded (see
+      :class:`Decrypter`)
+    :param forward_checking: Whether the search should use forward checking
+      (see :class:`Decrypter`)
+    :param max_unresolved: The maximum number of quote words that may be
+      left unresolved in dictionary mode (see :func:`decrypt_quote_fully`)
+    :param index_file: A compiled index file to load the dictionary from,
+      without using the database (see `WordPatterns.compile_index_file`), or
+      `None` to use :data:`INDEX_FILE` if set, or else the database
+    :return: list of results, in the same order as the puzzles.
+      Results use the following schema:
+
+      {
+        solutions: [list of solutions, as for :func:`decrypt_quote_fully`],
+        error: [description of the error that stopped the puzzle from
+                being solved, or None]
+      }
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}")
+    parsed_puzzles = [_try_parse_puzzle(puzzle) for puzzle in puzzles]
+    # puzzle tasks, and the letters to map each solution back with
+    tasks: Dict[BatchTask, None] = {}
+    puzzle_tasks: List[Optional[Tuple[BatchTask, str]]] = []
+    for parsed, error in parsed_puzzles:
+        if parsed is None:
+            puzzle_tasks.append(None)
+            continue
+        coded_quote, _, add_words = parsed
+        canonical_quote, letters = canonicalize(coded_quote)
+        task = (canonical_quote, tuple(sorted(set(add_words))))
+        tasks.setdefault(task)
+        puzzle_tasks.append((task, letters))
+    pattern_index = None
+    if mode == DICTIONARY_MODE:
+        pattern_index = _batch_pattern_index(
+            (task[0] for task in tasks), index_file)
+    task_results = dict(zip(tasks, _solve_tasks(
+        tasks, mode, pattern_index, workers, max_solutions, timeout,
+        max_nodes, ordering, forward_checking, max_unresolved)))
+    results = []
+    for (parsed, error), puzzle_task in zip(parsed_puzzles, puzzle_tasks):
+        if puzzle_task is None:
+            results.append({'solutions': [], 'error': error})
+            continue
+        task, letters = puzzle_task
+        results.append(_task_result_to_result(
+            task_results[task], parsed, letters, show_cypher))
+    return results
+
+
+def iter_decrypt_many(
+    puzzles: Iterable[Puzzle],
+    mode: str = DICTIONARY_MODE,
+    workers: Optional[int] = None,
+    max_solutions: Optional[int] = 1,
+    timeout: Optional[float] = None,
+    max_nodes: Optional[int] = None,
+    show_cypher: bool = False,
+    ordering: str = Decrypter.TEXT_ORDER,
+    forward_checking: bool = False,
+    max_unresolved: int = 0,
+    max_pending: Optional[int] = None,
+    index_file: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Decrypts a stream of Cryptoquote puzzles over a pool of worker
+    processes, giving each puzzle's result as soon as it and every earlier
+    puzzle are solved. Puzzles are only read as fast as results are taken,
+    at most `max_pending` ahead, so memory use does not grow with the number
+    of puzzles.
+
+    The parameters and result schema are the same as for
+    :func:`decrypt_many`, but, since the puzzles are not known in advance,
+    each worker process is sent the whole dictionary, and repeated puzzles
+    are solved again.
+
+    :param max_pending: The maximum number of puzzles read but not yet given
+      back as results, or `None` for 4 per worker
+    :return: iterator of results, in the same order as the puzzles
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}")
+    pattern_index = None
+    if mode == DICTIONARY_MODE:
+        pattern_index = _load_pattern_index(index_file)
+    # the results are matched up with the puzzles they came from, so only
+    # the pending puzzles are kept
+    pending: Deque[Tuple[Optional[_ParsedPuzzle], Optional[str]]] = \
+        collections.deque()
+
+    def read_tasks() -> Iterator[Optional[BatchTask]]:
+        for puzzle in puzzles:
+            parsed, error = _try_parse_puzzle(puzzle)
+            pending.append((parsed, error))
+            yield (parsed[0], parsed[2]) if parsed is not None else None
+
+    for task_result in _solve_tasks(
+            read_tasks(), mode, pattern_index, workers, max_solutions,
+            timeout, max_nodes, ordering, forward_checking, max_unresolved,
+            max_pending):
+        parsed, error = pending.popleft()
+        if task_result is None:
+            yield {'solutions': [], 'error': error}
+        else:
+            yield _task_result_to_result(task_result, parsed, None,
+                                         show_cypher)
+
+
+def prepare_word_patterns(rebuild_patterns: bool = False) -> WordPatterns:
+    """
+    Prepares the word patterns database for decrypting: creates the
+    collection's indexes, and rebuilds the word patterns from the corpus file
+    if the collection is empty.
+
+    This only needs to run once, ideally when the application starts. The
+    decrypting functions run it automatically if it has not run yet.
+
+    :param rebuild_patterns: Whether to rebuild the saved word patterns even
+      if the collection is not empty
+    :return: WordPatterns for the prepared collection
+    """
+    global _word_patterns_prepared
+    with _word_patterns_lock:
+        word_patterns = _create_word_patterns()
+        word_patterns.create_indexes()
+        if rebuild_patterns or word_patterns.is_empty():
+            word_patterns = _create_word_patterns(overwrite_patterns=True)
+        _word_patterns_prepared = True
+    return word_patterns
+
+
+def get_quadgram_model() -> QuadgramModel:
+    """
+    Gets the quadgram model used in annealing mode, loading it the first time
+    it is needed: from :data:`QUADGRAM_FILE` if set, otherwise from the
+    corpus file.
+
+    :return: shared quadgram model
+    """
+    global _quadgram_model
+    with _quadgram_model_lock:
+        if _quadgram_model is None:
+            if QUADGRAM_FILE is not None:
+                _quadgram_model = QuadgramModel.load(QUADGRAM_FILE)
+            else:
+                _quadgram_model = QuadgramModel.from_corpus(
+                    os.path.join(os.path.dirname(__file__), CORPUS_FILE))
+    return _quadgram_model
 
 
-def _setup_decryption(add_words, coded_quote, rebuild_patterns):
+def _create_word_patterns(overwrite_patterns: bool = False) -> WordPatterns:
     corpus_file_path = os.path.join(
         os.path.dirname(__file__), CORPUS_FILE)
-    cypher_letter_map = CypherLetterMap()
-    client = pymongo.MongoClient(MONGO_HOST)
-    collection = client[DB_NAME][COLLECTION_NAME]
-    if collection.estimated_document_count() == 0:
-        rebuild_patterns = True
-    word_patterns = WordPatterns(
-        collection,
-        overwrite_patterns=rebuild_patterns,
-        corpus_file_path=corpus_file_path)
+    return WordPatterns(
+        get_collection(),
+        overwrite_patterns=overwrite_patterns,
+        corpus_file_path=corpus_file_path,
+        index_key=PATTERN_INDEX_KEY,
+        index_file=INDEX_FILE)
+
+
+def _key_to_solution(key: bytes,
+                     coded_quote: str,
+                     coded_author: Optional[str],
+                     no_author: Optional[str],
+                     show_cypher: bool,
+                     status: str) -> Dict[str, str]:
+    s_map = CypherLetterMap.from_key(key)
+    decoded_quote = s_map.decode(coded_quote)
+    decoded_author = s_map.decode(coded_author) \
+        if coded_author is not None \
+        else no_author
+    keystring = s_map.keystring() if show_cypher else None
+    return {
+        'decoded_quote': decoded_quote,
+        'decoded_author': decoded_author,
+        'coding_key': keystring,
+        'status': status
+    }
+
+
+def _solve_keys(coded_quote, add_words, rebuild_patterns, ordering,
+                forward_checking, max_solutions, budget, workers,
+                use_cache, mode, max_unresolved, seed,
+                restarts) -> Iterator[Tuple[bytes, str]]:
+    """
+    Finds solution keys for the coded quote, followed by the best partial key
+    if the budget runs out, using and filling the solution cache.
+
+    :return: iterator of (key, status) pairs
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}")
+    if max_unresolved > 0 and workers > 1 and mode == DICTIONARY_MODE:
+        raise ValueError("Unresolved words are not supported with more than "
+                         "1 worker")
+    word_patterns = None
+    index_version = None
+    if mode == DICTIONARY_MODE:
+        word_patterns = _setup_word_patterns(add_words, rebuild_patterns)
+        index_version = word_patterns.pattern_index.version
+    cache_key = None
+    letters = None
+    # an unseeded annealing search is random, so its result is not cached
+    if use_cache and (mode == DICTIONARY_MODE or seed is not None):
+        canonical_quote, letters = canonicalize(coded_quote)
+        if mode == DICTIONARY_MODE:
+            cache_key = (mode, canonical_quote, index_version, max_solutions,
+                         max_unresolved, ordering, forward_checking,
+                         workers > 1)
+        else:
+            # a seeded search's path depends on the coded letters themselves
+            cache_key = (mode, canonical_quote, letters, max_solutions,
+                         seed, restarts)
+        cached_solutions = solution_cache.get(cache_key)
+        if cached_solutions is not None:
+            for canonical_key, status in cached_solutions:
+                yield key_from_canonical(canonical_key, letters), status
+            _report_solve(SolveReport(
+                mode, cached_solutions[-1][1] if cached_solutions else None,
+                len(cached_solutions), None, True))
+            return
+    tracer = None
+    if TRACE_DIR is not None and mode == DICTIONARY_MODE and workers <= 1:
+        tracer = SearchTracer.in_directory(TRACE_DIR, TRACE_SAMPLE_RATE)
+    try:
+        yield from _search_keys(coded_quote, word_patterns, ordering,
+                                forward_checking, max_solutions, budget,
+                                workers, mode, max_unresolved, seed,
+                                restarts, tracer, cache_key, letters)
+    finally:
+        if tracer is not None:
+            tracer.close()
+
+
+def _search_keys(coded_quote, word_patterns, ordering, forward_checking,
+                 max_solutions, budget, workers, mode, max_unresolved, seed,
+                 restarts, tracer, cache_key,
+                 letters) -> Iterator[Tuple[bytes, str]]:
+    """
+    Searches for solution keys for the coded quote, followed by the best
+    partial key if the budget runs out, and caches the solutions under the
+    cache key, if given.
+
+    :return: iterator of (key, status) pairs
+    """
+    if mode == ANNEALING_MODE:
+        decrypter = AnnealingDecrypter(coded_quote, get_quadgram_model(),
+                                       restarts, budget=budget, seed=seed)
+    else:
+        decrypter = _setup_decryption(word_patterns, coded_quote, ordering,
+                                      forward_checking, budget, workers,
+                                      max_unresolved, tracer)
+    solutions: List[Tuple[bytes, str]] = []
+    try:
+        for key in decrypter.iter_solutions(max_solutions):
+            # only a single-process dictionary search leaves words unresolved
+            status = UNRESOLVED \
+                if max_unresolved > 0 and mode == DICTIONARY_MODE \
+                and decrypter.unresolved_words else SOLVED
+            solutions.append((key, status))
+            yield key, status
+        if decrypter.budget_exhausted:
+            solutions.append((decrypter.best_partial_key, BUDGET_EXHAUSTED))
+            yield decrypter.best_partial_key, BUDGET_EXHAUSTED
+        elif cache_key is not None:
+            solution_cache.put(cache_key, tuple(
+                (key_to_canonical(key, letters), status)
+                for key, status in solutions))
+    finally:
+        _report_solve(SolveReport(
+            mode, solutions[-1][1] if solutions else None, len(solutions),
+            decrypter.stats, False))
+
+
+def _report_solve(report: SolveReport) -> None:
+    for listener in list(_solve_listeners):
+        try:
+            listener(report)
+        except Exception:
+            logging.exception("Solve listener %r failed", listener)
+
+
+def _try_parse_puzzle(
+    puzzle: Puzzle
+) -> Tuple[Optional[_ParsedPuzzle], Optional[str]]:
+    """
+    Reads a puzzle given to :func:`decrypt_many`.
+
+    :return: the puzzle's coded quote, coded author and words to add, or
+      `None` and a description of what is wrong with the puzzle
+    """
+    if isinstance(puzzle, str):
+        return (puzzle, None, ()), None
+    if not isinstance(puzzle, Mapping):
+        return None, f"Puzzle must be a string or a mapping, not {puzzle!r}"
+    coded_quote = puzzle.get('coded_quote')
+    coded_author = puzzle.get('coded_author')
+    add_words = puzzle.get('add_words')
+    if add_words is None:
+        add_words = ()
+    if not isinstance(coded_quote, str):
+        return None, "Puzzle has no coded_quote"
+    if coded_author is not None and not isinstance(coded_author, str):
+        return None, "Puzzle's coded_author must be a string"
+    if not isinstance(add_words, (list, tuple)) \
+            or not all(isinstance(word, str) for word in add_words):
+        return None, "Puzzle's add_words must be a list of strings"
+    return (coded_quote, coded_author,
+            tuple(word.upper() for word in add_words if word)), None
+
+
+def _load_pattern_index(index_file: Optional[str]) -> PatternIndex:
+    """
+    Gets the shared pattern index for batch decrypting, from the index file
+    if given (or set as :data:`INDEX_FILE`), otherwise from the database.
+    """
+    index_file = index_file or INDEX_FILE
+    if index_file is None:
+        return _setup_word_patterns(None, False).pattern_index
+    return WordPatterns(
+        None,
+        index_key=(MONGO_HOST, DB_NAME, COLLECTION_NAME, index_file),
+        index_file=index_file).pattern_index
+
+
+def _batch_pattern_index(coded_quotes: Iterable[str],
+                         index_file: Optional[str]) -> PatternIndex:
+    """
+    Creates a pattern index of only the words matching the patterns of the
+    coded quotes' words.
+    """
+    full_index = _load_pattern_index(index_file)
+    patterns = {WordPatterns.word_to_pattern(coded_word)
+                for coded_quote in coded_quotes
+                for coded_word in string_to_caps_words(coded_quote)}
+    return PatternIndex({pattern: full_index.match_words(pattern)
+                         for pattern in patterns}, full_index.version)
+
+
+def _solve_tasks(tasks, mode, pattern_index, workers, max_solutions,
+                 timeout, max_nodes, ordering, forward_checking,
+                 max_unresolved,
+                 max_pending=None) -> Iterator[Optional[TaskResult]]:
+    """
+    Solves batch tasks with a :class:`BatchSolver`, reporting each solve.
+
+    :return: iterator of task results, in the same order as the tasks
+    """
+    solver = BatchSolver(
+        pattern_index,
+        get_quadgram_model() if mode == ANNEALING_MODE else None,
+        workers, ordering, forward_checking, max_solutions, max_unresolved,
+        timeout, max_nodes)
+    for task_result in solver.solve(tasks, max_pending):
+        if task_result is not None and task_result[1] is not None:
+            solutions, stats_dict, _ = task_result
+            stats = SearchStats()
+            for name, value in stats_dict.items():
+                setattr(stats, name, value)
+            _report_solve(SolveReport(
+                mode, solutions[-1][1] if solutions else None,
+                len(solutions), stats, False))
+        yield task_result
+
+
+def _task_result_to_result(task_result: TaskResult,
+                           parsed: _ParsedPuzzle,
+                           letters: Optional[str],
+                           show_cypher: bool) -> Dict[str, Any]:
+    """
+    Converts a batch task result into a :func:`decrypt_many` result.
+
+    :param letters: coded letters to map the solution keys back with, if
+      the task's quote was canonicalized (see :func:`key_from_canonical`)
+    """
+    solutions, _, error = task_result
+    coded_quote, coded_author, _ = parsed
+    return {
+        'solutions': [
+            _key_to_solution(
+                key_from_canonical(key, letters)
+                if letters is not None else key,
+                coded_quote, coded_author, None,
+                show_cypher or status != SOLVED, status)
+            for key, status in solutions],
+        'error': error,
+    }
+
+
+def _setup_word_patterns(add_words, rebuild_patterns) -> WordPatterns:
+    if rebuild_patterns or not _word_patterns_prepared:
+        word_patterns = prepare_word_patterns(rebuild_patterns)
+    else:
+        word_patterns = _create_word_patterns()
     if add_words:
         word_patterns.add_new_words(add_words)
+    return word_patterns
+
+
+def _setup_decryption(word_patterns, coded_quote, ordering, forward_checking,
+                      budget=None, workers=1, max_unresolved=0,
+                      tracer=None):
+    cypher_letter_map = CypherLetterMap()
+    if workers > 1:
+        return ParallelDecrypter(
+            coded_quote,
+            word_patterns,
+            workers,
+            ordering,
+            forward_checking,
+            budget)
     decrypter = Decrypter(
         coded_quote,
         cypher_letter_map,
-        word_patterns)
+        word_patterns,
+        ordering,
+        forward_checking,
+        budget,
+        max_unresolved=max_unresolved,
+        tracer=tracer)
     return decrypter
 
 
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compiled, memory-mapped pattern index files.
+
+An index file holds the same data as a :class:`PatternIndex` in a compact
+binary form that can be opened with :mod:`mmap`, so that loading it takes
+almost no time, lookups read straight from the mapped pages, and forked
+worker processes share those pages. The layout (all integers are unsigned
+32-bit little-endian) is:
+
+* header: magic bytes, format version, pattern count, word count, size of
+  the pattern key blob, size of the word blob, and a CRC-32 checksum of
+  everything after the header
+* pattern table: for each pattern, sorted by pattern key, the key's offset
+  and length in the key blob, and the index and count of its words in the
+  word table
+* key blob: all pattern keys, ASCII encoded
+* word table: offset of each word in the word blob, plus the blob's size
+* word blob: all words, UTF-8 encoded, grouped by pattern
+"""
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from decryptoquote.patternindex import LayeredPatternIndex, PatternIndex
+
+MAGIC: bytes = b'DQPINDEX'
+FORMAT_VERSION: int = 1
+
+_HEADER = struct.Struct('<8s6I')
+_PATTERN_ENTRY = struct.Struct('<4I')
+_OFFSET = struct.Struct('<I')
+
+
+class IndexFileError(ValueError):
+    """
+    Raised when an index file is not a valid index file, has an unsupported
+    format version, or fails its checksum.
+    """
+
+
+def write_index_file(path: str,
+                     word_patterns: Iterable[Tuple[str, str]]) -> None:
+    """
+    Compiles (word, pattern) pairs into an index file. Duplicate words are
+    only indexed once. The file is written to a temporary file first and
+    then moved into place, so readers never see a partly written file.
+
+    :param path: path of the index file to write
+    :param word_patterns: (word, pattern) pairs to index
+    """
+    patterns: Dict[str, Dict[str, None]] = {}
+    for word, pattern in word_patterns:
+        patterns.setdefault(pattern, {})[word] = None
+    keys: List[bytes] = []
+    entries: List[bytes] = []
+    offsets: List[bytes] = []
+    words: List[bytes] = []
+    key_offset = 0
+    word_offset = 0
+    word_count = 0
+    for pattern in sorted(patterns, key=lambda x: x.encode('ascii')):
+        key = pattern.encode('ascii')
+        entries.append(_PATTERN_ENTRY.pack(
+            key_offset, len(key), word_count, len(patterns[pattern])))
+        keys.append(key)
+        key_offset += len(key)
+        for word in patterns[pattern]:
+            encoded_word = word.encode('utf-8')
+            offsets.append(_OFFSET.pack(word_offset))
+            words.append(encoded_word)
+            word_offset += len(encoded_word)
+            word_count += 1
+    offsets.append(_OFFSET.pack(word_offset))
+    body = b"".join(entries + keys + offsets + words)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(patterns), word_count,
+                          key_offset, word_offset, zlib.crc32(body))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory,
+                                                  suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(header)
+            file.write(body)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class MappedPatternIndex(PatternIndex):
+    """
+    This class is a :class:`PatternIndex` read from a memory-mapped index
+    file (see :func:`write_index_file`). Each pattern's words are decoded
+    the first time they are looked up, and :meth:`match_array` gives arrays
+    that read straight from the mapped file.
+
+    :param path: path of the index file
+    :param version: version number of this index
+    :param verify: whether to check the file's checksum when opening it.
+      An index that is pickled, to send it to another process, is opened
+      there again from its path.
+    :raises IndexFileError: if the file is not a valid index file
+    """
+
+    __slots__ = ('_path', '_buffer', '_pattern_count', '_keys_start',
+                 '_offsets_start', '_words_start', '_match_words')
+
+    def __init__(self, path: str, version: int = 0, verify: bool = True):
+        with open(path, 'rb') as file:
+            try:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                raise IndexFileError(f"{path} is empty")
+        if len(buffer) < _HEADER.size:
+            raise IndexFileError(f"{path} is too short to be an index file")
+        (magic, format_version, pattern_count, word_count, keys_size,
+         words_size, checksum) = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise IndexFileError(f"{path} is not an index file")
+        if format_version != FORMAT_VERSION:
+            raise IndexFileError(
+                f"{path} has unsupported format version {format_version}")
+        entries_size = pattern_count * _PATTERN_ENTRY.size
+        offsets_size = (word_count + 1) * _OFFSET.size
+        if len(buffer) != _HEADER.size + entries_size + keys_size \
+                + offsets_size + words_size:
+            raise IndexFileError(f"{path} has the wrong size")
+        if verify and zlib.crc32(
+                memoryview(buffer)[_HEADER.size:]) != checksum:
+            raise IndexFileError(f"{path} failed its checksum")
+
+        self._path: str = path
+        self._buffer: mmap.mmap = buffer
+        self._version: int = version
+        self._word_count: int = word_count
+        self._pattern_count: int = pattern_count
+        self._keys_start: int = _HEADER.size + entries_size
+        self._offsets_start: int = self._keys_start + keys_size
+        self._words_start: int = self._offsets_start + offsets_size
+        self._match_words: Dict[str, Tuple[str, ...]] = {}
+        self._match_arrays: Dict[str, Optional[np.ndarray]] = {}
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'path={self._path!r}, '
+                f'patterns={self._pattern_count}, '
+                f'words={self._word_count}, '
+                f'version={self._version})')
+
+    def __reduce__(self):
+        # a memory map cannot be pickled, so the file is opened again instead
+        return self.__class__, (self._path, self._version)
+
+    def __len__(self):
+        return self._pattern_count
+
+    def __contains__(self, pattern):
+        return self._find_pattern(pattern) is not None
+
+    def match_words(self, pattern: str) -> Tuple[str, ...]:
+        try:
+            return self._match_words[pattern]
+        except KeyError:
+            pass
+        word_range = self._find_pattern(pattern)
+        match_words: Tuple[str, ...] = ()
+        if word_range is not None:
+            first_word, count = word_range
+            offsets = [self._words_start + self._word_offset(index)
+                       for index in range(first_word, first_word + count + 1)]
+            match_words = tuple(
+                self._buffer[start:end].decode('utf-8')
+                for start, end in zip(offsets, offsets[1:]))
+        self._match_words[pattern] = match_words
+        return match_words
+
+    def match_array(self, pattern: str) -> Optional[np.ndarray]:
+        try:
+            return self._match_arrays[pattern]
+        except KeyError:
+            pass
+        match_array = None
+        word_range = self._find_pattern(pattern)
+        if word_range is not None:
+            first_word, count = word_range
+            start = self._word_offset(first_word)
+            end = self._word_offset(first_word + count)
+            word_length = len(pattern.split("."))
+            # every character takes one byte only if the words are ASCII
+            if end - start == word_length * count:
+                match_array = np.frombuffer(
+                    self._buffer, dtype=np.uint8, count=end - start,
+                    offset=self._words_start + start,
+                ).reshape(count, word_length)
+        self._match_arrays[pattern] = match_array
+        return match_array
+
+    def with_word_patterns(
+        self,
+        word_patterns: Iterable[Tuple[str, str]]
+    ) -> PatternIndex:
+        """
+        Creates a new index containing this index's words and the given
+        words, with the given words on top of this index rather than copying
+        it (see :class:`LayeredPatternIndex`). The new index's version is one
+        higher than this index's version.
+
+        :param word_patterns: (word, pattern) pairs to add
+        :return: new index
+        """
+        patterns: Dict[str, List[str]] = {}
+        for word, pattern in word_patterns:
+            patterns.setdefault(pattern, []).append(word)
+        return LayeredPatternIndex(self, patterns, self._version + 1)
+
+    def _pattern_entry(self, index: int) -> Tuple[int, int, int, int]:
+        return _PATTERN_ENTRY.unpack_from(
+            self._buffer, _HEADER.size + index * _PATTERN_ENTRY.size)
+
+    def _pattern_key(self, index: int) -> bytes:
+        key_offset, key_length, _, _ = self._pattern_entry(index)
+        start = self._keys_start + key_offset
+        return self._buffer[start:start + key_length]
+
+    def _word_offset(self, index: int) -> int:
+        return _OFFSET.unpack_from(
+            self._buffer, self._offsets_start + index * _OFFSET.size)[0]
+
+    def _find_pattern(self, pattern: str) -> Optional[Tuple[int, int]]:
+        """
+        Finds a pattern in the pattern table.
+
+        :param pattern: pattern to find
+        :return: index of the pattern's first word in the word table, and its
+          number of words, or `None` if the pattern is not in the file
+        """
+        try:
+            key = pattern.encode('ascii')
+        except UnicodeEncodeError:
+            return None
+        low, high = 0, self._pattern_count
+        while low < high:  # binary search of the sorted pattern keys
+            middle = (low + high) // 2
+            if self._pattern_key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._pattern_count or self._pattern_key(low) != key:
+            return None
+        _, _, first_word, count = self._pattern_entry(low)
+        return first_word, count
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+"""
+Background solve jobs, run by a bounded pool of threads in this process.
+
+Jobs are only known to the process that created them, so a web app using
+them should run in a single process (for example, one gunicorn worker with
+several threads).
+"""
+import concurrent.futures
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from decryptoquote.budget import CancellationToken, SearchBudget
+
+JOB_QUEUED: str = 'queued'
+JOB_RUNNING: str = 'running'
+JOB_DONE: str = 'done'
+JOB_FAILED: str = 'failed'
+JOB_CANCELLED: str = 'cancelled'
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while the job queue is full.
+    """
+
+
+class Job:
+    """
+    This class holds the state of one solve job.
+
+    .. attribute:: id
+        :type: str
+
+            Unique id of the job.
+
+    .. attribute:: status
+        :type: str
+
+            One of :data:`JOB_QUEUED`, :data:`JOB_RUNNING`, :data:`JOB_DONE`,
+            :data:`JOB_FAILED` or :data:`JOB_CANCELLED`.
+
+    .. attribute:: solutions
+        :type: Optional[List[Dict[str, str]]]
+
+            The solve's solutions, once the job is done.
+
+    .. attribute:: error
+        :type: Optional[str]
+
+            Description of the error, if the job failed.
+
+    .. attribute:: started
+        :type: Optional[float]
+
+            Time the job started running, or `None` if it has not (or never
+            ran, because it was cancelled while queued).
+    """
+
+    __slots__ = ('id', 'status', 'solutions', 'error', 'submitted',
+                 'started', 'finished', 'cancel_token', '_done_event')
+
+    def __init__(self):
+        self.id: str = uuid.uuid4().hex
+        self.status: str = JOB_QUEUED
+        self.solutions: Optional[List[Dict[str, str]]] = None
+        self.error: Optional[str] = None
+        self.submitted: float = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancel_token = CancellationToken()
+        self._done_event = threading.Event()
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'id={self.id!r}, '
+                f'status={self.status!r})')
+
+    @property
+    def is_finished(self) -> bool:
+        return self._done_event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the job to finish.
+
+        :param timeout: maximum time to wait in seconds, or `None` to wait
+          until the job finishes
+        :return: `True` if the job has finished
+        """
+        return self._done_event.wait(timeout)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Gets the job's state, in a form that can be sent as JSON.
+
+        :return: dictionary with the job's id, status, solutions and error
+        """
+        return {
+            'id': self.id,
+            'status': self.status,
+            'solutions': self.solutions,
+            'error': self.error,
+        }
+
+    def _finish(self, status: str) -> None:
+        self.status = status
+        self.finished = time.time()
+        self._done_event.set()
+
+
+class JobManager:
+    """
+    This class runs solve jobs in the background, using a bounded pool of
+    worker threads.
+
+    At most `max_queue` jobs may be waiting or running at once; submitting
+    another raises :exc:`QueueFullError`, so callers can ask clients to try
+    again later. Each job gets a :class:`SearchBudget` with a deadline
+    `timeout` seconds after it was submitted, so a job that waits in the queue
+    for a long time has less time to run. Finished jobs are kept for
+    `retention` seconds so that their results can be fetched.
+
+    :param workers: number of worker threads
+    :param max_queue: maximum number of unfinished jobs
+    :param timeout: seconds from submission until each job's deadline, or
+      `None` for no deadline
+    :param retention: seconds to keep finished jobs
+    :param listener: function to call with each job once it finishes, or
+      `None`. It is called in the job's worker thread, and any exception it
+      raises is logged and ignored.
+    """
+
+    def __init__(self,
+                 workers: int = 2,
+                 max_queue: int = 16,
+                 timeout: Optional[float] = None,
+                 retention: float = 600,
+                 listener: Optional[Callable[[Job], None]] = None):
+        self.max_queue: int = max_queue
+        self.timeout: Optional[float] = timeout
+        self.retention: float = retention
+        self.listener: Optional[Callable[[Job], None]] = listener
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='solve-job')
+        self._jobs: Dict[str, Job] = {}
+        self._unfinished: int = 0
+        self._lock = threading.Lock()
+
+    def submit(self,
+               solve: Callable[..., List[Dict[str, str]]],
+               *args,
+               **kwargs) -> Job:
+        """
+        Submits a solve job. The job calls `solve(*args, **kwargs)`, with the
+        job's :class:`SearchBudget` added as the `budget` keyword argument.
+
+        :param solve: solve function, such as :func:`decrypt_quote`
+        :return: new job
+        :raises QueueFullError: if the job queue is full
+        """
+        job = Job()
+        with self._lock:
+            self._remove_expired_jobs()
+            if self._unfinished >= self.max_queue:
+                raise QueueFullError(
+                    f"Job queue is full ({self.max_queue} jobs)")
+            self._unfinished += 1
+            self._jobs[job.id] = job
+        deadline = job.submitted + self.timeout \
+            if self.timeout is not None else None
+        budget = SearchBudget(deadline, cancel_token=job.cancel_token)
+        try:
+            self._executor.submit(self._run_job, job, solve, args,
+                                  dict(kwargs, budget=budget))
+        except RuntimeError:  # executor shut down
+            self._finish_job(job, JOB_FAILED, error="Job manager shut down")
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Gets a job by its id.
+
+        :param job_id: job id
+        :return: job, or `None` if no such job exists (or it has expired)
+        """
+        with self._lock:
+            self._remove_expired_jobs()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a job. A running job stops at its next budget check, and
+        keeps the best partial solution found so far.
+
+        :param job_id: job id
+        :return: `True` if the job exists and had not finished
+        """
+        job = self.get(job_id)
+        if job is None or job.is_finished:
+            return False
+        job.cancel_token.cancel()
+        return True
+
+    @property
+    def unfinished_jobs(self) -> int:
+        """
+        Number of jobs that are waiting or running.
+        """
+        return self._unfinished
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Cancels all unfinished jobs and stops the worker threads.
+
+        :param wait: whether to wait for running jobs to stop
+        """
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel_token.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def _run_job(self, job: Job, solve, args, kwargs) -> None:
+        if job.cancel_token.cancelled:
+            self._finish_job(job, JOB_CANCELLED)
+            return
+        job.status = JOB_RUNNING
+        job.started = time.time()
+        try:
+            solutions = solve(*args, **kwargs)
+        except Exception as error:
+            logging.exception(f"Solve job {job.id} failed")
+            self._finish_job(job, JOB_FAILED, error=str(error))
+        else:
+            status = JOB_CANCELLED if job.cancel_token.cancelled else JOB_DONE
+            self._finish_job(job, status, solutions)
+
+    def _finish_job(self,
+                    job: Job,
+                    status: str,
+                    solutions: Optional[List[Dict[str, str]]] = None,
+                    error: Optional[str] = None) -> None:
+        with self._lock:
+            job.solutions = solutions
+            job.error = error
+            job._finish(status)
+            self._unfinished -= 1
+        if self.listener is not None:
+            try:
+                self.listener(job)
+            except Exception:
+                logging.exception(f"Job listener failed for job {job.id}")
+
+    def _remove_expired_jobs(self) -> None:
+        # call with self._lock held
+        expiry = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished is not None and job.finished < expiry]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Prometheus metrics for solves and solve jobs, for the web app's `/metrics`
+endpoint. This needs the `prometheus_client` package.
+
+The solve metrics come from the solver's own counters: :func:`install` adds
+a solve listener (see :func:`add_solve_listener`) that records each
+:class:`SolveReport`, and :func:`observe_job` is meant to be the
+:class:`JobManager`'s job listener.
+
+If the ``PROMETHEUS_MULTIPROC_DIR`` environment variable is set before this
+module is imported (`gunicorn.conf.py` sets it), each process writes its
+metrics to files in that directory, and :func:`render` adds up the metrics
+of every process, so that any worker can answer for all of them.
+"""
+import os
+import threading
+from typing import Optional, Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+from decryptoquote.budget import BUDGET_EXHAUSTED
+from decryptoquote.decryptoquote import (DICTIONARY_MODE, SolveReport,
+                                         add_solve_listener)
+from decryptoquote.jobs import Job
+
+MULTIPROCESS_DIR_VARIABLE: str = 'PROMETHEUS_MULTIPROC_DIR'
+# status label of solves that gave no solution
+NO_SOLUTION: str = 'no_solution'
+
+_LATENCY_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10,
+                    20, 30, 60)
+
+REQUEST_SECONDS = Histogram(
+    'decryptoquote_request_seconds',
+    "Time taken to handle each request",
+    ['endpoint'], buckets=_LATENCY_BUCKETS)
+JOB_QUEUE_SECONDS = Histogram(
+    'decryptoquote_job_queue_seconds',
+    "Time each solve job waited in the queue before running",
+    buckets=_LATENCY_BUCKETS)
+SOLVE_SECONDS = Histogram(
+    'decryptoquote_solve_seconds',
+    "Search time of each solve that was not answered from the cache",
+    ['mode'], buckets=_LATENCY_BUCKETS)
+CANDIDATE_FETCH_SECONDS = Histogram(
+    'decryptoquote_candidate_fetch_seconds',
+    "Time taken to fetch the match words of each dictionary solve",
+    buckets=_LATENCY_BUCKETS)
+SOLUTIONS = Histogram(
+    'decryptoquote_solutions',
+    "Number of solutions given by each solve",
+    buckets=(0, 1, 2, 5, 10, 50, 100, 1000))
+SOLVES = Counter(
+    'decryptoquote_solves',
+    "Solves, by mode and the status of their last solution",
+    ['mode', 'status'])
+TIMEOUTS = Counter(
+    'decryptoquote_timeouts',
+    "Solves stopped by their budget (deadline, node limit or cancellation)",
+    ['mode'])
+CACHE_HITS = Counter(
+    'decryptoquote_cache_hits',
+    "Solves answered from the solution cache",
+    ['mode'])
+SEARCH_NODES = Counter(
+    'decryptoquote_search_nodes',
+    "Search nodes visited by solves",
+    ['mode'])
+JOBS = Counter(
+    'decryptoquote_jobs',
+    "Finished solve jobs, by status",
+    ['status'])
+
+_installed: bool = False
+_install_lock = threading.Lock()
+
+
+def install() -> None:
+    """
+    Starts recording solve metrics, by adding :func:`observe_solve` as a
+    solve listener. Only the first call has any effect.
+    """
+    global _installed
+    with _install_lock:
+        if not _installed:
+            add_solve_listener(observe_solve)
+            _installed = True
+
+
+def observe_solve(report: SolveReport) -> None:
+    """
+    Records the metrics of a finished solve.
+
+    :param report: report of the solve
+    """
+    SOLVES.labels(report.mode, report.status or NO_SOLUTION).inc()
+    SOLUTIONS.observe(report.solution_count)
+    if report.status == BUDGET_EXHAUSTED:
+        TIMEOUTS.labels(report.mode).inc()
+    if report.cached:
+        CACHE_HITS.labels(report.mode).inc()
+    if report.stats is not None:
+        SOLVE_SECONDS.labels(report.mode).observe(
+            report.stats.elapsed_seconds)
+        SEARCH_NODES.labels(report.mode).inc(report.stats.nodes_visited)
+        if report.mode == DICTIONARY_MODE:
+            CANDIDATE_FETCH_SECONDS.observe(report.stats.fetch_seconds)
+
+
+def observe_job(job: Job) -> None:
+    """
+    Records the metrics of a finished solve job.
+
+    :param job: finished job
+    """
+    JOBS.labels(job.status).inc()
+    if job.started is not None:
+        JOB_QUEUE_SECONDS.observe(job.started - job.submitted)
+
+
+def observe_request(endpoint: Optional[str], seconds: float) -> None:
+    """
+    Records the time taken to handle a request.
+
+    :param endpoint: name of the request's endpoint, or `None` if no route
+      matched it
+    :param seconds: time taken
+    """
+    REQUEST_SECONDS.labels(endpoint or 'none').observe(seconds)
+
+
+def render() -> Tuple[bytes, str]:
+    """
+    Renders the current metrics in the Prometheus text format, adding up
+    every process's metrics in multiprocess mode.
+
+    :return: metrics text, and its content type
+    """
+    if os.environ.get(MULTIPROCESS_DIR_VARIABLE):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
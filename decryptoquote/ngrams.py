@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+Letter quadgram language model, used to score how much a decoded text looks
+like English.
+
+Texts are scored one word at a time. Each word's letters are padded with a
+word boundary symbol on both sides (and on the right again, up to four
+symbols), so "THE" gives the quadgrams " THE" and "THE ", and "A" gives
+" A  ". Characters other than letters, such as apostrophes, are left out.
+"""
+import math
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from decryptoquote.constants import LETTERS
+from decryptoquote.wordpatterns import read_corpus
+
+ALPHABET_SIZE: int = len(LETTERS) + 1  # letters, then the word boundary
+BOUNDARY: int = len(LETTERS)
+QUADGRAM_COUNT: int = ALPHABET_SIZE ** 4
+# weights of each symbol in a quadgram, for finding its place in the table
+PLACE_VALUES = np.array([ALPHABET_SIZE ** 3, ALPHABET_SIZE ** 2,
+                         ALPHABET_SIZE, 1], dtype=np.intp)
+
+_FIRST_LETTER: int = ord(LETTERS[0])
+
+
+def word_symbols(word: str) -> List[int]:
+    """
+    Converts a word into padded symbols, as described above.
+
+    :param word: word to convert
+    :return: list of symbols, where 0 to 25 stand for "A" to "Z" and
+      :data:`BOUNDARY` for the word boundary, or an empty list if the word has
+      no letters
+    """
+    letters = [ord(character) - _FIRST_LETTER for character in word.upper()
+               if character in LETTERS]
+    if not letters:
+        return []
+    symbols = [BOUNDARY] + letters + [BOUNDARY]
+    return symbols + [BOUNDARY] * (4 - len(symbols))
+
+
+def text_quadgrams(text: str) -> np.ndarray:
+    """
+    Lists the quadgrams of every word in the text.
+
+    :param text: text to split, with words separated by whitespace
+    :return: array with one row of four symbols (see :func:`word_symbols`)
+      for each quadgram
+    """
+    quadgrams = []
+    for word in text.split():
+        symbols = word_symbols(word)
+        quadgrams.extend(symbols[start:start + 4]
+                         for start in range(len(symbols) - 3))
+    return np.array(quadgrams, dtype=np.intp).reshape(-1, 4)
+
+
+class QuadgramModel:
+    """
+    This class holds the base-10 log probability of every quadgram of letters
+    and word boundaries, as a flat, read-only array of `float32` values with
+    one entry per quadgram (see :data:`PLACE_VALUES`). Quadgrams that were
+    never seen get a small floor probability.
+
+    :param table: array of :data:`QUADGRAM_COUNT` log probabilities
+    :raises ValueError: if the table has the wrong shape
+    """
+
+    __slots__ = ('table',)
+
+    def __init__(self, table: np.ndarray):
+        if table.shape != (QUADGRAM_COUNT,):
+            raise ValueError(f"Quadgram table must have shape "
+                             f"({QUADGRAM_COUNT},), not {table.shape}")
+        table = np.asarray(table, dtype=np.float32)
+        table.flags.writeable = False
+        self.table: np.ndarray = table
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'floor={float(self.table.min()):.3f})')
+
+    @classmethod
+    def from_word_ranks(cls,
+                        word_ranks: Iterable[Tuple[str, int]],
+                        floor_count: float = 1e-4) -> 'QuadgramModel':
+        """
+        Builds a model from ranked words, such as those from
+        :func:`read_corpus`. Each word's quadgrams are counted with weight
+        `1 / (rank + 1)`, which follows Zipf's law for word frequencies.
+
+        :param word_ranks: (word, rank) pairs, where rank 0 is the most
+          common word
+        :param floor_count: count given to quadgrams that were never seen
+        :return: new model
+        """
+        counts = np.zeros(QUADGRAM_COUNT, dtype=np.float64)
+        for word, rank in word_ranks:
+            symbols = word_symbols(word)
+            if symbols:
+                quadgrams = np.lib.stride_tricks.sliding_window_view(
+                    np.array(symbols, dtype=np.intp), 4)
+                np.add.at(counts, quadgrams @ PLACE_VALUES, 1 / (rank + 1))
+        total = counts.sum()
+        if total == 0:
+            raise ValueError("No words to build a quadgram model from")
+        floor = math.log10(floor_count / total)
+        with np.errstate(divide='ignore'):
+            table = np.where(counts > 0, np.log10(counts / total), floor)
+        return cls(table)
+
+    @classmethod
+    def from_corpus(cls, corpus_file_path: str) -> 'QuadgramModel':
+        """
+        Builds a model from a language corpus file (see :func:`read_corpus`).
+
+        :param corpus_file_path: path to language corpus file
+        :return: new model
+        :exception OSError if corpus file is invalid
+        """
+        return cls.from_word_ranks(read_corpus(corpus_file_path))
+
+    @classmethod
+    def load(cls, path: str) -> 'QuadgramModel':
+        """
+        Loads a model saved with :meth:`save`. The file is memory-mapped
+        rather than read into memory.
+
+        :param path: path of a `.npy` file
+        :return: loaded model
+        """
+        return cls(np.load(path, mmap_mode='r'))
+
+    def save(self, path: str) -> None:
+        """
+        Saves the model's table as a `.npy` file.
+
+        :param path: path of the file to write
+        """
+        np.save(path, self.table)
+
+    def score(self, text: str) -> float:
+        """
+        Scores a text. Higher scores are more like the text the model was
+        built from.
+
+        :param text: text to score
+        :return: sum of the log probabilities of the text's quadgrams
+        """
+        quadgrams = text_quadgrams(text)
+        return float(self.table[quadgrams @ PLACE_VALUES].sum(
+            dtype=np.float64))
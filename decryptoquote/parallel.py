@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parallel search, splitting the search tree over several processes.
+"""
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import queue
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from decryptoquote.budget import CancellationToken, SearchBudget
+from decryptoquote.cypherlettermap import CypherLetterMap
+from decryptoquote.decrypter import Decrypter, SearchStats
+from decryptoquote.patternindex import (PatternIndex,
+                                        get_shared_index,
+                                        invalidate_shared_index)
+from decryptoquote.wordpatterns import WordPatterns
+
+_WORKER_INDEX_KEY = ('decryptoquote.parallel', 'worker')
+_POLL_SECONDS: float = 0.05  # how often the budget is checked while waiting
+
+# set in each worker process by _init_worker
+_worker_cancel_event = None
+_worker_solution_queue = None
+
+# (number of solutions sent, stats, budget exhausted, best partial key)
+_BranchResult = Tuple[int, Dict[str, float], bool, bytes]
+
+
+class ParallelDecrypter:
+    """
+    This class performs the same search as :class:`Decrypter`, but splits it
+    over several worker processes.
+
+    The search is split into independent branches with
+    :meth:`Decrypter.iter_branches`, by decoding the `split_depth` most
+    constrained words in every consistent way, whatever the word ordering.
+    Each branch is then searched by a :class:`Decrypter` in a worker process,
+    which sends back each solution as soon as it finds it. Once enough
+    solutions have been found, or the budget runs out, the remaining
+    branches are cancelled. Solutions found before the budget ran out are
+    still given.
+
+    The pattern index is sent to each worker process once, when the process
+    starts, rather than with every branch.
+
+    :param coded_text: the text to decode
+    :param word_patterns: WordPatterns to use. It must use a pattern index
+      (see :class:`WordPatterns`).
+    :param workers: number of worker processes, or `None` to use one per CPU
+    :param ordering: word ordering to use (see :class:`Decrypter`)
+    :param forward_checking: whether to use forward checking
+    :param budget: limits on the search (see :class:`SearchBudget`), or
+      `None` for an unlimited search. The node limit applies to each branch
+      separately.
+    :param split_depth: number of words to decode when splitting the search
+
+    .. attribute:: stats
+        :type: SearchStats
+
+            Counts of the work done by the search so far, over all branches.
+
+    .. attribute:: budget_exhausted
+        :type: bool
+        :value: False
+
+            Whether the search stopped because its budget ran out.
+    """
+
+    def __init__(
+        self,
+        coded_text: str,
+        word_patterns: WordPatterns,
+        workers: Optional[int] = None,
+        ordering: str = Decrypter.CONSTRAINED_ORDER,
+        forward_checking: bool = False,
+        budget: Optional[SearchBudget] = None,
+        split_depth: int = 1,
+    ):
+        pattern_index = word_patterns.pattern_index
+        if pattern_index is None:
+            raise ValueError("Parallel search needs a pattern index")
+        if ordering not in Decrypter.ORDERINGS:
+            raise ValueError(f"Unknown word ordering {ordering}")
+        self.stats = SearchStats()
+        self.budget_exhausted: bool = False
+        self._coded_text = coded_text
+        self._word_patterns = word_patterns
+        self._pattern_index: PatternIndex = pattern_index
+        self._workers: int = workers or os.cpu_count() or 1
+        self._ordering = ordering
+        self._forward_checking = forward_checking
+        self._budget = budget if budget is not None else SearchBudget()
+        self._split_depth = split_depth
+        self._best_key: bytes = CypherLetterMap().key()
+
+    @property
+    def best_partial_key(self) -> bytes:
+        """
+        The key of the partial solution with the most decoded letters found
+        by any branch whose budget ran out. See
+        :attr:`Decrypter.best_partial_key`.
+        """
+        return self._best_key
+
+    def iter_solutions(
+        self,
+        max_solutions: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """
+        Finds valid solutions for the cypher, as keys (see
+        :meth:`CypherLetterMap.key`). Solutions are given in the order they
+        are found, and each solution is only given once.
+
+        :param max_solutions: maximum number of solutions to find, or `None`
+          to find all of them. Use 1 to stop at the first solution.
+        :return: iterator of keys for valid solutions
+        """
+        if max_solutions is not None and max_solutions <= 0:
+            return
+        # splitting on the most constrained words gives the most even
+        # branches; each branch is still searched in the chosen ordering
+        branches: List[Dict[str, str]] = list(Decrypter(
+            self._coded_text, CypherLetterMap(), self._word_patterns,
+            Decrypter.CONSTRAINED_ORDER, self._forward_checking,
+        ).iter_branches(self._split_depth))
+        logging.debug(f"Searching {len(branches)} branches")
+        if not branches:
+            return
+
+        context = multiprocessing.get_context()
+        cancel_event = context.Event()
+        solution_queue = context.Queue()
+        found_keys: Set[bytes] = set()
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(self._workers, len(branches)),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._pattern_index, cancel_event, solution_queue),
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _solve_branch, self._coded_text, branch, self._ordering,
+                    self._forward_checking, max_solutions,
+                    self._budget.deadline, self._budget.max_nodes)
+                for branch in branches}
+            try:
+                for key in self._receive_solutions(futures, solution_queue,
+                                                   cancel_event):
+                    if key not in found_keys:
+                        found_keys.add(key)
+                        yield key
+                        if max_solutions is not None \
+                                and len(found_keys) >= max_solutions:
+                            return
+            finally:
+                # stop any branches still running, and drop the rest
+                cancel_event.set()
+                for future in futures:
+                    future.cancel()
+
+    def decrypt_all(self) -> List[bytes]:
+        """
+        Finds all valid solutions for the cypher.
+
+        :return: list of keys for all valid solutions
+        """
+        return list(self.iter_solutions())
+
+    def _receive_solutions(
+        self,
+        futures: Set[concurrent.futures.Future],
+        solution_queue,
+        cancel_event,
+    ) -> Iterator[bytes]:
+        """
+        Gives the solutions sent back by the branches as they arrive, until
+        every branch has finished and all of their solutions have arrived.
+        If the budget runs out, the branches still running are stopped, and
+        the solutions they have already found are still given.
+
+        :param futures: futures of the branches that have not finished yet.
+          Finished branches are removed from it.
+        :return: iterator of solution keys, possibly with duplicates
+        """
+        sent_count = 0  # solutions sent by the branches that have finished
+        received_count = 0
+        while futures or received_count < sent_count:
+            if futures and self._budget.is_exhausted(0):
+                self.budget_exhausted = True
+                cancel_event.set()
+                for future in futures:
+                    future.cancel()
+                concurrent.futures.wait(futures)
+            done = {future for future in futures if future.done()}
+            futures.difference_update(done)
+            for future in done:
+                if not future.cancelled():
+                    sent_count += self._add_result(future.result())
+            try:
+                key = solution_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            received_count += 1
+            yield key
+
+    def _add_result(self, result: _BranchResult) -> int:
+        sent_count, stats, budget_exhausted, best_key = result
+        for name, value in stats.items():
+            setattr(self.stats, name, getattr(self.stats, name) + value)
+        if budget_exhausted:
+            self.budget_exhausted = True
+            if _decoded_count(best_key) > _decoded_count(self._best_key):
+                self._best_key = best_key
+        return sent_count
+
+
+def _decoded_count(key: bytes) -> int:
+    return len(key) - key.count(b'_')
+
+
+def _init_worker(pattern_index: PatternIndex, cancel_event,
+                 solution_queue) -> None:
+    global _worker_cancel_event, _worker_solution_queue
+    _worker_cancel_event = cancel_event
+    _worker_solution_queue = solution_queue
+    # solutions left unread after the search stops must not keep the worker
+    # from exiting
+    solution_queue.cancel_join_thread()
+    invalidate_shared_index(_WORKER_INDEX_KEY)
+    get_shared_index(_WORKER_INDEX_KEY, lambda version: pattern_index)
+
+
+def _solve_branch(
+    coded_text: str,
+    branch: Dict[str, str],
+    ordering: str,
+    forward_checking: bool,
+    max_solutions: Optional[int],
+    deadline: Optional[float],
+    max_nodes: Optional[int],
+) -> _BranchResult:
+    budget = SearchBudget(deadline, max_nodes,
+                          CancellationToken(_worker_cancel_event))
+    decrypter = Decrypter(
+        coded_text, CypherLetterMap(),
+        WordPatterns(None, index_key=_WORKER_INDEX_KEY),
+        ordering, forward_checking, budget, branch)
+    sent_count = 0
+    for key in decrypter.iter_solutions(max_solutions):
+        _worker_solution_queue.put(key)
+        sent_count += 1
+    return (sent_count, decrypter.stats.as_dict(),
+            decrypter.budget_exhausted, decrypter.best_partial_key)
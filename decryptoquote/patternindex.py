@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-memory pattern indexes, shared by every search in a process.
+
+Shared indexes and their version numbers are kept per process: publishing
+or invalidating an index only affects the process that does it. To see
+changes made to the word store by other processes (see
+:meth:`WordPatterns.add_new_words`), a word store can keep its own version
+number, which every change increases. Each process checks it every
+:data:`STORE_CHECK_SECONDS` (see :func:`get_shared_index`), and reloads its
+index once the word store has changed.
+"""
+import threading
+import time
+from typing import (Callable, Dict, Hashable, Iterable, Mapping, Optional,
+                    Sequence, Tuple)
+
+import numpy as np
+
+
+class PatternIndex:
+    """
+    This class is an immutable, in-memory index from word patterns (as
+    described in :meth:`WordPatterns.word_to_pattern`) to the words matching
+    each pattern.
+
+    An index is loaded once from a word store (such as the MongoDB collection
+    used by :class:`WordPatterns`) and can then be shared read-only by every
+    :class:`Decrypter` in the process. Indexes are never changed in place:
+    adding words creates a new index with a higher version number, which is
+    then published with :func:`publish_shared_index`.
+
+    Each pattern's words are also available as a 2-D array (see
+    :func:`words_to_match_array`), built the first time it is requested.
+
+    :param patterns: mapping from each pattern to its matching words
+    :param version: version number of this index
+    """
+
+    __slots__ = ('_patterns', '_version', '_word_count', '_match_arrays')
+
+    def __init__(self,
+                 patterns: Mapping[str, Iterable[str]],
+                 version: int = 0) -> None:
+        self._patterns: Dict[str, Tuple[str, ...]] = {
+            pattern: tuple(words) for pattern, words in patterns.items()}
+        self._version: int = version
+        self._word_count: int = sum(
+            len(words) for words in self._patterns.values())
+        self._match_arrays: Dict[str, Optional[np.ndarray]] = {}
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'patterns={len(self._patterns)}, '
+                f'words={self._word_count}, '
+                f'version={self._version})')
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def __contains__(self, pattern):
+        return pattern in self._patterns
+
+    @classmethod
+    def from_word_patterns(cls,
+                           word_patterns: Iterable[Tuple[str, str]],
+                           version: int = 0) -> 'PatternIndex':
+        """
+        Builds an index from (word, pattern) pairs. Duplicate words are only
+        indexed once.
+
+        :param word_patterns: (word, pattern) pairs to index
+        :param version: version number of the new index
+        :return: new index
+        """
+        patterns: Dict[str, Dict[str, None]] = {}
+        for word, pattern in word_patterns:
+            patterns.setdefault(pattern, {})[word] = None
+        return cls(patterns, version)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def word_count(self) -> int:
+        return self._word_count
+
+    def match_words(self, pattern: str) -> Tuple[str, ...]:
+        """
+        Gets all indexed words matching the given pattern.
+
+        :param pattern: given word pattern
+        :return: matching words, or an empty tuple if no matches exist
+        """
+        return self._patterns.get(pattern, ())
+
+    def match_array(self, pattern: str) -> Optional[np.ndarray]:
+        """
+        Gets all indexed words matching the given pattern as a 2-D array, with
+        rows in the same order as :meth:`match_words`. See
+        :func:`words_to_match_array`.
+
+        :param pattern: given word pattern
+        :return: array of matching words, or `None` if there are no matching
+          words or they cannot be stored as an array
+        """
+        try:
+            return self._match_arrays[pattern]
+        except KeyError:
+            match_array = words_to_match_array(self.match_words(pattern))
+            self._match_arrays[pattern] = match_array
+            return match_array
+
+    def with_word_patterns(
+        self,
+        word_patterns: Iterable[Tuple[str, str]]
+    ) -> 'PatternIndex':
+        """
+        Creates a new index containing this index's words and the given words.
+        The new index's version is one higher than this index's version.
+
+        :param word_patterns: (word, pattern) pairs to add
+        :return: new index
+        """
+        patterns: Dict[str, Tuple[str, ...]] = dict(self._patterns)
+        for word, pattern in word_patterns:
+            words = patterns.get(pattern, ())
+            if word not in words:
+                patterns[pattern] = words + (word,)
+        return self.__class__(patterns, self._version + 1)
+
+
+class LayeredPatternIndex(PatternIndex):
+    """
+    This class is a :class:`PatternIndex` made of a base index, such as a
+    memory-mapped one (see :class:`MappedPatternIndex`), with a few more
+    words on top. The base index is used as it is rather than copied, so
+    building the new index only costs as much as the added words.
+
+    :param base: index to add words to
+    :param patterns: mapping from each pattern to its added words. Words
+      already in the base index are left out.
+    :param version: version number of this index
+    """
+
+    __slots__ = ('_base', '_pattern_count', '_match_words')
+
+    def __init__(self,
+                 base: PatternIndex,
+                 patterns: Mapping[str, Iterable[str]],
+                 version: int = 0) -> None:
+        added_patterns: Dict[str, Tuple[str, ...]] = {}
+        for pattern, words in patterns.items():
+            base_words = set(base.match_words(pattern))
+            added_words = tuple(dict.fromkeys(
+                word for word in words if word not in base_words))
+            if added_words:
+                added_patterns[pattern] = added_words
+        self._base: PatternIndex = base
+        self._patterns: Dict[str, Tuple[str, ...]] = added_patterns
+        self._version: int = version
+        self._word_count: int = base.word_count + sum(
+            len(words) for words in added_patterns.values())
+        self._pattern_count: int = len(base) + sum(
+            1 for pattern in added_patterns if pattern not in base)
+        self._match_words: Dict[str, Tuple[str, ...]] = {}
+        self._match_arrays: Dict[str, Optional[np.ndarray]] = {}
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'base={self._base!r}, '
+                f'added_patterns={len(self._patterns)}, '
+                f'words={self._word_count}, '
+                f'version={self._version})')
+
+    def __len__(self):
+        return self._pattern_count
+
+    def __contains__(self, pattern):
+        return pattern in self._patterns or pattern in self._base
+
+    def match_words(self, pattern: str) -> Tuple[str, ...]:
+        if pattern not in self._patterns:
+            return self._base.match_words(pattern)
+        try:
+            return self._match_words[pattern]
+        except KeyError:
+            match_words = self._base.match_words(pattern) \
+                + self._patterns[pattern]
+            self._match_words[pattern] = match_words
+            return match_words
+
+    def match_array(self, pattern: str) -> Optional[np.ndarray]:
+        if pattern not in self._patterns:
+            return self._base.match_array(pattern)
+        return super().match_array(pattern)
+
+    def with_word_patterns(
+        self,
+        word_patterns: Iterable[Tuple[str, str]]
+    ) -> 'PatternIndex':
+        """
+        Creates a new index with the same base index, containing this
+        index's added words and the given words. The new index's version is
+        one higher than this index's version.
+
+        :param word_patterns: (word, pattern) pairs to add
+        :return: new index
+        """
+        patterns: Dict[str, Tuple[str, ...]] = dict(self._patterns)
+        for word, pattern in word_patterns:
+            patterns[pattern] = patterns.get(pattern, ()) + (word,)
+        return self.__class__(self._base, patterns, self._version + 1)
+
+
+def words_to_match_array(words: Sequence[str]) -> Optional[np.ndarray]:
+    """
+    Stores words of equal length as a read-only 2-D array of ASCII codes,
+    with one row per word and one column per letter position.
+
+    :param words: words to store
+    :return: array of words, or `None` if there are no words or they are not
+      all ASCII words of the same length
+    """
+    if not words:
+        return None
+    word_length = len(words[0])
+    try:
+        word_bytes = "".join(words).encode('ascii')
+    except UnicodeEncodeError:
+        return None
+    if len(word_bytes) != word_length * len(words):
+        return None
+    match_array = np.frombuffer(word_bytes, dtype=np.uint8)
+    return match_array.reshape(len(words), word_length)
+
+
+STORE_CHECK_SECONDS: float = 1.0  # how often word store versions are read
+
+_shared_indexes: Dict[Hashable, PatternIndex] = {}
+_shared_versions: Dict[Hashable, int] = {}  # latest version seen per key
+# word store version each shared index is up to date with, and when it was
+# last checked
+_shared_store_versions: Dict[Hashable, Tuple[int, float]] = {}
+_shared_indexes_lock = threading.Lock()
+
+
+def get_shared_index(
+    key: Hashable,
+    loader: Callable[[int], PatternIndex],
+    store_version: Optional[Callable[[], int]] = None
+) -> PatternIndex:
+    """
+    Gets the process-wide index for the given key, calling `loader` to build
+    it if it has not been loaded yet (or has been invalidated). The loader is
+    given the version number the new index should use, which is always higher
+    than that of any index previously shared under the same key.
+
+    If `store_version` is given, it is called at most every
+    :data:`STORE_CHECK_SECONDS`, and the index is reloaded if the word store
+    has changed since the index was loaded, such as by another process.
+
+    :param key: key identifying the word store the index is loaded from
+    :param loader: function that loads the index from the word store
+    :param store_version: function that reads the word store's version
+      number, which must increase whenever the word store changes
+    :return: shared index
+    """
+    index = _shared_indexes.get(key)
+    # indexes published without a known word store version are not checked
+    loaded = _shared_store_versions.get(key) \
+        if index is not None and store_version is not None else None
+    if loaded is not None:
+        loaded_version, checked_time = loaded
+        now = time.monotonic()
+        if now - checked_time >= STORE_CHECK_SECONDS:
+            current_version = store_version()
+            with _shared_indexes_lock:
+                if _shared_indexes.get(key) is index:
+                    if current_version == loaded_version:
+                        _shared_store_versions[key] = (loaded_version, now)
+                    else:
+                        del _shared_indexes[key]
+                        index = None
+    if index is None:
+        with _shared_indexes_lock:
+            index = _shared_indexes.get(key)
+            if index is None:
+                # read first, so that changes made while loading are seen
+                # at the next check
+                loaded_version = store_version() \
+                    if store_version is not None else None
+                index = loader(_shared_versions.get(key, -1) + 1)
+                _shared_indexes[key] = index
+                _shared_versions[key] = index.version
+                if loaded_version is not None:
+                    _shared_store_versions[key] = (loaded_version,
+                                                   time.monotonic())
+    return index
+
+
+def publish_shared_index(key: Hashable,
+                         index: PatternIndex,
+                         store_version: Optional[int] = None) -> bool:
+    """
+    Replaces the process-wide index for the given key, unless an index with
+    the same or a newer version has already been shared under that key.
+
+    :param key: key identifying the word store the index is loaded from
+    :param index: new index
+    :param store_version: the word store's version number after the change
+      that the new index adds (see :func:`get_shared_index`). If the word
+      store was also changed by someone else, the index is still published,
+      but is reloaded at the next check.
+    :return: `True` if the index was published
+    """
+    with _shared_indexes_lock:
+        if index.version <= _shared_versions.get(key, -1):
+            return False
+        _shared_indexes[key] = index
+        _shared_versions[key] = index.version
+        loaded = _shared_store_versions.get(key)
+        if store_version is not None and loaded is not None \
+                and store_version == loaded[0] + 1:
+            _shared_store_versions[key] = (store_version, loaded[1])
+        return True
+
+
+def invalidate_shared_index(key: Hashable) -> None:
+    """
+    Drops the process-wide index for the given key, so that it is reloaded
+    from its word store the next time it is needed.
+
+    :param key: key identifying the word store the index is loaded from
+    """
+    with _shared_indexes_lock:
+        _shared_indexes.pop(key, None)
+        _shared_store_versions.pop(key, None)
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+"""
+Opt-in tracing of :class:`Decrypter` searches, and a tool to summarize or
+replay traces.
+
+A :class:`SearchTracer` given to a decrypter records the search tree as a
+JSON lines trace, one compact JSON object per event. Every object has an
+`e` field with the event type:
+
+* `start`: the search's coded words (in text order), ordering, forward
+  checking setting, unresolved word limit and sample rate
+* `try`: a match word `m` was checked for coded word `w` at depth `d`, and
+  `ok` tells whether it was consistent with the cypher-letter map
+* `skip`: coded word `w` at depth `d` was left unresolved
+* `back`: the search backtracked from depth `d`
+* `pass`: a new search pass started, allowing `unresolved` unresolved words
+* `solution`: a solution was found, with its `key` and `unresolved` words
+* `end`: the search stopped, with its `stats` and whether its
+  `budget_exhausted`
+
+`try`, `skip` and `back` events happen once per search node, so they are
+only recorded with probability `sample_rate`; the other events are always
+recorded. When no tracer is given, the search does no tracing work beyond
+checking for one. The decrypting functions trace each single-process
+dictionary search to its own file if the ``DECRYPTOQUOTE_TRACE_DIR``
+environment variable is set (see
+:data:`decryptoquote.decryptoquote.TRACE_DIR`).
+
+Usage, to summarize a trace, or replay it as an indented search tree::
+
+    python -m decryptoquote.tracing TRACE_FILE [--replay]
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import uuid
+from typing import (IO, Any, Dict, Iterable, Iterator, List, Optional,
+                    Sequence)
+
+START_EVENT: str = 'start'
+TRY_EVENT: str = 'try'
+SKIP_EVENT: str = 'skip'
+BACKTRACK_EVENT: str = 'back'
+PASS_EVENT: str = 'pass'
+SOLUTION_EVENT: str = 'solution'
+END_EVENT: str = 'end'
+
+_SEPARATORS = (',', ':')
+
+
+class SearchTracer:
+    """
+    This class writes the events of a search to a JSON lines trace (see
+    above).
+
+    :param file: text file to write the trace to
+    :param sample_rate: fraction of search node events to record, from 0 to
+      1
+    :param seed: seed for sampling, or `None` to seed it randomly
+    :param close_file: whether :meth:`close` should close the file
+    :raises ValueError: if the sample rate is not between 0 and 1
+    """
+
+    __slots__ = ('sample_rate', '_file', '_random', '_close_file')
+
+    def __init__(self,
+                 file: IO[str],
+                 sample_rate: float = 1.0,
+                 seed: Optional[int] = None,
+                 close_file: bool = False):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(
+                f"Sample rate must be between 0 and 1, not {sample_rate}")
+        self.sample_rate: float = sample_rate
+        self._file: IO[str] = file
+        self._random: random.Random = random.Random(seed)
+        self._close_file: bool = close_file
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'file={getattr(self._file, "name", None)!r}, '
+                f'sample_rate={self.sample_rate})')
+
+    def __enter__(self) -> 'SearchTracer':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def open(cls,
+             path: str,
+             sample_rate: float = 1.0,
+             seed: Optional[int] = None) -> 'SearchTracer':
+        """
+        Creates a tracer that writes to a new file.
+
+        :param path: path of the trace file
+        :param sample_rate: fraction of search node events to record
+        :param seed: seed for sampling, or `None` to seed it randomly
+        :return: new tracer, which closes the file when closed
+        """
+        return cls(open(path, 'w'), sample_rate, seed, close_file=True)
+
+    @classmethod
+    def in_directory(cls,
+                     directory: str,
+                     sample_rate: float = 1.0) -> 'SearchTracer':
+        """
+        Creates a tracer that writes to a new, uniquely named file in a
+        directory.
+
+        :param directory: directory for the trace file, created if needed
+        :param sample_rate: fraction of search node events to record
+        :return: new tracer, which closes the file when closed
+        """
+        os.makedirs(directory, exist_ok=True)
+        return cls.open(os.path.join(directory, f'{uuid.uuid4().hex}.jsonl'),
+                        sample_rate)
+
+    def start(self,
+              coded_words: Sequence[str],
+              ordering: str,
+              forward_checking: bool,
+              max_unresolved: int) -> None:
+        self._write({'e': START_EVENT, 'words': list(coded_words),
+                     'ordering': ordering,
+                     'forward_checking': forward_checking,
+                     'max_unresolved': max_unresolved,
+                     'sample_rate': self.sample_rate})
+
+    def candidate(self,
+                  depth: int,
+                  coded_word: str,
+                  match_word: str,
+                  works: bool) -> None:
+        if self._sampled():
+            self._write({'e': TRY_EVENT, 'd': depth, 'w': coded_word,
+                         'm': match_word, 'ok': works})
+
+    def skip(self, depth: int, coded_word: str) -> None:
+        if self._sampled():
+            self._write({'e': SKIP_EVENT, 'd': depth, 'w': coded_word})
+
+    def backtrack(self, depth: int) -> None:
+        if self._sampled():
+            self._write({'e': BACKTRACK_EVENT, 'd': depth})
+
+    def new_pass(self, unresolved: int) -> None:
+        self._write({'e': PASS_EVENT, 'unresolved': unresolved})
+
+    def solution(self, key: bytes, unresolved_words: List[str]) -> None:
+        self._write({'e': SOLUTION_EVENT, 'key': key.decode('ascii'),
+                     'unresolved': unresolved_words})
+
+    def end(self, stats: Dict[str, Any], budget_exhausted: bool) -> None:
+        self._write({'e': END_EVENT, 'stats': stats,
+                     'budget_exhausted': budget_exhausted})
+
+    def close(self) -> None:
+        """
+        Flushes the trace, and closes its file if the tracer opened it.
+        """
+        if self._close_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1 \
+            or self._random.random() < self.sample_rate
+
+    def _write(self, event: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(event, separators=_SEPARATORS))
+        self._file.write('\n')
+
+
+def read_trace(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the events of a trace file.
+
+    :param path: path of the trace file
+    :return: iterator of events
+    """
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def summarize_trace(events: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Summarizes the events of a trace. Counts of sampled events are also
+    estimated for the whole search, by dividing them by the sample rate.
+
+    :param events: events of one search
+    :return: dictionary of the trace's settings, event counts, counts for
+      each depth, solutions, and the search's final stats (`None` if the
+      trace has no `end` event)
+    """
+    settings: Dict[str, Any] = {}
+    counts: Dict[str, int] = collections.Counter()
+    depths: Dict[int, Dict[str, int]] = collections.defaultdict(
+        collections.Counter)
+    solutions: List[Dict[str, Any]] = []
+    end: Optional[Dict[str, Any]] = None
+    for event in events:
+        event_type = event['e']
+        counts[event_type] += 1
+        if event_type == START_EVENT:
+            settings = {name: value for name, value in event.items()
+                        if name != 'e'}
+        elif event_type == TRY_EVENT:
+            depth_counts = depths[event['d']]
+            depth_counts['tries'] += 1
+            depth_counts['works'] += event['ok']
+        elif event_type == SKIP_EVENT:
+            depths[event['d']]['skips'] += 1
+        elif event_type == BACKTRACK_EVENT:
+            depths[event['d']]['backtracks'] += 1
+        elif event_type == SOLUTION_EVENT:
+            solutions.append({'key': event['key'],
+                              'unresolved': event['unresolved']})
+        elif event_type == END_EVENT:
+            end = event
+    sample_rate = settings.get('sample_rate', 1.0) or 1.0
+    return {
+        'settings': settings,
+        'events': dict(counts),
+        'estimated_nodes': {
+            event_type: round(counts[event_type] / sample_rate)
+            for event_type in (TRY_EVENT, SKIP_EVENT, BACKTRACK_EVENT)},
+        'depths': {depth: dict(depths[depth]) for depth in sorted(depths)},
+        'solutions': solutions,
+        'stats': end['stats'] if end is not None else None,
+        'budget_exhausted': end['budget_exhausted']
+        if end is not None else None,
+    }
+
+
+def replay_trace(events: Iterable[Dict[str, Any]],
+                 output: IO[str] = sys.stdout) -> None:
+    """
+    Prints the events of a trace as an indented search tree.
+
+    :param events: events of one search
+    :param output: text file to print to
+    """
+    for event in events:
+        event_type = event['e']
+        indent = "  " * event.get('d', 0)
+        if event_type == TRY_EVENT:
+            line = (f"{indent}{event['w']} = {event['m']} "
+                    f"{'ok' if event['ok'] else 'x'}")
+        elif event_type == SKIP_EVENT:
+            line = f"{indent}{event['w']} unresolved"
+        elif event_type == BACKTRACK_EVENT:
+            line = f"{indent}<- backtrack"
+        elif event_type == PASS_EVENT:
+            line = f"pass with {event['unresolved']} unresolved word(s)"
+        elif event_type == SOLUTION_EVENT:
+            line = f"solution {event['key']}"
+            if event['unresolved']:
+                line += f" unresolved: {' '.join(event['unresolved'])}"
+        elif event_type == START_EVENT:
+            line = f"start {' '.join(event['words'])}"
+        elif event_type == END_EVENT:
+            line = f"end {json.dumps(event['stats'])}"
+            if event['budget_exhausted']:
+                line += " (budget exhausted)"
+        else:
+            line = json.dumps(event)
+        print(line, file=output)
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Summarize or replay a search trace.")
+    parser.add_argument('trace_file')
+    parser.add_argument('--replay', action='store_true',
+                        help="print the search tree instead of a summary")
+    options = parser.parse_args(args)
+    events = read_trace(options.trace_file)
+    if options.replay:
+        replay_trace(events)
+    else:
+        print(json.dumps(summarize_trace(events), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,87 @@
-from typing import TYPE_CHECKING, Optional, Dict, List, Set
+import bisect
+import logging
+import os
+import uuid
+from operator import itemgetter
+from typing import (TYPE_CHECKING, Callable, Optional, Dict, List, Hashable,
+                    Iterable, Iterator, Tuple)
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from decryptoquote.constants import PUNCTUATION
+from decryptoquote.indexfile import MappedPatternIndex, write_index_file
+from decryptoquote.patternindex import (LayeredPatternIndex, PatternIndex,
+                                        get_shared_index,
+                                        invalidate_shared_index,
+                                        publish_shared_index)
 
 if TYPE_CHECKING:
     from pymongo.collection import Collection
 
+REBUILD_CHUNK_SIZE: int = 1000
+DUPLICATE_KEY_ERROR: int = 11000
+UNRANKED: int = 2 ** 31 - 1  # rank of words with no known frequency
+
+
+def read_corpus(corpus_file_path: str) -> Iterator[Tuple[str, int]]:
+    """
+    Reads the words of a language corpus file, along with each word's
+    frequency rank (0 for the most common word).
+
+    Each line of the file holds one word, optionally followed by whitespace
+    and the word's frequency (such as a count of its uses). Words with a
+    frequency are ranked from most to least frequent. Words without one are
+    ranked after them, in the order they appear, so a corpus with no
+    frequency column should list its most common words first.
+
+    The file is read twice, once to rank the frequencies and once to give the
+    words, and only the frequencies are kept in memory. It is opened before
+    this function returns, so a missing file is reported right away.
+
+    :param corpus_file_path: path to language corpus file
+    :return: iterator of (uppercase word, rank) pairs, in file order
+    :exception OSError if corpus file is invalid
+    :exception ValueError if a line has an invalid frequency
+    """
+    with open(corpus_file_path, 'r') as file:
+        frequencies = sorted(
+            frequency for word, frequency in map(_parse_corpus_line, file)
+            if word and frequency is not None)
+    return _ranked_corpus_words(corpus_file_path, frequencies)
+
+
+def _parse_corpus_line(line: str) -> Tuple[str, Optional[float]]:
+    fields = line.split()
+    if not fields:
+        return "", None
+    if len(fields) > 2:
+        raise ValueError(f"Invalid corpus line: {line.strip()}")
+    frequency = float(fields[1]) if len(fields) == 2 else None
+    return fields[0].upper(), frequency
+
+
+def _ranked_corpus_words(
+    corpus_file_path: str,
+    frequencies: List[float]
+) -> Iterator[Tuple[str, int]]:
+    # frequencies holds every word's frequency, in ascending order
+    ties: Dict[float, int] = {}  # frequency: words with it seen so far
+    unranked_count = 0
+    with open(corpus_file_path, 'r') as file:
+        for word, frequency in map(_parse_corpus_line, file):
+            if not word:
+                continue
+            if frequency is None:
+                rank = len(frequencies) + unranked_count
+                unranked_count += 1
+            else:
+                more_frequent = len(frequencies) - bisect.bisect_right(
+                    frequencies, frequency)
+                rank = more_frequent + ties.get(frequency, 0)
+                ties[frequency] = ties.get(frequency, 0) + 1
+            yield word, rank
+
 
 class WordPatterns:
     """
@@ -17,50 +94,96 @@ class WordPatterns:
 
     :param db_collection: MongoDB collection for language model. Documents in
       this collection should follow the pattern
-      ```{self.WORD_KEY: [word], self.PATTERN_KEY: [pattern]}```, with no
-      duplicate words
+      ```{self.WORD_KEY: [word], self.PATTERN_KEY: [pattern],
+      self.RANK_KEY: [rank]}```, with no duplicate words. Matching words are
+      given in order of rank, so the most common words are tried first.
     :param overwrite_patterns: if `True`, overwrites any existing saved patterns
       file
     :param corpus_file_path: path to language corpus file. This is required to
       make a new saved patterns file
+    :param index_key: if given, pattern lookups use an in-memory
+      :class:`PatternIndex` of the collection, loaded once and shared by every
+      `WordPatterns` in the process that uses the same key. Otherwise, every
+      lookup queries the collection. Each change to the collection increases
+      a version number stored next to it, so that processes sharing the
+      collection reload their indexes once it changes (see
+      :func:`get_shared_index`).
+    :param index_file: if given along with `index_key`, the pattern index is
+      loaded from this compiled index file (see :meth:`compile_index_file`)
+      instead of from the collection. The collection is still used to store
+      added words, which are put on top of the file's words whenever it is
+      loaded.
     :exception OSError if corpus file is invalid
     """
 
     DIGITS: str = "0123456789"
+    SHADOW_SUFFIX: str = '_rebuild'
+    VERSION_SUFFIX: str = '_version'
+    VERSION_KEY: str = 'version'
     WORD_KEY: str = 'word'
     PATTERN_KEY: str = 'pattern'
+    RANK_KEY: str = 'rank'
 
     def __init__(self,
                  db_collection: 'Collection',
                  overwrite_patterns: bool = False,
-                 corpus_file_path: Optional[str] = None) -> None:
+                 corpus_file_path: Optional[str] = None,
+                 index_key: Optional[Hashable] = None,
+                 index_file: Optional[str] = None) -> None:
         self._db_collection = db_collection
-        self._db_collection.create_index(self.WORD_KEY, unique=True)
         self._corpus_file_path: Optional[str] = corpus_file_path
+        self._index_key: Optional[Hashable] = index_key
+        self._index_file: Optional[str] = index_file
         if overwrite_patterns:
             if corpus_file_path is None:
                 raise ValueError('No valid language file given')
-            self._db_collection.delete_many({})
-
-            # get words from corpus text file
-            with open(corpus_file_path, 'r') as file:
-                word_list: List[str] = [
-                    s.upper() for s in file.read().splitlines()
-                ]
-                word_set: Set[str] = set(word_list)
-                insert_list: List[Dict[str, str]] = []
-                for word in word_set:
-                    pattern: str = self.word_to_pattern(word)
-                    # insert_set.add({self.WORD_KEY: word,
-                    #                 self.PATTERN_KEY: pattern})
-                    insert_list.append({self.WORD_KEY: word,
-                                        self.PATTERN_KEY: pattern})
-                x = self._db_collection.insert_many(insert_list)
+            self.rebuild_from_corpus(corpus_file_path)
 
     @property
     def corpus_file_path(self) -> Optional[str]:
         return self._corpus_file_path
 
+    @property
+    def pattern_index(self) -> Optional[PatternIndex]:
+        """
+        The shared in-memory pattern index, or `None` if this `WordPatterns`
+        queries the collection directly.
+        """
+        if self._index_key is None:
+            return None
+        return get_shared_index(
+            self._index_key, self._load_pattern_index,
+            self.store_version if self._db_collection is not None else None)
+
+    def store_version(self) -> int:
+        """
+        Reads the version number of the stored patterns, which increases
+        every time words are added or the patterns are rebuilt, by any
+        process.
+
+        :return: version number, or 0 if the patterns were never changed
+        """
+        document = self._version_collection().find_one(
+            {'_id': self.VERSION_KEY})
+        return document[self.VERSION_KEY] if document is not None else 0
+
+    def create_indexes(self) -> None:
+        """
+        Creates the collection indexes used for word lookups, if they do not
+        already exist. This only needs to be done once per collection, not
+        every time a `WordPatterns` is created.
+        """
+        self._create_indexes(self._db_collection)
+
+    def is_empty(self) -> bool:
+        """
+        Checks whether the collection has no stored words, in which case it
+        should be rebuilt from the corpus file.
+
+        :return: `True` if the collection is empty
+        """
+        return self._db_collection.estimated_document_count() == 0
+
     @staticmethod
     def word_to_pattern(word: str) -> str:
         """
@@ -100,22 +223,58 @@ class WordPatterns:
         database. Patterns are described in :meth:`word_to_pattern`.
 
         :param pattern: given word pattern
-        :return: words matching that pattern, or an empty list if no matches
-          exist
+        :return: words matching that pattern, most common first, or an empty
+          list if no matches exist
         """
+        pattern_index = self.pattern_index
+        if pattern_index is not None:
+            results_list = list(pattern_index.match_words(pattern))
+            if not results_list:
+                return self._no_match_words(pattern)
+            return results_list
+
         query = {self.PATTERN_KEY: pattern}
 
         query_count = self._db_collection.count_documents(query)
         if query_count < 1:
-            for character in pattern:
-                if character in self.DIGITS:
-                    return []
-            return [pattern]
+            return self._no_match_words(pattern)
         else:
-            query_results = self._db_collection.find(query)
+            query_results = self._db_collection.find(query).sort(
+                self.RANK_KEY)
             results_list = [x[self.WORD_KEY] for x in query_results]
             return results_list
 
+    def patterns_to_match_words(
+        self,
+        patterns: Iterable[str]
+    ) -> Dict[str, List[str]]:
+        """
+        Determines all matching words for each of the given patterns, using a
+        single query to the word patterns database. Patterns are described in
+        :meth:`word_to_pattern`.
+
+        :param patterns: given word patterns (duplicates are allowed)
+        :return: dictionary from each distinct pattern to its matching words,
+          most common first, or an empty list if no matches exist
+        """
+        results: Dict[str, List[str]] = {pattern: [] for pattern in patterns}
+        pattern_index = self.pattern_index
+        if pattern_index is not None:
+            for pattern in results.keys():
+                results[pattern] = list(pattern_index.match_words(pattern))
+        elif results:
+            query = {self.PATTERN_KEY: {'$in': list(results.keys())}}
+            projection = {self.WORD_KEY: 1, self.PATTERN_KEY: 1, '_id': 0}
+            documents = self._db_collection.find(query, projection).sort(
+                self.RANK_KEY)
+            for document in documents:
+                results[document[self.PATTERN_KEY]].append(
+                    document[self.WORD_KEY])
+        for pattern, match_words in results.items():
+            if not match_words:
+                results[pattern] = self._no_match_words(pattern)
+        return results
+
     def code_word_to_match_words(self, code_word: str) -> List[str]:
         """
         Determines all words whose pattern matches that of the given code word,
@@ -128,20 +287,227 @@ class WordPatterns:
         pattern: str = self.word_to_pattern(code_word)
         return self.pattern_to_match_words(pattern)
 
-    def add_new_words(self, words: List[str]):
+    def code_words_to_match_words(
+        self,
+        code_words: Iterable[str]
+    ) -> Dict[str, List[str]]:
+        """
+        Determines the possible matching words for each of the given code
+        words, using a single query to the word patterns database. See
+        :meth:`code_word_to_match_words`.
+
+        :param code_words: given code words (duplicates are allowed)
+        :return: dictionary from each distinct code word to its matching
+          words, or an empty list if no matches exist
+        """
+        code_word_patterns: Dict[str, str] = {
+            code_word: self.word_to_pattern(code_word)
+            for code_word in code_words}
+        pattern_matches = self.patterns_to_match_words(
+            code_word_patterns.values())
+        return {code_word: pattern_matches[pattern]
+                for code_word, pattern in code_word_patterns.items()}
+
+    def add_new_words(self, words: Iterable[str]) -> int:
         """
         Adds all words in the list to the stored patterns.
 
+        All patterns are worked out locally, and the words are sent to the
+        collection as a single unordered batch of upserts keyed on the word,
+        so words that are already stored (including those being added by
+        someone else at the same time) are left alone. If this `WordPatterns`
+        uses a pattern index, the words are added to it without reloading it.
+        Other processes sharing the collection reload their own indexes once
+        they see the collection's new version (see :meth:`store_version`).
+
         :param words: words to add
+        :return: number of words that were not already stored
         """
+        added_words: Dict[str, str] = {}  # word: pattern
         for word in words:
             word_upper = word.upper()
-            pattern = self.word_to_pattern(word_upper)
-            matching_words = self.pattern_to_match_words(pattern)
+            if word_upper and word_upper not in added_words:
+                added_words[word_upper] = self.word_to_pattern(word_upper)
+        if not added_words:
+            return 0
+        result = self._db_collection.bulk_write(
+            [UpdateOne({self.WORD_KEY: word},
+                       {'$setOnInsert': {self.WORD_KEY: word,
+                                         self.PATTERN_KEY: pattern,
+                                         self.RANK_KEY: UNRANKED}},
+                       upsert=True)
+             for word, pattern in added_words.items()],
+            ordered=False)
+        store_version = self._increase_store_version() \
+            if result.upserted_count else None
+        pattern_index = self.pattern_index
+        if pattern_index is not None:
+            missing_words = [
+                (word, pattern) for word, pattern in added_words.items()
+                if word not in pattern_index.match_words(pattern)]
+            if missing_words and not publish_shared_index(
+                    self._index_key,
+                    pattern_index.with_word_patterns(missing_words),
+                    store_version):
+                # another thread changed the index first; reload it instead
+                invalidate_shared_index(self._index_key)
+        return result.upserted_count
 
-            if word_upper not in matching_words:
-                self._db_collection.insert_one({self.WORD_KEY: word_upper,
-                                                self.PATTERN_KEY: pattern})
+    def rebuild_from_corpus(
+        self,
+        corpus_file_path: str,
+        chunk_size: int = REBUILD_CHUNK_SIZE,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> int:
+        """
+        Replaces the stored patterns with those of the words in a language
+        corpus file.
+
+        The corpus is read one line at a time, and its words are inserted in
+        chunks of `chunk_size` into a separate shadow collection, named
+        uniquely for this rebuild. Once every word has been inserted, the
+        shadow collection is renamed to replace the collection, so readers
+        see either the old or the new patterns, never a partial set. If the
+        rebuild fails, the shadow collection is dropped.
+
+        :param corpus_file_path: path to language corpus file (see
+          :func:`read_corpus`)
+        :param chunk_size: number of words to insert at a time
+        :param progress: function called with the number of words loaded so
+          far, after each chunk
+        :return: number of distinct words loaded
+        :exception OSError if corpus file is invalid
+        """
+        corpus_words = read_corpus(corpus_file_path)
+        # each rebuild has its own shadow collection, so rebuilds running at
+        # the same time do not drop each other's
+        shadow_collection = self._db_collection.database[
+            f"{self._db_collection.name}{self.SHADOW_SUFFIX}_"
+            f"{os.getpid()}_{uuid.uuid4().hex}"]
+        try:
+            self._create_indexes(shadow_collection)
+            word_count = 0
+            chunk: List[Dict[str, object]] = []
+            for word, rank in corpus_words:
+                chunk.append({self.WORD_KEY: word,
+                              self.PATTERN_KEY: self.word_to_pattern(word),
+                              self.RANK_KEY: rank})
+                if len(chunk) >= chunk_size:
+                    word_count += self._insert_chunk(shadow_collection,
+                                                     chunk)
+                    chunk = []
+                    if progress is not None:
+                        progress(word_count)
+            if chunk:
+                word_count += self._insert_chunk(shadow_collection, chunk)
+                if progress is not None:
+                    progress(word_count)
+            shadow_collection.rename(self._db_collection.name,
+                                     dropTarget=True)
+        except BaseException:
+            shadow_collection.drop()
+            raise
+        self._increase_store_version()
+        if self._index_key is not None:
+            invalidate_shared_index(self._index_key)
+        logging.info(f"Loaded {word_count} words from {corpus_file_path}")
+        return word_count
 
     def save_corpus_from_patterns(self, corpus_file_path: str) -> None:
         pass  # TODO: stub
+
+    @classmethod
+    def compile_index_file(cls,
+                           corpus_file_path: str,
+                           index_file_path: str) -> None:
+        """
+        Compiles a language corpus file into an index file, which can then be
+        given as a `WordPatterns`'s `index_file`. The whole corpus is held in
+        memory while its words are sorted by rank and compiled.
+
+        :param corpus_file_path: path to language corpus file (see
+          :func:`read_corpus`)
+        :param index_file_path: path of the index file to write
+        """
+        corpus_words = sorted(read_corpus(corpus_file_path),
+                              key=itemgetter(1))
+        write_index_file(
+            index_file_path,
+            ((word, cls.word_to_pattern(word)) for word, _ in corpus_words))
+
+    def _load_pattern_index(self, version: int) -> PatternIndex:
+        if self._index_file is not None:
+            return self._load_mapped_index(version)
+        projection = {self.WORD_KEY: 1, self.PATTERN_KEY: 1,
+                      self.RANK_KEY: 1, '_id': 0}
+        # sorted here rather than by the server, which may refuse to sort a
+        # large collection in memory
+        documents = sorted(self._db_collection.find({}, projection),
+                           key=lambda x: x.get(self.RANK_KEY, UNRANKED))
+        return PatternIndex.from_word_patterns(
+            ((x[self.WORD_KEY], x[self.PATTERN_KEY]) for x in documents),
+            version)
+
+    def _load_mapped_index(self, version: int) -> PatternIndex:
+        """
+        Loads the compiled index file, with the words added to the collection
+        (see :meth:`add_new_words`) on top of it, since they are not in the
+        file until it is compiled again.
+        """
+        mapped_index = MappedPatternIndex(self._index_file, version)
+        if self._db_collection is None:
+            return mapped_index
+        added_patterns: Dict[str, List[str]] = {}
+        documents = self._db_collection.find(
+            {self.RANK_KEY: UNRANKED},
+            {self.WORD_KEY: 1, self.PATTERN_KEY: 1, '_id': 0})
+        for document in documents:
+            added_patterns.setdefault(document[self.PATTERN_KEY], []).append(
+                document[self.WORD_KEY])
+        if not added_patterns:
+            return mapped_index
+        return LayeredPatternIndex(mapped_index, added_patterns, version)
+
+    def _version_collection(self) -> 'Collection':
+        return self._db_collection.database[
+            self._db_collection.name + self.VERSION_SUFFIX]
+
+    def _increase_store_version(self) -> int:
+        """
+        Increases the version number of the stored patterns, after a change.
+
+        :return: new version number
+        """
+        document = self._version_collection().find_one_and_update(
+            {'_id': self.VERSION_KEY}, {'$inc': {self.VERSION_KEY: 1}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        return document[self.VERSION_KEY]
+
+    @classmethod
+    def _create_indexes(cls, collection: 'Collection') -> None:
+        collection.create_index(cls.WORD_KEY, unique=True)
+        collection.create_index([(cls.PATTERN_KEY, 1), (cls.RANK_KEY, 1)])
+
+    @staticmethod
+    def _insert_chunk(collection: 'Collection',
+                      documents: List[Dict[str, str]]) -> int:
+        """
+        Inserts documents without stopping at duplicate words.
+
+        :return: number of documents inserted
+        """
+        try:
+            return len(collection.insert_many(documents,
+                                              ordered=False).inserted_ids)
+        except BulkWriteError as error:
+            if any(write_error['code'] != DUPLICATE_KEY_ERROR
+                   for write_error in error.details['writeErrors']):
+                raise
+            return error.details['nInserted']
+
+    def _no_match_words(self, pattern: str) -> List[str]:
+        # patterns without digits are punctuation, which matches itself
+        for character in pattern:
+            if character in self.DIGITS:
+                return []
+        return [pattern]
@@ -0,0 +1,37 @@
+# Gunicorn settings, loaded automatically by `gunicorn app:app` (see Procfile)
+import glob
+import os
+import tempfile
+
+# solve jobs live in the worker process that accepted them, so use a single
+# worker, with threads so that job status can be polled during long solves
+workers = 1
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# every worker writes its metrics to files in this directory, and /metrics
+# adds them up (see decryptoquote.metrics); it must be set before the app is
+# imported
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(
+        prefix='decryptoquote-metrics-')
+
+
+def on_starting(server):
+    # remove metrics files left by an earlier run
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        os.remove(path)
+
+
+def post_worker_init(worker):
+    # set up the word patterns database before the first request, rather than
+    # while handling it
+    from decryptoquote.decryptoquote import prepare_word_patterns
+    prepare_word_patterns()
+
+
+def child_exit(server, worker):
+    # keep the exited worker's counters, but drop its live gauges
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for AnnealingDecrypter in `decryptoquote` package."""
+import os
+
+import pytest
+
+import decryptoquote
+from decryptoquote.annealing import AnnealingDecrypter
+from decryptoquote.budget import SearchBudget
+from decryptoquote.cypherlettermap import CypherLetterMap
+from decryptoquote.ngrams import QuadgramModel
+
+CORPUS_FILE_PATH = os.path.join(os.path.dirname(decryptoquote.__file__),
+                                'words_alpha_apos.txt')
+# several of these words are not in the corpus
+DECODED_QUOTE = "ALL SUCCESSFUL PEOPLE MEN AND WOMEN ARE BIG DREAMERS. " \
+                "THEY IMAGINE WHAT THEIR FUTURE COULD BE, IDEAL IN EVERY " \
+                "RESPECT, AND THEN THEY WORK EVERY DAY TOWARD THEIR " \
+                "DISTANT VISION, THAT GOAL OR PURPOSE."
+CODED_QUOTE = "JRR FSAAGFFZSR HGBHRG VGL JLM CBVGL JQG UDI MQGJVGQF. " \
+              "EKGN DVJIDLG CKJE EKGDQ ZSESQG ABSRM UG, DMGJR DL GYGQN " \
+              "QGFHGAE, JLM EKGL EKGN CBQW GYGQN MJN EBCJQM EKGDQ " \
+              "MDFEJLE YDFDBL, EKJE IBJR BQ HSQHBFG."
+
+
+@pytest.fixture(scope='module')
+def model() -> QuadgramModel:
+    return QuadgramModel.from_corpus(CORPUS_FILE_PATH)
+
+
+def test_decrypt(model):
+    decrypter = AnnealingDecrypter(CODED_QUOTE, model, seed=1)
+    keys = list(decrypter.iter_solutions())
+    assert len(keys) == 1
+    assert not decrypter.budget_exhausted
+    assert decrypter.stats.backtracks == 20
+    decoded_quote = CypherLetterMap.from_key(keys[0]).decode(CODED_QUOTE)
+    correct_letters = sum(decoded == letter for decoded, letter
+                          in zip(decoded_quote, DECODED_QUOTE))
+    assert correct_letters >= 0.95 * len(DECODED_QUOTE)
+    assert decrypter.best_score >= model.score(DECODED_QUOTE) - 1e-3
+    # the key only decodes letters in the text
+    assert keys[0][ord('X') - ord('A')] == ord('_')
+
+
+def test_seeded(model):
+    def solve(seed):
+        decrypter = AnnealingDecrypter("OIVD DIM SMQSAM OVKD XH PMGF HXLSAM.",
+                                       model, restarts=3, seed=seed)
+        return next(decrypter.iter_solutions())
+
+    assert solve(5) == solve(5)
+
+
+def test_budget(model):
+    decrypter = AnnealingDecrypter(CODED_QUOTE, model, seed=1,
+                                   budget=SearchBudget(max_nodes=100))
+    assert list(decrypter.iter_solutions()) == []
+    assert decrypter.budget_exhausted
+    assert 100 <= decrypter.stats.nodes_visited \
+        < 100 + SearchBudget.CHECK_INTERVAL
+    partial_key = decrypter.best_partial_key
+    assert CypherLetterMap.from_key(partial_key).decode("JRR") != "___"
+
+
+def test_no_letters(model):
+    decrypter = AnnealingDecrypter("!?", model)
+    assert list(decrypter.iter_solutions()) == [b"_" * 26]
+    assert list(decrypter.iter_solutions(0)) == []
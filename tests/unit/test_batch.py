@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for BatchSolver in `decryptoquote` package."""
+import os
+from typing import List, Optional
+
+import pytest
+
+from decryptoquote import batch
+from decryptoquote.batch import BatchSolver, TaskResult
+from decryptoquote.budget import BUDGET_EXHAUSTED, SOLVED, UNRESOLVED
+from decryptoquote.cypherlettermap import CypherLetterMap
+from decryptoquote.patternindex import LayeredPatternIndex, PatternIndex
+from decryptoquote.wordpatterns import WordPatterns
+
+TEST_WORDS = ["THIS", "ALSO", "SOME", "IS", "TEXT", "TENT", "ISN'T"]
+CODED_QUOTE = "ABCD CD DEFG AGHA."
+CRASH_QUOTE = "CRASH"
+
+_original_solve_task = batch._solve_task
+
+
+@pytest.fixture()
+def pattern_index() -> PatternIndex:
+    return PatternIndex({}).with_word_patterns(
+        (word, WordPatterns.word_to_pattern(word)) for word in TEST_WORDS)
+
+
+@pytest.fixture(params=[1, 2])
+def workers(request) -> int:
+    return request.param
+
+
+def decode_all(result: TaskResult, coded_quote: str) -> List[str]:
+    solutions, _, _ = result
+    return sorted(CypherLetterMap.from_key(key).decode(coded_quote)
+                  for key, _ in solutions)
+
+
+def crashing_solve_task(task, settings):
+    if task[0] == CRASH_QUOTE:
+        os._exit(1)
+    return _original_solve_task(task, settings)
+
+
+def test_solve_in_order(pattern_index, workers):
+    solver = BatchSolver(pattern_index, workers=workers, max_solutions=None)
+    tasks = [(CODED_QUOTE, ()), ("ABCD", ()), None, ("AB", ()),
+             ("ZZZZZZ", ())]
+    results: List[Optional[TaskResult]] = list(solver.solve(tasks))
+    assert len(results) == len(tasks)
+    assert decode_all(results[0], CODED_QUOTE) == [
+        "THIS IS SOME TENT.", "THIS IS SOME TEXT."]
+    assert decode_all(results[1], "ABCD") == ["ALSO", "SOME", "THIS"]
+    assert results[2] is None
+    assert decode_all(results[3], "AB") == ["IS"]
+    assert results[4][0] == []
+    assert all(result[2] is None for result in results if result)
+
+
+def test_solve_hint_words(pattern_index, workers):
+    solver = BatchSolver(pattern_index, workers=workers, max_solutions=None)
+    results = list(solver.solve([("ABC", ("CAT", "DOG")), ("ABC", ())]))
+    assert decode_all(results[0], "ABC") == ["CAT", "DOG"]
+    # hint words are only used for their own task
+    assert results[1][0] == []
+
+
+def test_hint_words_index(pattern_index):
+    batch._init_worker(pattern_index, None)
+    try:
+        first_index = batch._word_patterns(("CAT",)).pattern_index
+        second_index = batch._word_patterns(("DOG",)).pattern_index
+    finally:
+        batch._init_worker(None, None)
+    # hint words go on top of the worker's index, without copying it
+    assert isinstance(second_index, LayeredPatternIndex)
+    assert second_index.match_words("0.1.2") == ("DOG",)
+    assert second_index.match_array("0.1.2.3") is \
+        pattern_index.match_array("0.1.2.3")
+    assert second_index.version > first_index.version
+
+
+def test_solve_budget(pattern_index, workers):
+    solver = BatchSolver(pattern_index, workers=workers, max_nodes=0)
+    solutions, stats, error = next(solver.solve([(CODED_QUOTE, ())]))
+    assert [status for _, status in solutions] == [BUDGET_EXHAUSTED]
+    assert stats['nodes_visited'] == 0
+    assert error is None
+
+
+def test_solve_statuses(pattern_index):
+    solver = BatchSolver(pattern_index, workers=1, max_unresolved=1)
+    solutions, stats, error = next(solver.solve([("ABCD CD ZZ", ())]))
+    assert [status for _, status in solutions] == [UNRESOLVED]
+    solutions, stats, error = next(solver.solve([("AB", ())]))
+    assert [status for _, status in solutions] == [SOLVED]
+    assert stats['nodes_visited'] > 0
+
+
+def test_solve_error(pattern_index, workers):
+    solver = BatchSolver(pattern_index, workers=workers)
+    results = list(solver.solve([(None, ()), ("AB", ())]))
+    assert results[0][0] == []
+    assert results[0][2].startswith("AttributeError")
+    assert results[1][2] is None
+    assert len(results[1][0]) == 1
+
+
+def test_solve_worker_died(pattern_index, monkeypatch):
+    monkeypatch.setattr(batch, '_solve_task', crashing_solve_task)
+    solver = BatchSolver(pattern_index, workers=2)
+    results = list(solver.solve(
+        [("AB", ()), (CRASH_QUOTE, ()), ("ABCD", ())], max_pending=2))
+    assert results[1] == ([], None, "Worker process died")
+    assert decode_all(results[0], "AB") == ["IS"]
+    assert len(results[2][0]) == 1
+
+
+def test_solve_max_pending(pattern_index):
+    read: List[int] = []
+
+    def tasks():
+        for number in range(10):
+            read.append(number)
+            yield "AB", ()
+
+    solver = BatchSolver(pattern_index, workers=2)
+    results = solver.solve(tasks(), max_pending=3)
+    next(results)
+    assert len(read) <= 3
+    assert len(list(results)) == 9
+
+
+def test_bad_settings(pattern_index):
+    with pytest.raises(ValueError):
+        BatchSolver()
+    with pytest.raises(ValueError):
+        BatchSolver(pattern_index, ordering='backwards')
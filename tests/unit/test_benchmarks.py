@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for the benchmark suite in `benchmarks`."""
+import importlib.util
+import os
+
+import pytest
+
+BENCH_SOLVER_PATH = os.path.join(os.path.dirname(__file__), '..', '..',
+                                 'benchmarks', 'bench_solver.py')
+SETTINGS = {'repeat': 1, 'max_nodes': 100000, 'ordering': 'constrained',
+            'forward_checking': False}
+
+
+@pytest.fixture(scope='module')
+def bench_solver():
+    spec = importlib.util.spec_from_file_location('bench_solver',
+                                                  BENCH_SOLVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_run_first_solution(bench_solver):
+    puzzles = {puzzle['id']: puzzle for puzzle
+               in bench_solver.read_puzzles(bench_solver.CORPUS_PATH)}
+    first, second = puzzles['to-be'], puzzles['people-want']
+    alone = bench_solver.run_first_solution([second], SETTINGS)
+    results = bench_solver.run_first_solution([first, second], SETTINGS)
+    assert [result['puzzle'] for result in results] == ['to-be',
+                                                        'people-want']
+    # the second puzzle gets the same search as when it runs alone
+    for word_order in bench_solver.WORD_ORDERS:
+        assert results[1][word_order]['nodes_visited'] == \
+            alone[0][word_order]['nodes_visited'] > 0
+        assert results[1][word_order]['found'] == \
+            alone[0][word_order]['found']
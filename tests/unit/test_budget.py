@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for search budgets in `decryptoquote` package."""
+import multiprocessing
+import time
+
+from decryptoquote.budget import CancellationToken, SearchBudget
+
+
+def test_cancellation_token():
+    token = CancellationToken()
+    assert not token.cancelled
+    token.cancel()
+    assert token.cancelled
+    process_token = CancellationToken(multiprocessing.Event())
+    assert not process_token.cancelled
+    process_token.cancel()
+    assert process_token.cancelled
+
+
+def test_unlimited_budget():
+    assert not SearchBudget().is_exhausted(10 ** 9)
+    assert not SearchBudget.from_timeout(None).is_exhausted(10 ** 9)
+
+
+def test_max_nodes():
+    budget = SearchBudget(max_nodes=5)
+    assert not budget.is_exhausted(4)
+    assert budget.is_exhausted(5)
+
+
+def test_deadline():
+    assert SearchBudget(deadline=time.time() - 1).is_exhausted(0)
+    budget = SearchBudget.from_timeout(60)
+    assert not budget.is_exhausted(0)
+    assert budget.deadline > time.time()
+
+
+def test_cancelled():
+    token = CancellationToken()
+    budget = SearchBudget(cancel_token=token)
+    assert not budget.is_exhausted(0)
+    token.cancel()
+    assert budget.is_exhausted(0)
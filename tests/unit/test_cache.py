@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for solution caching in `decryptoquote` package."""
+from decryptoquote.cache import (SolutionCache, canonicalize,
+                                 key_from_canonical, key_to_canonical)
+from decryptoquote.cypherlettermap import CypherLetterMap
+
+
+def test_canonicalize():
+    assert canonicalize("Xyx zy!") == ("ABA CB!", "XYZ")
+    assert canonicalize("ABCD CD") == ("ABCD CD", "ABCD")
+    assert canonicalize("") == ("", "")
+    # same puzzle under different cyphers
+    assert canonicalize("QRST ST STUV QVWQ")[0] == \
+        canonicalize("ZYXW XW XWVU ZUTZ")[0]
+
+
+def test_key_round_trip():
+    coded_text = "ZYXW XW"
+    canonical_text, letters = canonicalize(coded_text)
+    cypher_letter_map = CypherLetterMap()
+    cypher_letter_map.add_word_to_mapping("ZYXW", "THIS")
+    key = cypher_letter_map.key()
+    canonical_key = key_to_canonical(key, letters)
+    assert CypherLetterMap.from_key(canonical_key).decode(canonical_text) \
+        == "THIS IS"
+    assert key_from_canonical(canonical_key, letters) == key
+
+
+def test_cache_hits_and_misses():
+    cache = SolutionCache(max_size=2)
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0,
+                             'size': 1}
+
+
+def test_cache_lru_eviction():
+    cache = SolutionCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")  # "b" is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+    assert len(cache) == 2
+
+
+def test_cache_ttl():
+    cache = SolutionCache(ttl=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert cache.evictions == 1
+    assert len(cache) == 0
+
+
+def test_cache_disabled():
+    cache = SolutionCache(max_size=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
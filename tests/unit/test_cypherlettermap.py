@@ -129,6 +129,29 @@ def test_remove_word_from_mapping(cypherletter_map):
         assert cypherletter_map.get_letter_for_cypher(letter) is None
 
 
+def test_remove_word_sharing_letters(cypherletter_map):
+    cypherletter_map.add_word_to_mapping("ABCD", "THIS")
+    cypherletter_map.add_word_to_mapping("CDE", "ISN")
+    cypherletter_map.add_word_to_mapping("AB", "TH")  # adds no new letters
+    cypherletter_map.remove_last_word_from_mapping()
+    assert cypherletter_map.decode("ABCDE") == "THISN"
+    cypherletter_map.remove_last_word_from_mapping()
+    assert cypherletter_map.decode("ABCDE") == "THIS_"
+    cypherletter_map.remove_last_word_from_mapping()
+    assert cypherletter_map.decode("ABCDE") == "_____"
+    cypherletter_map.remove_last_word_from_mapping()  # nothing left to undo
+    assert cypherletter_map.decode("ABCDE") == "_____"
+
+
+def test_failed_add_leaves_mapping_unchanged(cypherletter_map):
+    cypherletter_map.add_word_to_mapping("ABCD", "THIS")
+    with pytest.raises(ValueError):
+        cypherletter_map.add_word_to_mapping("EFA", "ONE")  # A is T
+    assert cypherletter_map.decode("ABCDEF") == "THIS__"
+    cypherletter_map.remove_last_word_from_mapping()
+    assert cypherletter_map.decode("ABCDEF") == "______"
+
+
 def test_clear(cypherletter_map):
     others = decryptoquote.constants.LETTERS
     for letter in others:
@@ -157,6 +180,22 @@ def test_does_word_coding_work(cypherletter_map):
     word_coding_case(cypherletter_map, "ef", ".'", False)  # punct mismatch
 
 
+def test_prepared_words(cypherletter_map):
+    cypherletter_map.add_prepared_word_to_mapping("ABCD", "THIS")
+    assert cypherletter_map.does_prepared_coding_work("EFG", "ONE")
+    assert cypherletter_map.does_prepared_coding_work("CD'E", "IS'N")
+    assert not cypherletter_map.does_prepared_coding_work("CD", "IT")
+    assert not cypherletter_map.does_prepared_coding_work("EF", "TO")
+    assert not cypherletter_map.does_prepared_coding_work("E'", "O.")
+    cypherletter_map.add_prepared_word_to_mapping("CD'E", "IS'N")
+    assert cypherletter_map.keystring() == "THISN" + "_" * 21
+    assert cypherletter_map.decode("abcd'e") == "THIS'N"
+    cypherletter_map.remove_last_word_from_mapping()
+    assert cypherletter_map.decode("ABCDE") == "THIS_"
+    with pytest.raises(KeyError):
+        cypherletter_map.get_letter_for_cypher("'")
+
+
 def word_coding_case(
     cypherletter_map,
     coded_word: str,
@@ -289,3 +328,24 @@ def test_deepcopy(cypherletter_map):
     cypherletter_map2 = copy.deepcopy(cypherletter_map)
     cypherletter_map.add_word_to_mapping("ABCDEF", "CHANGE")
     assert cypherletter_map != cypherletter_map2
+
+
+def test_key(cypherletter_map):
+    cypherletter_map.add_word_to_mapping("ABCD", "THIS")
+    key = cypherletter_map.key()
+    assert key == b"THIS______________________"
+    cypherletter_map.remove_last_word_from_mapping()
+    assert key == b"THIS______________________"
+    key_map = CypherLetterMap.from_key(key)
+    assert key_map.key() == key
+    assert key_map.decode("ABCD E") == "THIS _"
+    assert key_map.get_letter_for_cypher("S") is None
+    assert not key_map.does_word_coding_work("E", "T")
+    key_map.remove_last_word_from_mapping()  # no history, no change
+    assert key_map.key() == key
+    with pytest.raises(ValueError):
+        CypherLetterMap.from_key(b"THIS")
+    with pytest.raises(ValueError):
+        CypherLetterMap.from_key(b"TT________________________")
+    with pytest.raises(ValueError):
+        CypherLetterMap.from_key(b"T1________________________")
@@ -2,11 +2,12 @@
 # -*- coding: utf-8 -*-
 
 """Unit tests for Decrypter in `decryptoquote` package."""
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 
 import pytest
 import mongomock
 
+from decryptoquote.budget import CancellationToken, SearchBudget
 from decryptoquote.decrypter import Decrypter
 from decryptoquote.cypherlettermap import CypherLetterMap
 from decryptoquote.wordpatterns import WordPatterns
@@ -39,67 +40,265 @@ def collection() -> mongomock.Collection:
 @pytest.fixture()
 def collection2() -> mongomock.Collection:
     new_test_patterns: Dict[str, List[str]] = {
-        k: TEST_PATTERNS[k] for k in TEST_PATTERNS.keys()}
+        k: list(TEST_PATTERNS[k]) for k in TEST_PATTERNS.keys()}
     new_test_patterns["0.1.2.0"].append("TENT")
     return generate_collection(new_test_patterns)
 
 
-def test_single_word(collection):
-    decrypt_case(collection, "ABCD", "THIS")
-    decrypt_case(collection, "AB", "IS")
-    decrypt_case(collection, "ABCA", "TEXT")
-    decrypt_case(collection, "ABC'D", "ISN'T")
+@pytest.fixture(params=Decrypter.ORDERINGS)
+def ordering(request) -> str:
+    return request.param
 
 
-def test_try_multiple_words(collection):
-    decrypt_case(collection, "AB BCDE", "IS SOME")
-    decrypt_case(collection, "ABCD EFDG DGHI", "THIS ALSO SOME")
+@pytest.fixture(params=[False, True], ids=['no_fc', 'fc'])
+def forward_checking(request) -> bool:
+    return request.param
 
 
-def test_backtracking(collection):
-    decrypt_case(collection, "DGHI EFDG ABCD", "SOME ALSO THIS")
+def test_single_word(collection, ordering, forward_checking):
+    decrypt_case(collection, "ABCD", "THIS", ordering,
+                 forward_checking)
+    decrypt_case(collection, "AB", "IS", ordering,
+                 forward_checking)
+    decrypt_case(collection, "ABCA", "TEXT", ordering,
+                 forward_checking)
+    decrypt_case(collection, "ABC'D", "ISN'T", ordering,
+                 forward_checking)
 
 
-def test_decrypt(collection):
+def test_try_multiple_words(collection, ordering, forward_checking):
+    decrypt_case(collection, "AB BCDE", "IS SOME", ordering,
+                 forward_checking)
+    decrypt_case(collection, "ABCD EFDG DGHI", "THIS ALSO SOME", ordering,
+                 forward_checking)
+
+
+def test_backtracking(collection, ordering, forward_checking):
+    decrypt_case(collection, "DGHI EFDG ABCD", "SOME ALSO THIS", ordering,
+                 forward_checking)
+
+
+def test_decrypt(collection, ordering, forward_checking):
     decoded_quote: str = "THIS IS SOME TEXT. THIS ISN'T."
     coded_quote: str = "ABCD CD DEFG AGHA. ABCD CDI'A."
-    decrypt_case(collection, coded_quote, decoded_quote)
+    decrypt_case(collection, coded_quote, decoded_quote, ordering,
+                 forward_checking)
 
 
-def test_decrypt_all(collection2):
+def test_repeated_words_searched_once(collection, ordering,
+                                      forward_checking):
+    coded_quote: str = "ABCD CD DEFG AGHA. ABCD CDI'A, 123!"
+    decrypter, success = do_decryption(collection, coded_quote, ordering,
+                                       forward_checking)
+    assert success
+    assert decrypter.word_counts == {
+        "ABCD": 2, "CD": 1, "DEFG": 1, "AGHA": 1, "CDI'A": 1}
+    assert sorted(decrypter.word_order) == sorted(decrypter.word_counts)
+    assert decrypter.stats.nodes_visited >= len(decrypter.word_counts)
+    assert decrypter.cypher_letter_map.decode(coded_quote) == \
+        "THIS IS SOME TEXT. THIS ISN'T, 123!"
+
+
+def test_decrypt_all(collection2, ordering, forward_checking):
     decoded_quote: str = "THIS IS SOME TEXT"
     alternate_decode: str = "THIS IS SOME TENT"
     coded_quote: str = "ABCD CD DEFG AGHA"
-    decrypter: Decrypter = build_decrypter(collection2, coded_quote)
+    decrypter: Decrypter = build_decrypter(collection2, coded_quote, ordering,
+                                           forward_checking)
     solution_maps: List[CypherLetterMap] = decrypter.decrypt_all()
     solutions = [x.decode(coded_quote) for x in solution_maps]
     assert decoded_quote in solutions
     assert alternate_decode in solutions
+    assert len(solutions) == 2
+
+
+def test_iter_solutions(collection2, ordering, forward_checking):
+    coded_quote: str = "ABCD CD DEFG AGHA"
+    keys: List[bytes] = list(build_decrypter(
+        collection2, coded_quote, ordering, forward_checking
+    ).iter_solutions())
+    assert all(len(key) == 26 for key in keys)
+    assert sorted(CypherLetterMap.from_key(key).decode(coded_quote)
+                  for key in keys) == ["THIS IS SOME TENT",
+                                       "THIS IS SOME TEXT"]
+    decrypter: Decrypter = build_decrypter(collection2, coded_quote, ordering,
+                                           forward_checking)
+    assert list(decrypter.iter_solutions(max_solutions=1)) == keys[:1]
+    decrypter = build_decrypter(collection2, coded_quote, ordering,
+                                forward_checking)
+    assert list(decrypter.iter_solutions(max_solutions=0)) == []
+    assert decrypter.stats.nodes_visited == 0
+    decrypter = build_decrypter(collection2, ". !", ordering,
+                                forward_checking)
+    assert list(decrypter.iter_solutions()) == [b"_" * 26]
+
 
+def test_decrypt_all_vectorized(collection2, ordering, forward_checking,
+                                monkeypatch):
+    coded_quote: str = "ABCD CD DEFG AGHA"
+    expected_solutions: List[str] = [
+        x.decode(coded_quote) for x in build_decrypter(
+            collection2, coded_quote, ordering, forward_checking
+        ).decrypt_all()]
+    monkeypatch.setattr(Decrypter, 'VECTORIZE_MIN_MATCHES', 1)
+    decrypter: Decrypter = build_decrypter(collection2, coded_quote, ordering,
+                                           forward_checking)
+    solutions = [x.decode(coded_quote) for x in decrypter.decrypt_all()]
+    assert solutions == expected_solutions
 
-def test_word_too_long(collection):
+
+def test_word_too_long(collection, ordering, forward_checking):
     coded_quote: str = "ABCDEFGHI"
-    _, success = do_decryption(collection, coded_quote)
+    _, success = do_decryption(collection, coded_quote, ordering,
+                               forward_checking)
     assert not success
 
 
-def decrypt_case(collection, coded_quote: str, expected_decode: str):
+def test_constrained_word_order(collection):
+    coded_quote: str = "DEFG AGHA CD ABCD"
+    decrypter, success = do_decryption(
+        collection, coded_quote, Decrypter.CONSTRAINED_ORDER)
+    assert success
+    # after AGHA == TEXT, every word has one consistent match, so words
+    # sharing decoded letters (G, A) go before CD
+    assert decrypter.word_order == ["AGHA", "DEFG", "ABCD", "CD"]
+    text_decrypter, _ = do_decryption(collection, coded_quote)
+    assert text_decrypter.word_order == ["DEFG", "AGHA", "CD", "ABCD"]
+    assert decrypter.stats.backtracks <= text_decrypter.stats.backtracks
+
+
+def test_forward_checking_prunes_early(collection):
+    # the 4-letter pattern words all share letters, so EFGH never fits after
+    # ABCD has a match; forward checking finds this before trying CD
+    coded_quote: str = "ABCD CD EFGH"
     decrypter, success = do_decryption(collection, coded_quote)
+    fc_decrypter, fc_success = do_decryption(
+        collection, coded_quote, forward_checking=True)
+    assert not success
+    assert not fc_success
+    assert fc_decrypter.stats.nodes_visited < decrypter.stats.nodes_visited
+    assert fc_decrypter.stats.elapsed_seconds > 0
+    assert fc_decrypter.stats.fetch_seconds > 0
+
+
+def test_node_budget(collection, ordering, forward_checking, monkeypatch):
+    monkeypatch.setattr(SearchBudget, 'CHECK_INTERVAL', 1)
+    coded_quote: str = "ABCD CD DEFG AGHA"
+    decrypter: Decrypter = build_decrypter(
+        collection, coded_quote, ordering, forward_checking,
+        SearchBudget(max_nodes=2))
+    assert not decrypter.decrypt()
+    assert decrypter.budget_exhausted
+    assert decrypter.stats.nodes_visited == 2
+    partial_decode = CypherLetterMap.from_key(
+        decrypter.best_partial_key).decode(coded_quote)
+    assert partial_decode != "____ __ ____ ____"
+    assert "_" in partial_decode
+    # every decoded letter agrees with the solution
+    for actual, expected in zip(partial_decode, "THIS IS SOME TEXT"):
+        assert actual in ("_", expected)
+
+
+def test_budget_stops_solutions(collection2, ordering, forward_checking):
+    token = CancellationToken()
+    token.cancel()
+    decrypter: Decrypter = build_decrypter(
+        collection2, "ABCD CD DEFG AGHA", ordering, forward_checking,
+        SearchBudget(cancel_token=token))
+    assert list(decrypter.iter_solutions()) == []
+    assert decrypter.budget_exhausted
+    assert decrypter.best_partial_key == b"_" * 26
+    decrypter = build_decrypter(
+        collection2, "ABCD CD DEFG AGHA", ordering, forward_checking,
+        SearchBudget(deadline=0))
+    assert decrypter.decrypt_all() == []
+    assert decrypter.budget_exhausted
+
+
+def test_unresolved_words(collection, ordering, forward_checking):
+    # "HIH" and "CBC" have no match words
+    coded_quote: str = "HIH ABCD CD DEFG CBC"
+    _, success = do_decryption(collection, coded_quote, ordering,
+                               forward_checking)
+    assert not success
+    decrypter: Decrypter = build_decrypter(
+        collection, coded_quote, ordering, forward_checking,
+        max_unresolved=1)
+    assert not decrypter.decrypt()
+    decrypter = build_decrypter(collection, coded_quote, ordering,
+                                forward_checking, max_unresolved=2)
+    assert decrypter.decrypt()
+    # unresolved words are only decoded through other words' letters
+    assert decrypter.cypher_letter_map.decode(coded_quote) == \
+        "___ THIS IS SOME IHI"
+    assert sorted(decrypter.unresolved_words) == ["CBC", "HIH"]
+    assert decrypter.word_order[-2:] == ["HIH", "CBC"]
+
+
+def unresolved_solutions(decrypter: Decrypter,
+                         coded_quote: str) -> List[Tuple[str, List[str]]]:
+    return [(CypherLetterMap.from_key(key).decode(coded_quote),
+             decrypter.unresolved_words)
+            for key in decrypter.iter_solutions()]
+
+
+def test_unresolved_solutions_ranked(collection, ordering,
+                                     forward_checking):
+    # partial solutions that a full solution covers are not given
+    coded_quote: str = "ABCD CD DEFG AGHA"
+    decrypter: Decrypter = build_decrypter(
+        collection, coded_quote, ordering, forward_checking,
+        max_unresolved=1)
+    assert unresolved_solutions(decrypter, coded_quote) == \
+        [("THIS IS SOME TEXT", [])]
+    # "EF" has a match word, but it is not consistent with the others
+    coded_quote = "ABCD CD DEFG AGHA EF"
+    decrypter = build_decrypter(collection, coded_quote, ordering,
+                                forward_checking, max_unresolved=1)
+    solutions = unresolved_solutions(decrypter, coded_quote)
+    assert ("THIS IS SOME TEXT OM", ["EF"]) in solutions
+    assert all(len(words) == 1 for _, words in solutions)
+
+
+def test_negative_unresolved(collection):
+    with pytest.raises(ValueError):
+        build_decrypter(collection, "ABCD", max_unresolved=-1)
+
+
+def test_unknown_ordering(collection):
+    with pytest.raises(ValueError):
+        build_decrypter(collection, "ABCD", "random")
+
+
+def decrypt_case(collection, coded_quote: str, expected_decode: str,
+                 ordering: str = Decrypter.TEXT_ORDER,
+                 forward_checking: bool = False):
+    decrypter, success = do_decryption(collection, coded_quote, ordering,
+                                       forward_checking)
     assert success
     cypher_letter_map: CypherLetterMap = decrypter.cypher_letter_map
     assert cypher_letter_map.decode(coded_quote) == expected_decode
 
 
-def do_decryption(collection, coded_quote) -> Tuple[Decrypter, bool]:
-    decrypter: Decrypter = build_decrypter(collection, coded_quote)
+def do_decryption(collection, coded_quote,
+                  ordering: str = Decrypter.TEXT_ORDER,
+                  forward_checking: bool = False
+                  ) -> Tuple[Decrypter, bool]:
+    decrypter: Decrypter = build_decrypter(collection, coded_quote, ordering,
+                                           forward_checking)
     success: bool = decrypter.decrypt()
     return decrypter, success
 
 
 
-def build_decrypter(collection, coded_quote: str) -> Decrypter:
+def build_decrypter(collection, coded_quote: str,
+                    ordering: str = Decrypter.TEXT_ORDER,
+                    forward_checking: bool = False,
+                    budget: Optional[SearchBudget] = None,
+                    max_unresolved: int = 0) -> Decrypter:
     cypher_letter_map: CypherLetterMap = CypherLetterMap()
     word_patterns: WordPatterns = WordPatterns(collection)
     decrypter: Decrypter = Decrypter(
-        coded_quote, cypher_letter_map, word_patterns)
+        coded_quote, cypher_letter_map, word_patterns, ordering,
+        forward_checking, budget, max_unresolved=max_unresolved)
     return decrypter
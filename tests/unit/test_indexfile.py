@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for compiled index files in `decryptoquote` package."""
+import multiprocessing
+import pickle
+import struct
+
+import pytest
+import mongomock
+
+from decryptoquote.indexfile import (IndexFileError, MappedPatternIndex,
+                                     write_index_file)
+from decryptoquote.patternindex import (LayeredPatternIndex,
+                                        invalidate_shared_index)
+from decryptoquote.wordpatterns import WordPatterns
+
+TEST_WORDS = ["THIS", "IS", "SOME", "TEXT", "ALSO", "ISN'T", "THIS"]
+TEST_KEY = ('test', 'indexfile')
+
+
+@pytest.fixture()
+def index_file(tmp_path) -> str:
+    path = str(tmp_path / "test.idx")
+    write_index_file(path, ((word, WordPatterns.word_to_pattern(word))
+                            for word in TEST_WORDS))
+    return path
+
+
+def test_match_words(index_file):
+    index = MappedPatternIndex(index_file, 3)
+    assert index.match_words("0.1.2.3") == ("THIS", "SOME", "ALSO")
+    assert index.match_words("0.1") == ("IS",)
+    assert index.match_words("0.1.2.'.3") == ("ISN'T",)
+    assert index.match_words("0.1.2") == ()
+    assert "0.1.2.0" in index
+    assert "0.1.2" not in index
+    assert len(index) == 4
+    assert index.word_count == 6
+    assert index.version == 3
+
+
+def test_match_array(index_file):
+    index = MappedPatternIndex(index_file)
+    match_array = index.match_array("0.1.2.3")
+    assert match_array.tolist() == [list(b"THIS"), list(b"SOME"),
+                                    list(b"ALSO")]
+    assert not match_array.flags.writeable
+    assert index.match_array("0.1.2") is None
+
+
+def test_pickle(index_file):
+    index = MappedPatternIndex(index_file, 3)
+    copy = pickle.loads(pickle.dumps(index))
+    assert isinstance(copy, MappedPatternIndex)
+    assert copy.version == 3
+    assert copy.match_words("0.1.2.3") == ("THIS", "SOME", "ALSO")
+    # spawned processes get the index by pickling it
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        assert pool.apply(len, (index,)) == len(index)
+
+
+def test_non_ascii_words(tmp_path):
+    path = str(tmp_path / "test.idx")
+    write_index_file(path, [("CAFÉ", "0.1.2.3"), ("THIS", "0.1.2.3")])
+    index = MappedPatternIndex(path)
+    assert index.match_words("0.1.2.3") == ("CAFÉ", "THIS")
+    assert index.match_array("0.1.2.3") is None
+
+
+def test_with_word_patterns(index_file):
+    index = MappedPatternIndex(index_file)
+    new_index = index.with_word_patterns([("NEW", "0.1.2")])
+    # the new words go on top of the mapped index, which is not copied
+    assert isinstance(new_index, LayeredPatternIndex)
+    assert new_index.version == index.version + 1
+    assert new_index.match_words("0.1.2") == ("NEW",)
+    assert new_index.match_words("0.1.2.3") == ("THIS", "SOME", "ALSO")
+    assert index.match_words("0.1.2") == ()
+
+
+def test_invalid_files(index_file, tmp_path):
+    with open(index_file, 'rb') as file:
+        data = bytearray(file.read())
+    path = tmp_path / "bad.idx"
+
+    def check_invalid(bad_data: bytes):
+        path.write_bytes(bad_data)
+        with pytest.raises(IndexFileError):
+            MappedPatternIndex(str(path))
+
+    check_invalid(b"")
+    check_invalid(b"not an index file at all, sorry")
+    check_invalid(bytes(data[:-1]))
+    corrupt_data = bytearray(data)
+    corrupt_data[-1] ^= 0xFF
+    check_invalid(bytes(corrupt_data))
+    path.write_bytes(bytes(corrupt_data))
+    MappedPatternIndex(str(path), verify=False)  # checksum not checked
+    new_format = bytearray(data)
+    struct.pack_into('<I', new_format, 8, 99)
+    check_invalid(bytes(new_format))
+
+
+def test_word_patterns_index_file(tmp_path):
+    corpus_path = tmp_path / "corpus.txt"
+    corpus_path.write_text("\n".join(word.lower() for word in TEST_WORDS))
+    index_path = str(tmp_path / "corpus.idx")
+    WordPatterns.compile_index_file(str(corpus_path), index_path)
+    collection: mongomock.Collection = mongomock.MongoClient().db.collection
+    invalidate_shared_index(TEST_KEY)
+    word_patterns = WordPatterns(collection, index_key=TEST_KEY,
+                                 index_file=index_path)
+    assert isinstance(word_patterns.pattern_index, MappedPatternIndex)
+    assert word_patterns.code_words_to_match_words(["ABCD", "XY"]) == {
+        "ABCD": ["THIS", "SOME", "ALSO"], "XY": ["IS"]}
+    word_patterns.add_new_words(["new", "word"])
+    assert word_patterns.pattern_to_match_words("0.1.2") == ["NEW"]
+    # added words are kept when the index is loaded again
+    invalidate_shared_index(TEST_KEY)
+    assert word_patterns.pattern_to_match_words("0.1.2") == ["NEW"]
+    assert word_patterns.pattern_to_match_words("0.1.2.3") == [
+        "THIS", "SOME", "ALSO", "WORD"]
+    copy = pickle.loads(pickle.dumps(word_patterns.pattern_index))
+    assert copy.match_words("0.1.2.3") == ("THIS", "SOME", "ALSO", "WORD")
+    invalidate_shared_index(TEST_KEY)
+
+
+def test_index_file_ranked(tmp_path):
+    corpus_path = tmp_path / "corpus.txt"
+    corpus_path.write_text("this 1\nsome 3\nalso 2\nis")
+    index_path = str(tmp_path / "corpus.idx")
+    WordPatterns.compile_index_file(str(corpus_path), index_path)
+    index = MappedPatternIndex(index_path)
+    assert index.match_words("0.1.2.3") == ("SOME", "ALSO", "THIS")
+    assert index.match_words("0.1") == ("IS",)
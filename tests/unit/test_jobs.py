@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for JobManager in `decryptoquote` package."""
+import threading
+import time
+
+import pytest
+
+from decryptoquote.jobs import (JobManager, QueueFullError, JOB_CANCELLED,
+                                JOB_DONE, JOB_FAILED)
+
+
+@pytest.fixture()
+def job_manager() -> JobManager:
+    manager = JobManager(workers=1, max_queue=2, timeout=60)
+    yield manager
+    manager.shutdown()
+
+
+def solve(coded_quote, budget=None):
+    return [{'decoded_quote': coded_quote.lower()}]
+
+
+def test_job_done(job_manager):
+    job = job_manager.submit(solve, "ABC")
+    assert job.wait(5)
+    assert job.status == JOB_DONE
+    assert job_manager.get(job.id) is job
+    assert job.as_dict() == {'id': job.id, 'status': JOB_DONE,
+                             'solutions': [{'decoded_quote': "abc"}],
+                             'error': None}
+    assert job_manager.unfinished_jobs == 0
+    assert job_manager.get("no such job") is None
+
+
+def test_job_budget(job_manager):
+    budgets = []
+
+    def solve_with_budget(budget=None):
+        budgets.append(budget)
+        return []
+
+    job = job_manager.submit(solve_with_budget)
+    job.wait(5)
+    budget = budgets[0]
+    assert 0 < budget.deadline - job.submitted <= 60
+    assert budget.cancel_token is job.cancel_token
+
+
+def test_job_failed(job_manager):
+    def fail(budget=None):
+        raise ValueError("bad puzzle")
+
+    job = job_manager.submit(fail)
+    job.wait(5)
+    assert job.status == JOB_FAILED
+    assert job.error == "bad puzzle"
+    assert job.solutions is None
+
+
+def test_queue_full_and_cancel(job_manager):
+    started = threading.Event()
+
+    def wait_for_cancel(budget=None):
+        started.set()
+        while not budget.is_exhausted(0):
+            time.sleep(0.01)
+        return [{'decoded_quote': "partial"}]
+
+    running_job = job_manager.submit(wait_for_cancel)
+    started.wait(5)
+    queued_job = job_manager.submit(solve, "ABC")
+    with pytest.raises(QueueFullError):
+        job_manager.submit(solve, "ABC")
+    assert job_manager.cancel(queued_job.id)
+    assert job_manager.cancel(running_job.id)
+    assert running_job.wait(5) and queued_job.wait(5)
+    assert running_job.status == JOB_CANCELLED
+    assert running_job.solutions == [{'decoded_quote': "partial"}]
+    assert queued_job.status == JOB_CANCELLED
+    assert not job_manager.cancel(running_job.id)
+    # there is room in the queue again
+    assert job_manager.submit(solve, "ABC").wait(5)
+
+
+def test_finished_jobs_expire():
+    job_manager = JobManager(workers=1, retention=0)
+    job = job_manager.submit(solve, "ABC")
+    job.wait(5)
+    time.sleep(0.01)
+    assert job_manager.get(job.id) is None
+    job_manager.shutdown()
+
+
+def test_job_listener():
+    finished_jobs = []
+    job_manager = JobManager(workers=1, listener=finished_jobs.append)
+    job = job_manager.submit(solve, "ABC")
+    job.wait(5)
+    failing_manager = JobManager(workers=1, listener=lambda job: 1 / 0)
+    other_job = failing_manager.submit(solve, "ABC")
+    other_job.wait(5)
+    job_manager.shutdown()
+    failing_manager.shutdown()
+    assert finished_jobs == [job]
+    assert job.submitted <= job.started <= job.finished
+    assert other_job.status == JOB_DONE
@@ -9,7 +9,9 @@ import pytest
 import pyfakefs
 import mongomock
 
-from decryptoquote.wordpatterns import WordPatterns
+from decryptoquote import patternindex
+from decryptoquote.patternindex import invalidate_shared_index
+from decryptoquote.wordpatterns import UNRANKED, WordPatterns, read_corpus
 
 CORPUS_FILE_PATH = '/test.txt'
 PATTERNS_FILE_PATH = '/test_patterns.json'
@@ -59,6 +61,83 @@ def test_init_overwrite_patterns(fs, collection):
                  CORPUS_FILE_PATH)
 
 
+def test_rebuild_from_corpus(fs, collection):
+    fs.create_file(CORPUS_FILE_PATH, contents=TEST_CORPUS + "\nthis\n\nnew")
+    model = WordPatterns(collection)
+    progress = []
+    word_count = model.rebuild_from_corpus(CORPUS_FILE_PATH, chunk_size=3,
+                                           progress=progress.append)
+    assert word_count == len(TEST_CORPUS_LIST) + 1
+    assert progress == [3, 6, 7]  # duplicate "this" is only loaded once
+    assert model.pattern_to_match_words("0.1.2") == ["NEW"]
+    assert sorted(model.pattern_to_match_words("0.1.2.3")) == [
+        "ALSO", "SOME", "THIS"]
+    database = collection.database
+    assert sorted(database.list_collection_names()) == [
+        collection.name, collection.name + WordPatterns.VERSION_SUFFIX]
+    assert model.store_version() == 1
+    assert set(collection.index_information()) == {
+        '_id_', 'word_1', 'pattern_1_rank_1'}
+
+
+def test_rebuild_leaves_other_shadows(fs, collection):
+    fs.create_file(CORPUS_FILE_PATH, contents="new")
+    database = collection.database
+    # a shadow collection of a rebuild that is still running
+    other_shadow = database[collection.name + WordPatterns.SHADOW_SUFFIX]
+    other_shadow.insert_one({WordPatterns.WORD_KEY: "OTHER"})
+    WordPatterns(collection).rebuild_from_corpus(CORPUS_FILE_PATH)
+    assert other_shadow.count_documents({}) == 1
+    assert collection.count_documents({}) == 1
+    # a failed rebuild drops its shadow collection
+    with pytest.raises(ValueError):
+        WordPatterns(collection).rebuild_from_corpus(CORPUS_FILE_PATH,
+                                                     progress=fail)
+    assert sorted(database.list_collection_names()) == [
+        collection.name, other_shadow.name,
+        collection.name + WordPatterns.VERSION_SUFFIX]
+    assert collection.count_documents({}) == 1
+
+
+def fail(word_count: int):
+    raise ValueError("Rebuild failed")
+
+
+def test_read_corpus(fs):
+    fs.create_file(CORPUS_FILE_PATH, contents=TEST_CORPUS)
+    assert list(read_corpus(CORPUS_FILE_PATH)) == [
+        (word.upper(), rank) for rank, word in enumerate(TEST_CORPUS_LIST)]
+
+
+def test_read_corpus_frequencies(fs):
+    fs.create_file(CORPUS_FILE_PATH,
+                   contents="this 5\nis 20\n\ntext\nalso 5\nsome 7.5")
+    assert list(read_corpus(CORPUS_FILE_PATH)) == [
+        ("THIS", 2), ("IS", 0), ("TEXT", 4), ("ALSO", 3), ("SOME", 1)]
+
+
+def test_read_corpus_invalid_frequency(fs):
+    fs.create_file(CORPUS_FILE_PATH, contents="this 5\nis often")
+    with pytest.raises(ValueError):
+        read_corpus(CORPUS_FILE_PATH)
+
+
+def test_match_words_ranked(fs, collection):
+    fs.create_file(CORPUS_FILE_PATH, contents="this 1\nsome 3\nalso 2")
+    model = WordPatterns(collection, True, CORPUS_FILE_PATH)
+    model.add_new_words(["code"])
+    assert collection.find_one({WordPatterns.WORD_KEY: "CODE"})[
+        WordPatterns.RANK_KEY] == UNRANKED
+    ranked_words = ["SOME", "ALSO", "THIS", "CODE"]
+    assert model.pattern_to_match_words("0.1.2.3") == ranked_words
+    assert model.patterns_to_match_words(["0.1.2.3"]) == {
+        "0.1.2.3": ranked_words}
+    invalidate_shared_index(('test', 'ranked'))
+    indexed_model = WordPatterns(collection, index_key=('test', 'ranked'))
+    assert indexed_model.pattern_to_match_words("0.1.2.3") == ranked_words
+    invalidate_shared_index(('test', 'ranked'))
+
+
 def test_missing_corpus_file(fs, collection):
     bad_file_path = '/bad.txt'
     with pytest.raises(OSError) as e:
@@ -109,14 +188,116 @@ def test_code_word_to_match_words(model):
     assert model.code_word_to_match_words(".") == ["."]
 
 
+def test_patterns_to_match_words(model, collection, monkeypatch):
+    find_calls = []
+    original_find = collection.find
+
+    def counting_find(*args, **kwargs):
+        find_calls.append(args)
+        return original_find(*args, **kwargs)
+
+    monkeypatch.setattr(collection, 'find', counting_find)
+    result = model.patterns_to_match_words(
+        ["0.1.2.3", "0.1", "0.1.2", "0.1", "!"])
+    assert len(find_calls) == 1
+    assert result.keys() == {"0.1.2.3", "0.1", "0.1.2", "!"}
+    assert sorted(result["0.1.2.3"]) == ["ALSO", "SOME", "THIS"]
+    assert result["0.1"] == ["IS"]
+    assert result["0.1.2"] == []
+    assert result["!"] == ["!"]
+
+
+def test_code_words_to_match_words(model):
+    result = model.code_words_to_match_words(
+        ["ABCA", "AB", "ABC", "AB", "ABC'D", ","])
+    assert result == {"ABCA": ["TEXT"], "AB": ["IS"], "ABC": [],
+                      "ABC'D": ["ISN'T"], ",": [","]}
+
+
 def test_add_new_words(model):
     new_words = ["NEW", "words"]
     for new_word in new_words:
         assert model.code_word_to_match_words(new_word) == []
-    model.add_new_words(new_words)
+    assert model.add_new_words(new_words) == 2
     for new_word in new_words:
         assert new_word.upper() in model.code_word_to_match_words(new_word)
 
 
+def test_add_new_words_existing(model, collection):
+    assert model.add_new_words(["this", "new", "NEW", ""]) == 1
+    assert model.add_new_words(["new"]) == 0
+    assert model.add_new_words([]) == 0
+    assert collection.count_documents({WordPatterns.WORD_KEY: "THIS"}) == 1
+    assert collection.count_documents({WordPatterns.WORD_KEY: "NEW"}) == 1
+    assert collection.find_one({WordPatterns.WORD_KEY: "NEW"})[
+        WordPatterns.PATTERN_KEY] == "0.1.2"
+
+
 def test_save_corpus_from_patterns(model):
     assert True
+
+
+@pytest.fixture()
+def indexed_model(collection) -> WordPatterns:
+    index_key = ('test', 'languagemodel')
+    invalidate_shared_index(index_key)
+    yield WordPatterns(collection, index_key=index_key)
+    invalidate_shared_index(index_key)
+
+
+def test_indexed_model_words(indexed_model, collection):
+    assert indexed_model.pattern_index.word_count == 6
+    # lookups no longer touch the collection
+    collection.delete_many({})
+    result = indexed_model.pattern_to_match_words("0.1.2.3")
+    assert sorted(result) == ["ALSO", "SOME", "THIS"]
+    assert indexed_model.code_word_to_match_words("AB") == ["IS"]
+    assert indexed_model.code_word_to_match_words("ABC") == []
+    assert indexed_model.code_word_to_match_words("!") == ["!"]
+    assert indexed_model.code_words_to_match_words(["AB", "ABCA", "."]) == {
+        "AB": ["IS"], "ABCA": ["TEXT"], ".": ["."]}
+
+
+def test_indexed_add_new_words(indexed_model, collection):
+    old_version = indexed_model.pattern_index.version
+    new_words = ["NEW", "words", "new"]
+    for new_word in new_words:
+        assert indexed_model.code_word_to_match_words(new_word) == []
+    assert indexed_model.add_new_words(new_words) == 2
+    new_version = indexed_model.pattern_index.version
+    assert new_version > old_version
+    for new_word in new_words:
+        assert new_word.upper() in \
+               indexed_model.code_word_to_match_words(new_word)
+    assert collection.count_documents({WordPatterns.WORD_KEY: "NEW"}) == 1
+    # words already in the index don't change it
+    assert indexed_model.add_new_words(["this", "new"]) == 0
+    assert indexed_model.pattern_index.version == new_version
+
+
+def test_rebuild_replaces_index(fs, indexed_model):
+    fs.create_file(CORPUS_FILE_PATH, contents="new")
+    assert indexed_model.code_word_to_match_words("AB") == ["IS"]
+    indexed_model.rebuild_from_corpus(CORPUS_FILE_PATH)
+    assert indexed_model.code_word_to_match_words("AB") == []
+    assert indexed_model.code_word_to_match_words("ABC") == ["NEW"]
+
+
+def test_index_reloaded_after_other_changes(fs, indexed_model, collection,
+                                            monkeypatch):
+    monkeypatch.setattr(patternindex, 'STORE_CHECK_SECONDS', 0)
+    # a different index key stands in for another process's index
+    other_key = ('test', 'languagemodel', 'other')
+    invalidate_shared_index(other_key)
+    other_model = WordPatterns(collection, index_key=other_key)
+    assert other_model.code_word_to_match_words("ABC") == []
+    assert indexed_model.add_new_words(["new"]) == 1
+    assert indexed_model.store_version() == 1
+    assert other_model.code_word_to_match_words("ABC") == ["NEW"]
+    # the process that added the words does not need to reload its index
+    version = indexed_model.pattern_index.version
+    assert indexed_model.pattern_index.version == version
+    fs.create_file(CORPUS_FILE_PATH, contents="cat")
+    indexed_model.rebuild_from_corpus(CORPUS_FILE_PATH)
+    assert other_model.code_word_to_match_words("ABC") == ["CAT"]
+    invalidate_shared_index(other_key)
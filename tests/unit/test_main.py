@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for the command line tool in `decryptoquote` package."""
+import io
+import json
+from typing import Any, Dict, List
+
+import pytest
+
+from decryptoquote.__main__ import main, solve_stream
+from decryptoquote.budget import BUDGET_EXHAUSTED, SOLVED
+from decryptoquote.wordpatterns import WordPatterns
+
+TEST_WORDS = ["THIS", "ALSO", "SOME", "IS", "TEXT", "TENT", "ISN'T"]
+PUZZLES = [
+    {'id': 'first', 'quote': "ABCD CD DEFG AGHA.", 'author': "AB"},
+    "not json",
+    {'quote': "ABC", 'hints': ["cat"]},
+    [1, 2],
+    {'id': 7},
+    {'quote': "ABC"},
+]
+
+
+@pytest.fixture()
+def index_file(tmp_path) -> str:
+    corpus_path = tmp_path / "corpus.txt"
+    corpus_path.write_text("\n".join(TEST_WORDS) + "\n")
+    index_path = str(tmp_path / "test.idx")
+    WordPatterns.compile_index_file(str(corpus_path), index_path)
+    return index_path
+
+
+@pytest.fixture()
+def input_text() -> str:
+    lines = [puzzle if isinstance(puzzle, str) else json.dumps(puzzle)
+             for puzzle in PUZZLES]
+    lines.insert(2, "")  # blank lines are skipped
+    return "\n".join(lines) + "\n"
+
+
+def read_results(text: str) -> List[Dict[str, Any]]:
+    return [json.loads(line) for line in text.splitlines()]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_solve_stream(index_file, input_text, workers):
+    output = io.StringIO()
+    count = solve_stream(io.StringIO(input_text), output, workers=workers,
+                         max_solutions=None, index_file=index_file)
+    assert count == len(PUZZLES)
+    results = read_results(output.getvalue())
+    assert [x['line'] for x in results] == [1, 2, 4, 5, 6, 7]
+    assert results[0]['id'] == 'first'
+    assert sorted(x['decoded_quote'] for x in results[0]['solutions']) == \
+        ["THIS IS SOME TENT.", "THIS IS SOME TEXT."]
+    assert results[0]['solutions'][0]['decoded_author'] == "TH"
+    assert results[0]['error'] is None
+    assert results[1]['error'].startswith("Invalid JSON")
+    assert [x['decoded_quote'] for x in results[2]['solutions']] == ["CAT"]
+    assert results[3]['error'] == "Puzzle must be a JSON object"
+    assert results[4] == {'line': 6, 'id': 7, 'solutions': [],
+                          'error': "Puzzle has no quote"}
+    # hints are only used for their own puzzle
+    assert results[5] == {'line': 7, 'solutions': [], 'error': None}
+
+
+def test_main(index_file, input_text, tmp_path, capsys):
+    input_path = tmp_path / "puzzles.jsonl"
+    input_path.write_text(input_text)
+    output_path = tmp_path / "results.jsonl"
+    main([str(input_path), '--output', str(output_path), '--workers', '1',
+          '--index', index_file])
+    results = read_results(output_path.read_text())
+    assert len(results[0]['solutions']) == 1
+    assert results[0]['solutions'][0]['status'] == SOLVED
+    assert results[0]['solutions'][0]['coding_key'] is None
+    main([str(input_path), '--workers', '1', '--index', index_file,
+          '--mode', 'all', '--max-nodes', '0', '--show-cypher'])
+    results = read_results(capsys.readouterr().out)
+    assert [x['status'] for x in results[0]['solutions']] == \
+        [BUDGET_EXHAUSTED]
+    with pytest.raises(SystemExit):
+        main(['--workers', '0'])
+    with pytest.raises(SystemExit):
+        main(['--mode', 'some'])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_solve_stream_bad_hints(index_file, workers):
+    input_text = "\n".join([
+        json.dumps({'quote': "AB"}),
+        json.dumps({'quote': "ABCD", 'hints': 5}),
+        json.dumps({'quote': "ABCD", 'hints': ["THIS", 5]}),
+        json.dumps({'quote': "AB", 'author': 5}),
+        json.dumps({'quote': "ABCD CD"}),
+    ])
+    output = io.StringIO()
+    solve_stream(io.StringIO(input_text), output, workers=workers,
+                 index_file=index_file)
+    results = read_results(output.getvalue())
+    assert [x['error'] for x in results] == [
+        None, "Puzzle's hints must be a list of strings",
+        "Puzzle's hints must be a list of strings",
+        "Puzzle's author must be a string", None]
+    assert [len(x['solutions']) for x in results] == [1, 0, 0, 0, 1]
+
+
+def test_compile_index(tmp_path):
+    corpus_path = tmp_path / "corpus.txt"
+    corpus_path.write_text("\n".join(TEST_WORDS) + "\n")
+    index_path = tmp_path / "compiled.idx"
+    main(['compile-index', str(corpus_path), str(index_path)])
+    output = io.StringIO()
+    solve_stream(io.StringIO(json.dumps({'quote': "AB"})), output,
+                 workers=1, index_file=str(index_path))
+    results = read_results(output.getvalue())
+    assert [x['decoded_quote'] for x in results[0]['solutions']] == ["IS"]
+    with pytest.raises(SystemExit):
+        main(['compile-index', str(corpus_path)])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for solve metrics in `decryptoquote` package."""
+from prometheus_client import REGISTRY
+
+from decryptoquote import metrics
+from decryptoquote.budget import BUDGET_EXHAUSTED, SOLVED
+from decryptoquote.decrypter import SearchStats
+from decryptoquote.decryptoquote import (ANNEALING_MODE, DICTIONARY_MODE,
+                                         SolveReport)
+from decryptoquote.jobs import JOB_DONE, Job
+
+
+def sample(name, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_observe_solve():
+    stats = SearchStats()
+    stats.nodes_visited = 40
+    stats.elapsed_seconds = 0.5
+    stats.fetch_seconds = 0.01
+    solves = sample('decryptoquote_solves_total',
+                    mode=DICTIONARY_MODE, status=SOLVED)
+    nodes = sample('decryptoquote_search_nodes_total', mode=DICTIONARY_MODE)
+    fetches = sample('decryptoquote_candidate_fetch_seconds_count')
+    metrics.observe_solve(SolveReport(DICTIONARY_MODE, SOLVED, 2, stats,
+                                      False))
+    assert sample('decryptoquote_solves_total', mode=DICTIONARY_MODE,
+                  status=SOLVED) == solves + 1
+    assert sample('decryptoquote_search_nodes_total',
+                  mode=DICTIONARY_MODE) == nodes + 40
+    assert sample('decryptoquote_candidate_fetch_seconds_count') == \
+        fetches + 1
+
+    cache_hits = sample('decryptoquote_cache_hits_total',
+                        mode=DICTIONARY_MODE)
+    metrics.observe_solve(SolveReport(DICTIONARY_MODE, SOLVED, 2, None,
+                                      True))
+    assert sample('decryptoquote_cache_hits_total',
+                  mode=DICTIONARY_MODE) == cache_hits + 1
+    assert sample('decryptoquote_search_nodes_total',
+                  mode=DICTIONARY_MODE) == nodes + 40
+
+    timeouts = sample('decryptoquote_timeouts_total', mode=ANNEALING_MODE)
+    no_solutions = sample('decryptoquote_solves_total', mode=ANNEALING_MODE,
+                          status=metrics.NO_SOLUTION)
+    metrics.observe_solve(SolveReport(ANNEALING_MODE, BUDGET_EXHAUSTED, 1,
+                                      stats, False))
+    metrics.observe_solve(SolveReport(ANNEALING_MODE, None, 0, stats,
+                                      False))
+    assert sample('decryptoquote_timeouts_total',
+                  mode=ANNEALING_MODE) == timeouts + 1
+    assert sample('decryptoquote_solves_total', mode=ANNEALING_MODE,
+                  status=metrics.NO_SOLUTION) == no_solutions + 1
+    # annealing solves fetch no match words
+    assert sample('decryptoquote_candidate_fetch_seconds_count') == \
+        fetches + 1
+
+
+def test_observe_job():
+    job = Job()
+    job.status = JOB_DONE
+    job.started = job.submitted + 2
+    jobs = sample('decryptoquote_jobs_total', status=JOB_DONE)
+    queued = sample('decryptoquote_job_queue_seconds_sum')
+    metrics.observe_job(job)
+    assert sample('decryptoquote_jobs_total', status=JOB_DONE) == jobs + 1
+    assert sample('decryptoquote_job_queue_seconds_sum') == \
+        queued + 2
+
+
+def test_render():
+    metrics.observe_request('get_index', 0.1)
+    body, content_type = metrics.render()
+    assert content_type.startswith('text/plain')
+    assert b'decryptoquote_request_seconds_count{endpoint="get_index"}' \
+        in body
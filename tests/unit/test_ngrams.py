@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for the quadgram model in `decryptoquote` package."""
+import numpy as np
+import pytest
+
+from decryptoquote.ngrams import (BOUNDARY, QUADGRAM_COUNT, QuadgramModel,
+                                  text_quadgrams, word_symbols)
+
+TEST_WORD_RANKS = [("THE", 0), ("A", 1), ("ISN'T", 2), ("THIS", 3)]
+
+
+@pytest.fixture()
+def model() -> QuadgramModel:
+    return QuadgramModel.from_word_ranks(TEST_WORD_RANKS)
+
+
+def test_word_symbols():
+    assert word_symbols("the") == [BOUNDARY, 19, 7, 4, BOUNDARY]
+    assert word_symbols("A") == [BOUNDARY, 0, BOUNDARY, BOUNDARY]
+    assert word_symbols("ISN'T") == word_symbols("ISNT")
+    assert word_symbols(",") == []
+
+
+def test_text_quadgrams():
+    quadgrams = text_quadgrams("THE A, .")
+    assert quadgrams.tolist() == [[BOUNDARY, 19, 7, 4], [19, 7, 4, BOUNDARY],
+                                  [BOUNDARY, 0, BOUNDARY, BOUNDARY]]
+    assert text_quadgrams("").shape == (0, 4)
+
+
+def test_model(model):
+    assert model.table.shape == (QUADGRAM_COUNT,)
+    assert model.table.dtype == np.float32
+    assert not model.table.flags.writeable
+    floor = model.table.min()
+    assert model.score("THE") > model.score("THIS") > model.score("XQZJ")
+    assert model.score("XQZJ") == pytest.approx(3 * floor)
+    assert model.score("") == 0.0
+
+
+def test_model_invalid():
+    with pytest.raises(ValueError):
+        QuadgramModel(np.zeros(10))
+    with pytest.raises(ValueError):
+        QuadgramModel.from_word_ranks([(",", 0)])
+
+
+def test_save_load(model, tmp_path):
+    path = str(tmp_path / "quadgrams.npy")
+    model.save(path)
+    loaded_model = QuadgramModel.load(path)
+    assert np.array_equal(loaded_model.table, model.table)
+    assert loaded_model.score("THIS") == model.score("THIS")
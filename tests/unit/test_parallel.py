@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for ParallelDecrypter in `decryptoquote` package."""
+import time
+from typing import Dict, List
+
+import pytest
+import mongomock
+
+from decryptoquote import parallel
+from decryptoquote.budget import SearchBudget
+from decryptoquote.cypherlettermap import CypherLetterMap
+from decryptoquote.decrypter import Decrypter
+from decryptoquote.parallel import ParallelDecrypter
+from decryptoquote.patternindex import invalidate_shared_index
+from decryptoquote.wordpatterns import WordPatterns
+
+TEST_PATTERNS = {
+        "0.1.2.3": ["THIS", "ALSO", "SOME"],
+        "0.1": ["IS"],
+        "0.1.2.0": ["TEXT", "TENT"],
+        "0.1.2.'.3": ["ISN'T"]
+    }
+TEST_KEY = ('test', 'parallel')
+CODED_QUOTE = "ABCD CD DEFG AGHA."
+WAIT_SECONDS = 10
+
+_original_solve_branch = parallel._solve_branch
+
+
+def waiting_solve_branch(*args):
+    result = _original_solve_branch(*args)
+    if result[0]:
+        # keep running after finding solutions, until the search is stopped
+        parallel._worker_cancel_event.wait(WAIT_SECONDS)
+    return result
+
+
+@pytest.fixture()
+def word_patterns() -> WordPatterns:
+    collection: mongomock.Collection = mongomock.MongoClient().db.collection
+    collection.insert_many([
+        {WordPatterns.WORD_KEY: word, WordPatterns.PATTERN_KEY: pattern}
+        for pattern, words in TEST_PATTERNS.items() for word in words])
+    invalidate_shared_index(TEST_KEY)
+    yield WordPatterns(collection, index_key=TEST_KEY)
+    invalidate_shared_index(TEST_KEY)
+
+
+@pytest.fixture(params=Decrypter.ORDERINGS)
+def ordering(request) -> str:
+    return request.param
+
+
+def decode_all(keys: List[bytes]) -> List[str]:
+    return sorted(CypherLetterMap.from_key(key).decode(CODED_QUOTE)
+                  for key in keys)
+
+
+def test_iter_branches(word_patterns, ordering):
+    decrypter = Decrypter(CODED_QUOTE, CypherLetterMap(), word_patterns,
+                          ordering)
+    branches: List[Dict[str, str]] = list(decrypter.iter_branches(2))
+    assert all(len(branch) == 2 for branch in branches)
+    assert len(set(tuple(branch.items()) for branch in branches)) == \
+        len(branches)
+    # each solution belongs to exactly one branch
+    solutions: List[bytes] = []
+    for branch in branches:
+        solutions.extend(Decrypter(
+            CODED_QUOTE, CypherLetterMap(), word_patterns, ordering,
+            fixed_matches=branch).iter_solutions())
+    assert decode_all(solutions) == ["THIS IS SOME TENT.",
+                                     "THIS IS SOME TEXT."]
+
+
+@pytest.mark.parametrize('split_depth', [1, 2, 10])
+def test_all_solutions(word_patterns, ordering, split_depth):
+    expected: List[bytes] = list(Decrypter(
+        CODED_QUOTE, CypherLetterMap(), word_patterns,
+        ordering).iter_solutions())
+    decrypter = ParallelDecrypter(CODED_QUOTE, word_patterns, workers=2,
+                                  ordering=ordering, split_depth=split_depth)
+    assert decode_all(decrypter.decrypt_all()) == decode_all(expected)
+    assert not decrypter.budget_exhausted
+    assert decrypter.stats.nodes_visited > 0
+
+
+def test_first_solution(word_patterns, ordering):
+    decrypter = ParallelDecrypter(CODED_QUOTE, word_patterns, workers=2,
+                                  ordering=ordering)
+    solutions = list(decrypter.iter_solutions(max_solutions=1))
+    assert len(solutions) == 1
+    assert decode_all(solutions)[0].startswith("THIS IS SOME TE")
+
+
+def test_no_solution(word_patterns):
+    decrypter = ParallelDecrypter("ABCDE", word_patterns, workers=2)
+    assert decrypter.decrypt_all() == []
+    assert not decrypter.budget_exhausted
+
+
+def test_budget_exhausted(word_patterns):
+    decrypter = ParallelDecrypter(CODED_QUOTE, word_patterns, workers=2,
+                                  budget=SearchBudget(deadline=0))
+    assert decrypter.decrypt_all() == []
+    assert decrypter.budget_exhausted
+
+
+def test_needs_pattern_index():
+    collection: mongomock.Collection = mongomock.MongoClient().db.collection
+    with pytest.raises(ValueError):
+        ParallelDecrypter(CODED_QUOTE, WordPatterns(collection))
+
+
+def test_solutions_sent_when_found(word_patterns, monkeypatch):
+    monkeypatch.setattr(parallel, '_solve_branch', waiting_solve_branch)
+    decrypter = ParallelDecrypter(CODED_QUOTE, word_patterns, workers=2)
+    start_time = time.perf_counter()
+    solutions = list(decrypter.iter_solutions(max_solutions=1))
+    # given before the branch that found it finished
+    assert time.perf_counter() - start_time < WAIT_SECONDS
+    assert len(solutions) == 1
+
+
+def test_budget_keeps_solutions(word_patterns, monkeypatch):
+    monkeypatch.setattr(parallel, '_solve_branch', waiting_solve_branch)
+    decrypter = ParallelDecrypter(CODED_QUOTE, word_patterns, workers=2,
+                                  budget=SearchBudget.from_timeout(1))
+    assert decode_all(decrypter.decrypt_all()) == ["THIS IS SOME TENT.",
+                                                   "THIS IS SOME TEXT."]
+    assert decrypter.budget_exhausted
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for PatternIndex in `decryptoquote` package."""
+import pytest
+
+from decryptoquote import patternindex
+from decryptoquote.patternindex import (LayeredPatternIndex, PatternIndex,
+                                        get_shared_index,
+                                        invalidate_shared_index,
+                                        publish_shared_index,
+                                        words_to_match_array)
+
+TEST_PATTERNS = {
+        "0.1.2.3": ["THIS", "ALSO", "SOME"],
+        "0.1": ["IS"],
+        "0.1.2.0": ["TEXT"],
+        "0.1.2.'.3": ["ISN'T"]
+    }
+TEST_KEY = ('test', 'patternindex')
+
+
+@pytest.fixture()
+def index() -> PatternIndex:
+    return PatternIndex(TEST_PATTERNS)
+
+
+@pytest.fixture()
+def shared_key():
+    invalidate_shared_index(TEST_KEY)
+    yield TEST_KEY
+    invalidate_shared_index(TEST_KEY)
+
+
+def test_match_words(index):
+    assert index.match_words("0.1.2.3") == ("THIS", "ALSO", "SOME")
+    assert index.match_words("0.1") == ("IS",)
+    assert index.match_words("0.1.2.'.3") == ("ISN'T",)
+    assert index.match_words("0.1.2") == ()
+    assert "0.1" in index
+    assert "0.1.2" not in index
+    assert len(index) == 4
+    assert index.word_count == 6
+    assert index.version == 0
+
+
+def test_match_array(index):
+    match_array = index.match_array("0.1.2.3")
+    assert match_array.shape == (3, 4)
+    assert bytes(match_array[1]) == b"ALSO"
+    assert index.match_array("0.1.2.3") is match_array
+    assert bytes(index.match_array("0.1.2.'.3")[0]) == b"ISN'T"
+    assert index.match_array("0.1.2") is None
+
+
+def test_words_to_match_array():
+    match_array = words_to_match_array(["THIS", "SOME"])
+    assert match_array.tolist() == [list(b"THIS"), list(b"SOME")]
+    assert not match_array.flags.writeable
+    assert words_to_match_array([]) is None
+    assert words_to_match_array(["THIS", "IS"]) is None
+    assert words_to_match_array(["CAFÉ"]) is None
+
+
+def test_from_word_patterns():
+    index = PatternIndex.from_word_patterns(
+        [("THIS", "0.1.2.3"), ("IS", "0.1"), ("THIS", "0.1.2.3")], 3)
+    assert index.match_words("0.1.2.3") == ("THIS",)
+    assert index.match_words("0.1") == ("IS",)
+    assert index.version == 3
+
+
+def test_with_word_patterns(index):
+    new_index = index.with_word_patterns(
+        [("NEW", "0.1.2"), ("THIS", "0.1.2.3"), ("WORD", "0.1.2.3")])
+    assert new_index.version == index.version + 1
+    assert new_index.match_words("0.1.2") == ("NEW",)
+    assert new_index.match_words("0.1.2.3") == (
+        "THIS", "ALSO", "SOME", "WORD")
+    # original index is unchanged
+    assert index.match_words("0.1.2") == ()
+    assert index.match_words("0.1.2.3") == ("THIS", "ALSO", "SOME")
+
+
+def test_layered_index(index):
+    layered_index = LayeredPatternIndex(
+        index, {"0.1.2": ["NEW", "NEW"], "0.1.2.3": ["THIS", "WORD"]}, 4)
+    assert layered_index.version == 4
+    assert layered_index.match_words("0.1.2") == ("NEW",)
+    assert layered_index.match_words("0.1.2.3") == (
+        "THIS", "ALSO", "SOME", "WORD")
+    assert layered_index.match_words("0.1") == ("IS",)
+    assert layered_index.match_array("0.1.2.3").tolist()[-1] == \
+        list(b"WORD")
+    # patterns with no added words use the base index's arrays
+    assert layered_index.match_array("0.1") is index.match_array("0.1")
+    assert len(layered_index) == len(index) + 1
+    assert "0.1.2" in layered_index and "0.1" in layered_index
+    assert layered_index.word_count == index.word_count + 2
+    new_index = layered_index.with_word_patterns([("CAT", "0.1.2")])
+    assert isinstance(new_index, LayeredPatternIndex)
+    assert new_index.version == 5
+    assert new_index.match_words("0.1.2") == ("NEW", "CAT")
+    assert layered_index.match_words("0.1.2") == ("NEW",)
+    assert index.match_words("0.1.2") == ()
+
+
+def test_shared_index_loaded_once(shared_key):
+    loaded_versions = []
+
+    def loader(version: int) -> PatternIndex:
+        loaded_versions.append(version)
+        return PatternIndex(TEST_PATTERNS, version)
+
+    index1 = get_shared_index(shared_key, loader)
+    index2 = get_shared_index(shared_key, loader)
+    assert index1 is index2
+    assert loaded_versions == [0]
+
+
+def test_shared_index_versions(shared_key):
+    index = get_shared_index(
+        shared_key, lambda version: PatternIndex(TEST_PATTERNS, version))
+    new_index = index.with_word_patterns([("NEW", "0.1.2")])
+    assert publish_shared_index(shared_key, new_index)
+    assert not publish_shared_index(shared_key, index)
+    assert not publish_shared_index(shared_key, new_index)
+    assert get_shared_index(shared_key, pytest.fail) is new_index
+    invalidate_shared_index(shared_key)
+    reloaded = get_shared_index(
+        shared_key, lambda version: PatternIndex(TEST_PATTERNS, version))
+    assert reloaded.version > new_index.version
+    assert not publish_shared_index(shared_key, new_index)
+
+
+def test_shared_index_store_version(shared_key, monkeypatch):
+    store_versions = [0]
+    loaded_versions = []
+
+    def loader(version: int) -> PatternIndex:
+        loaded_versions.append(version)
+        return PatternIndex(TEST_PATTERNS, version)
+
+    def store_version() -> int:
+        return store_versions[0]
+
+    index = get_shared_index(shared_key, loader, store_version)
+    store_versions[0] = 1
+    # the word store is only checked every STORE_CHECK_SECONDS
+    monkeypatch.setattr(patternindex, 'STORE_CHECK_SECONDS', 1000)
+    assert get_shared_index(shared_key, loader, store_version) is index
+    monkeypatch.setattr(patternindex, 'STORE_CHECK_SECONDS', 0)
+    reloaded = get_shared_index(shared_key, loader, store_version)
+    assert reloaded is not index
+    assert len(loaded_versions) == 2
+    assert reloaded.version > index.version
+    # publishing the next store version's change needs no reload
+    new_index = reloaded.with_word_patterns([("NEW", "0.1.2")])
+    store_versions[0] = 2
+    assert publish_shared_index(shared_key, new_index, 2)
+    assert get_shared_index(shared_key, loader, store_version) is new_index
+    # but a change made by someone else in between does
+    newer_index = new_index.with_word_patterns([("CAT", "0.1.2")])
+    store_versions[0] = 4
+    assert publish_shared_index(shared_key, newer_index, 4)
+    assert get_shared_index(shared_key, loader, store_version) \
+        is not newer_index
+    assert len(loaded_versions) == 3
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Unit tests for search tracing in `decryptoquote` package."""
+import io
+import json
+import os
+
+import mongomock
+import pytest
+
+from decryptoquote import database, decryptoquote
+from decryptoquote.budget import SearchBudget
+from decryptoquote.cypherlettermap import CypherLetterMap
+from decryptoquote.decrypter import Decrypter
+from decryptoquote.tracing import (BACKTRACK_EVENT, END_EVENT, START_EVENT,
+                                   SOLUTION_EVENT, TRY_EVENT, SearchTracer,
+                                   main, read_trace, replay_trace,
+                                   summarize_trace)
+from decryptoquote.wordpatterns import WordPatterns
+from tests.unit.test_decrypter import TEST_PATTERNS, generate_collection
+
+
+def trace_search(coded_quote, sample_rate=1.0, budget=None):
+    trace = io.StringIO()
+    decrypter = Decrypter(coded_quote, CypherLetterMap(),
+                          WordPatterns(generate_collection(TEST_PATTERNS)),
+                          budget=budget,
+                          tracer=SearchTracer(trace, sample_rate, seed=1))
+    keys = list(decrypter.iter_solutions())
+    events = [json.loads(line) for line in trace.getvalue().splitlines()]
+    return decrypter, keys, events
+
+
+def test_trace_events():
+    decrypter, keys, events = trace_search("ABCD CD DEFG")
+    assert events[0] == {'e': START_EVENT, 'words': ["ABCD", "CD", "DEFG"],
+                         'ordering': Decrypter.TEXT_ORDER,
+                         'forward_checking': False, 'max_unresolved': 0,
+                         'sample_rate': 1.0}
+    assert events[-1] == {'e': END_EVENT,
+                          'stats': decrypter.stats.as_dict(),
+                          'budget_exhausted': False}
+    summary = summarize_trace(events)
+    assert [x['key'].encode('ascii') for x in summary['solutions']] == keys
+    assert summary['events'][TRY_EVENT] == decrypter.stats.candidate_checks
+    assert summary['events'][BACKTRACK_EVENT] == decrypter.stats.backtracks
+    assert summary['depths'][0]['tries'] == 3  # THIS, ALSO, SOME
+    assert summary['stats'] == decrypter.stats.as_dict()
+
+
+def test_trace_sampling():
+    decrypter, _, events = trace_search("ABCD CD DEFG", sample_rate=0)
+    assert [x['e'] for x in events] == [START_EVENT, SOLUTION_EVENT,
+                                        END_EVENT]
+    assert summarize_trace(events)['estimated_nodes'][TRY_EVENT] == 0
+    _, _, events = trace_search("ABCD CD DEFG", sample_rate=0.5)
+    tries = summarize_trace(events)['events'][TRY_EVENT]
+    assert 0 < tries < decrypter.stats.candidate_checks
+    with pytest.raises(ValueError):
+        SearchTracer(io.StringIO(), sample_rate=2)
+
+
+def test_trace_budget_exhausted():
+    _, keys, events = trace_search("ABCD CD DEFG",
+                                   budget=SearchBudget(max_nodes=0))
+    assert keys == []
+    summary = summarize_trace(events)
+    assert summary['budget_exhausted']
+    assert summary['solutions'] == []
+
+
+def test_replay_trace():
+    _, _, events = trace_search("ABCD CD")
+    output = io.StringIO()
+    replay_trace(events, output)
+    lines = output.getvalue().splitlines()
+    assert lines[0] == "start ABCD CD"
+    assert "ABCD = THIS ok" in lines
+    assert "  CD = IS ok" in lines
+    assert lines[-1].startswith("end ")
+
+
+@mongomock.patch(servers=((decryptoquote.MONGO_HOST),))
+def test_decrypt_quote_traced(tmp_path, monkeypatch, capsys):
+    database.close_client()  # make sure the mock client is used
+    monkeypatch.setattr(decryptoquote, 'TRACE_DIR', str(tmp_path))
+    solutions = decryptoquote.decrypt_quote_fully(
+        "OIVD DIM SMQSAM OVKD XH PMGF HXLSAM.", rebuild_patterns=True,
+        use_cache=False)
+    trace_files = os.listdir(tmp_path)
+    assert len(trace_files) == 1
+    trace_path = os.path.join(tmp_path, trace_files[0])
+    summary = summarize_trace(read_trace(trace_path))
+    assert len(summary['solutions']) == len(solutions)
+    main([trace_path])
+    assert json.loads(capsys.readouterr().out)['solutions'] == \
+        summary['solutions']
+    database.close_client()
@@ -7,9 +7,23 @@ from typing import List, Dict
 import pytest
 import mongomock
 
+from decryptoquote import database
 from decryptoquote.cypherlettermap import CypherLetterMap
+from decryptoquote.decrypter import Decrypter
 from decryptoquote.helpers import string_to_caps_words
-from decryptoquote.decryptoquote import (decrypt_quote_fully,
+from decryptoquote.budget import BUDGET_EXHAUSTED, SOLVED, UNRESOLVED, \
+    SearchBudget
+from decryptoquote.decryptoquote import (ANNEALING_MODE,
+                                         DICTIONARY_MODE,
+                                         SolveReport,
+                                         add_solve_listener,
+                                         remove_solve_listener,
+                                         decrypt_quote,
+                                         decrypt_quote_fully,
+                                         decrypt_quote_iter,
+                                         decrypt_many,
+                                         iter_decrypt_many,
+                                         solution_cache,
                                          MONGO_HOST)
 
 
@@ -56,6 +70,7 @@ def puzzle_works_check(coded_quote, decoded_quote):
 
 @mongomock.patch(servers=((MONGO_HOST),))
 def puzzle_test_case(coded_quote, coded_author, decoded_quote, decoded_author):
+    database.close_client()  # make sure the mock client is used
     puzzle_works_check(coded_quote, decoded_quote)
     author_results: List[Dict[str, str]] = decrypt_quote_fully(
         coded_quote,
@@ -74,3 +89,241 @@ def puzzle_test_case(coded_quote, coded_author, decoded_quote, decoded_author):
                 expected_letter, actual_letter = letter_pair
                 assert (
                     expected_letter == actual_letter or actual_letter == "_")
+    database.close_client()
+
+
+@mongomock.patch(servers=((MONGO_HOST),))
+def test_decrypt_quote_iter():
+    database.close_client()  # make sure the mock client is used
+    coded_quote: str = "OIVD DIM SMQSAM OVKD XH PMGF HXLSAM."
+    solutions = decrypt_quote_iter(coded_quote, show_cypher=True,
+                                   rebuild_patterns=True)
+    first_solution = next(solutions)
+    solutions.close()
+    assert len(first_solution['coding_key']) == 26
+    assert decrypt_quote_fully(coded_quote, max_solutions=1) == [
+        dict(first_solution, coding_key=None)]
+    parallel_solutions = decrypt_quote_fully(coded_quote, workers=2)
+    assert sorted(x['decoded_quote'] for x in parallel_solutions) == \
+        sorted(x['decoded_quote'] for x in decrypt_quote_fully(coded_quote))
+    database.close_client()
+
+
+@mongomock.patch(servers=((MONGO_HOST),))
+def test_decrypt_quote_budget_exhausted():
+    database.close_client()  # make sure the mock client is used
+    coded_quote: str = "OIVD DIM SMQSAM OVKD XH PMGF HXLSAM."
+    assert decrypt_quote(coded_quote, "TVGTVGV YQGCVK",
+                         rebuild_patterns=True,
+                         budget=SearchBudget(max_nodes=0)) == [{
+        'decoded_quote': "____ ___ ______ ____ __ ____ ______.",
+        'decoded_author': "_______ ______",
+        'coding_key': "_" * 26,
+        'status': BUDGET_EXHAUSTED}]
+    solutions = decrypt_quote_fully(coded_quote,
+                                    budget=SearchBudget(max_nodes=0))
+    assert [solution['status'] for solution in solutions] == [
+        BUDGET_EXHAUSTED]
+    database.close_client()
+
+
+@mongomock.patch(servers=((MONGO_HOST),))
+def test_solution_cache():
+    database.close_client()  # make sure the mock client is used
+    coded_quote: str = "OIVD DIM SMQSAM OVKD XH PMGF HXLSAM."
+    relabelled_quote: str = coded_quote.translate(
+        str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+                      "QWERTYUIOPASDFGHJKLZXCVBNM"))
+    solutions = decrypt_quote_fully(coded_quote, show_cypher=True,
+                                    rebuild_patterns=True)
+    hits = solution_cache.hits
+    cached_solutions = decrypt_quote_fully(relabelled_quote,
+                                           show_cypher=True)
+    assert solution_cache.hits == hits + 1
+    assert [x['decoded_quote'] for x in cached_solutions] == \
+        [x['decoded_quote'] for x in solutions]
+    for solution in cached_solutions:
+        cypher_letter_map = CypherLetterMap.from_key(
+            solution['coding_key'].encode('ascii'))
+        assert cypher_letter_map.decode(relabelled_quote) == \
+            solution['decoded_quote']
+    assert decrypt_quote_fully(relabelled_quote, use_cache=False) == \
+        decrypt_quote_fully(relabelled_quote)
+    assert solution_cache.hits == hits + 2
+    database.close_client()
+
+
+@mongomock.patch(servers=((MONGO_HOST),))
+def test_solution_cache_settings():
+    database.close_client()  # make sure the mock client is used
+    coded_quote: str = "OIVD DIM SMQSAM OVKD XH PMGF HXLSAM."
+    decrypt_quote(coded_quote, rebuild_patterns=True,
+                  ordering=Decrypter.TEXT_ORDER)
+    hits = solution_cache.hits
+    # a different ordering may find a different first solution
+    assert decrypt_quote(coded_quote,
+                         ordering=Decrypter.CONSTRAINED_ORDER) == \
+        decrypt_quote(coded_quote, ordering=Decrypter.CONSTRAINED_ORDER,
+                      use_cache=False)
+    assert solution_cache.hits == hits
+    decrypt_quote(coded_quote, ordering=Decrypter.CONSTRAINED_ORDER)
+    assert solution_cache.hits == hits + 1
+    # unseeded annealing results are not cached, but seeded ones are
+    decrypt_quote(coded_quote, mode=ANNEALING_MODE, restarts=1)
+    decrypt_quote(coded_quote, mode=ANNEALING_MODE, restarts=1)
+    assert solution_cache.hits == hits + 1
+    seeded_solutions = decrypt_quote(coded_quote, mode=ANNEALING_MODE,
+                                     restarts=1, seed=5)
+    assert decrypt_quote(coded_quote, mode=ANNEALING_MODE, restarts=1,
+                         seed=5) == seeded_solutions
+    assert solution_cache.hits == hits + 2
+    decrypt_quote(coded_quote, mode=ANNEALING_MODE, restarts=1, seed=6)
+    assert solution_cache.hits == hits + 2
+    database.close_client()
+
+
+@mongomock.patch(servers=((MONGO_HOST),))
+def test_solve_listener():
+    database.close_client()  # make sure the mock client is used
+    coded_quote: str = "OIVD DIM SMQSAM OVKD XH PMGF HXLSAM."
+    reports: List[SolveReport] = []
+
+    def failing_listener(report):
+        raise RuntimeError("listener failed")
+
+    add_solve_listener(failing_listener)
+    add_solve_listener(reports.append)
+    try:
+        solutions = decrypt_quote_fully(coded_quote, rebuild_patterns=True,
+                                        use_cache=False)
+        decrypt_quote_fully(coded_quote)
+        decrypt_quote_fully(coded_quote)
+        decrypt_quote(coded_quote, budget=SearchBudget(max_nodes=0))
+    finally:
+        remove_solve_listener(failing_listener)
+        remove_solve_listener(reports.append)
+    assert [(x.mode, x.status, x.solution_count, x.cached)
+            for x in reports] == [
+        (DICTIONARY_MODE, SOLVED, len(solutions), False),
+        (DICTIONARY_MODE, SOLVED, len(solutions), False),
+        (DICTIONARY_MODE, SOLVED, len(solutions), True),
+        (DICTIONARY_MODE, BUDGET_EXHAUSTED, 1, False)]
+    assert reports[0].stats.nodes_visited > 0
+    assert reports[2].stats is None
+    decrypt_quote(coded_quote)
+    assert len(reports) == 4
+    with pytest.raises(ValueError):
+        remove_solve_listener(reports.append)
+    database.close_client()
+
+
+@mongomock.patch(servers=((MONGO_HOST),))
+def test_decrypt_quote_unresolved():
+    database.close_client()  # make sure the mock client is used
+    # "TVGTVGV" (BARBARA) is not in the dictionary
+    coded_quote: str = "OIVD DIM SMQSAM OVKD XH TVGTVGV."
+    assert decrypt_quote(coded_quote, rebuild_patterns=True) == []
+    solutions = decrypt_quote(coded_quote, max_unresolved=1)
+    assert [(x['decoded_quote'], x['status']) for x in solutions] == [
+        ("WHAT THE PEOPLE WANT IS _A__A_A.", UNRESOLVED)]
+    assert solutions[0]['coding_key'] is not None
+    all_solutions = decrypt_quote_fully(coded_quote, max_unresolved=1)
+    assert all_solutions[0] == dict(solutions[0], decoded_author="")
+    assert all(x['status'] == UNRESOLVED for x in all_solutions)
+    with pytest.raises(ValueError):
+        decrypt_quote(coded_quote, max_unresolved=1, workers=2)
+    database.close_client()
+
+
+@mongomock.patch(servers=((MONGO_HOST),))
+def test_decrypt_many():
+    database.close_client()  # make sure the mock client is used
+    coded_quote: str = "OIVD DIM SMQSAM OVKD XH PMGF HXLSAM."
+    decoded_quote: str = "WHAT THE PEOPLE WANT IS VERY SIMPLE."
+    # the same puzzle, with its coded letters relabelled
+    shifted = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+                            "BCDEFGHIJKLMNOPQRSTUVWXYZA")
+    puzzles = [
+        {'coded_quote': coded_quote, 'coded_author': "TVGTVGV YQGCVK"},
+        {'coded_author': "TVGTVGV"},
+        coded_quote.translate(shifted),
+        {'coded_quote': "OIVD DIM SMQSAM OVKD XH TVGTVGV.",
+         'add_words': ["barbara"]},
+        "OIVD DIM SMQSAM OVKD XH TVGTVGV.",
+        {'coded_quote': coded_quote, 'add_words': 5},
+    ]
+    decrypt_quote(coded_quote, rebuild_patterns=True)
+    results = decrypt_many(puzzles, workers=1)
+    assert [len(x['solutions']) for x in results] == [1, 0, 1, 1, 0, 0]
+    assert results[0]['solutions'][0] == {
+        'decoded_quote': decoded_quote, 'decoded_author': "_AR_ARA _OR_AN",
+        'coding_key': None, 'status': SOLVED}
+    assert results[1]['error'] == "Puzzle has no coded_quote"
+    assert results[2]['solutions'][0]['decoded_quote'] == decoded_quote
+    assert results[3]['solutions'][0]['decoded_quote'] == \
+        "WHAT THE PEOPLE WANT IS BARBARA."
+    # the puzzle's words were not added to the dictionary
+    assert decrypt_quote(puzzles[4]) == []
+    assert results[5]['error'] == \
+        "Puzzle's add_words must be a list of strings"
+    assert all(x['error'] is None for x in results[2:5])
+    assert decrypt_many(puzzles, workers=2) == results
+    assert list(iter_decrypt_many(puzzles, workers=2, max_pending=2)) == \
+        results
+    partial_results = decrypt_many([coded_quote], workers=1, max_nodes=0)
+    assert [x['status'] for x in partial_results[0]['solutions']] == \
+        [BUDGET_EXHAUSTED]
+    with pytest.raises(ValueError):
+        decrypt_many(puzzles, mode="guess")
+    database.close_client()
+
+
+def test_decrypt_quote_annealing():
+    # annealing mode needs no database, and copes with words that are not in
+    # the dictionary
+    coded_quote: str = "JRR FSAAGFFZSR HGBHRG VGL JLM CBVGL JQG UDI " \
+                       "MQGJVGQF. EKGN DVJIDLG CKJE EKGDQ ZSESQG ABSRM UG, " \
+                       "DMGJR DL GYGQN QGFHGAE, JLM EKGL EKGN CBQW GYGQN " \
+                       "MJN EBCJQM EKGDQ MDFEJLE YDFDBL, EKJE IBJR BQ " \
+                       "HSQHBFG."
+    decoded_quote: str = "ALL SUCCESSFUL PEOPLE MEN AND WOMEN ARE BIG " \
+                         "DREAMERS. THEY IMAGINE WHAT THEIR FUTURE COULD " \
+                         "BE, IDEAL IN EVERY RESPECT, AND THEN THEY WORK " \
+                         "EVERY DAY TOWARD THEIR DISTANT VISION, THAT GOAL " \
+                         "OR PURPOSE."
+    solutions = decrypt_quote(coded_quote, "JRR", mode=ANNEALING_MODE,
+                              use_cache=False)
+    assert len(solutions) == 1
+    assert solutions[0]['status'] == SOLVED
+    correct_letters = sum(
+        decoded == letter for decoded, letter
+        in zip(solutions[0]['decoded_quote'], decoded_quote))
+    assert correct_letters >= 0.9 * len(decoded_quote)
+    partial_solutions = decrypt_quote(coded_quote, mode=ANNEALING_MODE,
+                                      budget=SearchBudget(max_nodes=0))
+    assert [x['status'] for x in partial_solutions] == [BUDGET_EXHAUSTED]
+    assert partial_solutions[0]['coding_key'] is not None
+    with pytest.raises(ValueError):
+        decrypt_quote(coded_quote, mode="guess")
+    # the same seed gives the same solution
+    reports: List[SolveReport] = []
+    add_solve_listener(reports.append)
+    try:
+        seeded_solutions = [
+            decrypt_quote(coded_quote[:60], mode=ANNEALING_MODE, seed=3,
+                          restarts=2, use_cache=False)
+            for _ in range(2)]
+    finally:
+        remove_solve_listener(reports.append)
+    assert seeded_solutions[0] == seeded_solutions[1]
+    assert [x.stats.backtracks for x in reports] == [2, 2]
+
+
+def test_client_reused():
+    database.close_client()
+    client = database.get_client()
+    assert database.get_client() is client
+    assert database.get_collection().name == database.COLLECTION_NAME
+    database.close_client()
+    assert database.get_client() is not client
+    database.close_client()